@@ -3,15 +3,24 @@ from fiji.plugin.trackmate import Model
 from fiji.plugin.trackmate import Settings
 from fiji.plugin.trackmate import TrackMate
 from fiji.plugin.trackmate import Logger
+from fiji.plugin.trackmate import SpotCollection
 from fiji.plugin.trackmate.detection import LogDetectorFactory
 from fiji.plugin.trackmate.tracking.sparselap import SparseLAPTrackerFactory
 from fiji.plugin.trackmate.tracking import LAPUtils
 import fiji.plugin.trackmate.features.FeatureFilter as FeatureFilter
 import fiji.plugin.trackmate.io.TmXmlWriter as TmXmlWriter
+from fiji.plugin.trackmate.io import TmXmlReader
 from ij import IJ
-from os import listdir
+from ij.plugin import Duplicator
+from java.lang import Integer
+from java.lang import Runtime
+from java.lang import Exception as JavaException
+from java.util.concurrent import Executors, Callable
+from os import listdir, makedirs
 from java.io import File
-from os.path import isfile, join, splitext
+from os.path import isfile, join, splitext, split, getsize, getmtime
+import hashlib
+import json
 import sys
 
 gui = GenericDialogPlus("Batch Track Spotter")
@@ -25,12 +34,18 @@ gui.addNumericField("Channel", 1)
 gui.addNumericField("Max Frame Gap", 2)
 gui.addNumericField("Max Distance", 1)
 gui.addNumericField("Max Gap Distance", 0.4)
+gui.addNumericField("Images in parallel", 1)
+gui.addNumericField("Threads per image (0 = share all cores)", 0)
+gui.addNumericField("Frames per detection chunk (0 = whole movie)", 0)
+gui.addStringField("Sweep Max Distance (comma separated, optional)", "", 16)
+gui.addStringField("Sweep Max Frame Gap (comma separated, optional)", "", 16)
+gui.addCheckbox("Persist detected spots for sweeps", False)
+gui.addCheckbox("Skip images that are already up to date", False)
+gui.addCheckbox("Open as virtual stack", False)
+gui.addCheckbox("Write compact spot/edge CSV next to each XML", False)
 
-model = Model()
- 
 # Send all messages to ImageJ log window.
 logger = Logger.IJ_LOGGER
-model.setLogger(logger)
 
 gui.showDialog()
 
@@ -61,6 +76,7 @@ def createTrackMateSettingsForImage(img, data):
 	settings.trackerSettings = LAPUtils.getDefaultLAPSettingsMap() # almost good enough
 	settings.trackerSettings['ALLOW_TRACK_SPLITTING'] = True
 	settings.trackerSettings['ALLOW_TRACK_MERGING'] = True
+	applyTrackerSettings(settings, data.get("max_distance"), data.get("max_frame_gap"), data)
 	
 	qualityFilter = FeatureFilter('QUALITY', 30, True)
 	settings.addSpotFilter(qualityFilter)
@@ -71,8 +87,79 @@ def createTrackMateSettingsForImage(img, data):
 	
 	return settings
 
-def saveToXML(data, model, settings):
-	output_path = data.get("output_file").replace("\\", "/")
+def applyTrackerSettings(settings, max_distance, max_frame_gap, data):
+	settings.trackerSettings['LINKING_MAX_DISTANCE'] = float(max_distance)
+	settings.trackerSettings['GAP_CLOSING_MAX_DISTANCE'] = float(data.get("max_gap_distance"))
+	settings.trackerSettings['MAX_FRAME_GAP'] = int(max_frame_gap)
+
+def parseSweepValues(text, default):
+	"""
+	Turns a comma separated list of numbers into a list. An empty field yields [default].
+	"""
+	values = [float(value) for value in text.replace(";", ",").split(",") if value.strip()]
+	if not values:
+		return [default]
+	return values
+
+def trackerGrid(data):
+	"""
+	Returns all (max_distance, max_frame_gap) combinations to track with.
+	"""
+	return [(distance, int(gap)) for distance in data.get("sweep_max_distance")
+		for gap in data.get("sweep_max_frame_gap")]
+
+def sweepOutputFile(filename, max_distance, max_frame_gap):
+	return filename + "__maxdist-" + str(max_distance) + "_gap-" + str(max_frame_gap) + ".xml"
+
+def outputFilesFor(tiff, data):
+	"""
+	Returns the XML files a run with the current settings writes for a TIFF.
+	"""
+	filename, extension = splitext(tiff)
+	grid = trackerGrid(data)
+	if len(grid) == 1:
+		return [filename + ".xml"]
+	return [sweepOutputFile(filename, max_distance, max_frame_gap) for max_distance, max_frame_gap in grid]
+
+def spotsFileFor(tiff):
+	"""
+	Persisted detections live in a subfolder so they are not mistaken for tracking results.
+	"""
+	directory, name = split(tiff)
+	return join(directory, "detected_spots", splitext(name)[0] + ".xml")
+
+def spotsInfoFileFor(tiff):
+	"""
+	Detector settings and TIFF fingerprint the persisted spots were produced with.
+	"""
+	return splitext(spotsFileFor(tiff))[0] + ".json"
+
+def persistedSpotsMatch(tiff, data):
+	"""
+	Persisted spots may only be reused if they were detected in the same TIFF
+	with the same detector settings.
+	"""
+	info_file = spotsInfoFileFor(tiff)
+	if not isfile(spotsFileFor(tiff)) or not isfile(info_file):
+		return False
+	handle = open(info_file, "r")
+	try:
+		info = json.load(handle)
+	except ValueError:
+		return False
+	finally:
+		handle.close()
+	return info.get("detector") == detectorKey(data) and info.get("hash") == fingerprint(tiff)
+
+def savePersistedSpotsInfo(tiff, data):
+	handle = open(spotsInfoFileFor(tiff), "w")
+	try:
+		json.dump({"detector": detectorKey(data), "hash": fingerprint(tiff)}, handle, indent=1)
+	finally:
+		handle.close()
+
+def saveToXML(output_file, model, settings):
+	output_path = output_file.replace("\\", "/")
 	logger.log("Start saving to " + output_path)
 	outFile = File(output_path)
 	writer = TmXmlWriter(outFile, logger)
@@ -80,6 +167,323 @@ def saveToXML(data, model, settings):
 	writer.appendSettings(settings)
 	writer.writeToFile()
 
+def formatFeature(spot, *features):
+	"""The first of `features` the spot has, as text ("" if it has none)."""
+	for feature in features:
+		value = spot.getFeature(feature)
+		if value is not None:
+			return repr(float(value))
+	return ""
+
+def saveSidecar(output_file, model, settings, data):
+	"""
+	Writes all tracked spots (<name>.spots.csv) and the edge list (<name>.edges.csv)
+	straight from the in-memory model. The analyzer loads these instead of parsing the XML.
+	"""
+	stem = splitext(output_file)[0]
+	track_model = model.getTrackModel()
+	logger.log("Start saving sidecar tables to " + stem + ".spots.csv")
+	spots_handle = open(stem + ".spots.csv", "w")
+	edges_handle = open(stem + ".edges.csv", "w")
+	try:
+		spots_handle.write("# time_interval=" + repr(float(settings.dt)) + "\n")
+		spots_handle.write("ID,track_id,track_visible,frame,t,x,y,z,intensity\n")
+		edges_handle.write("track_id,source,target\n")
+		for track_id in track_model.trackIDs(False):
+			visible = "1" if track_model.isVisible(track_id) else "0"
+			for spot in track_model.trackSpots(track_id):
+				spots_handle.write(",".join([str(spot.ID()), str(track_id), visible,
+					str(int(spot.getFeature("FRAME"))),
+					formatFeature(spot, "POSITION_T"),
+					formatFeature(spot, "POSITION_X"),
+					formatFeature(spot, "POSITION_Y"),
+					formatFeature(spot, "POSITION_Z"),
+					# same intensity feature as the analyzer reads from the XML
+					formatFeature(spot, "MEAN_INTENSITY_CH1", "MEAN_INTENSITY")]) + "\n")
+			for edge in track_model.trackEdges(track_id):
+				edges_handle.write(",".join([str(track_id),
+					str(track_model.getEdgeSource(edge).ID()),
+					str(track_model.getEdgeTarget(edge).ID())]) + "\n")
+	finally:
+		spots_handle.close()
+		edges_handle.close()
+
+def saveResults(output_file, model, settings, data):
+	saveToXML(output_file, model, settings)
+	if data.get("sidecar"):
+		saveSidecar(output_file, model, settings, data)
+
+def resolveThreadSplit(data):
+	"""
+	Splits the available cores between images in flight and TrackMate threads per image.
+	A thread count of 0 hands every image an equal share of all cores.
+	"""
+	cores = Runtime.getRuntime().availableProcessors()
+	images = max(1, int(data.get("images_in_parallel")))
+	threads = int(data.get("threads_per_image"))
+	if threads <= 0:
+		threads = max(1, cores // images)
+	return images, threads
+
+def processTIFF(tiff, data):
+	"""
+	Runs detection and tracking on a single TIFF and saves the result next to it.
+	Every image gets its own Model so that results never pile up across files.
+	Returns None on success or an error message.
+	"""
+	filename, extension = splitext(tiff)
+	tm_img = openImage(tiff, data)
+	if tm_img is None:
+		return "Could not open " + tiff
+	model = Model()
+	model.setLogger(logger)
+	settings = createTrackMateSettingsForImage(tm_img, data)
+	trackmate = TrackMate(model, settings)
+	trackmate.setNumThreads(data.get("threads_per_image"))
+	if not trackmate.checkInput():
+		return str(trackmate.getErrorMessage())
+	if not trackmate.process():
+		return str(trackmate.getErrorMessage())
+	saveResults(filename + ".xml", model, settings, data)
+	tm_img.flush()
+	return None
+
+def openImage(tiff, data):
+	"""
+	Virtual stacks only read planes from disk when they are accessed.
+	"""
+	if data.get("virtual"):
+		return IJ.openVirtual(tiff)
+	return IJ.openImage(tiff)
+
+def runDetection(img, data):
+	"""
+	Runs detection, spot feature computation and spot filtering on an image.
+	Returns the resulting model and settings.
+	"""
+	model = Model()
+	model.setLogger(logger)
+	settings = createTrackMateSettingsForImage(img, data)
+	trackmate = TrackMate(model, settings)
+	trackmate.setNumThreads(data.get("threads_per_image"))
+	if not trackmate.checkInput():
+		raise RuntimeError(str(trackmate.getErrorMessage()))
+	if not (trackmate.execDetection() and trackmate.execInitialSpotFiltering()
+			and trackmate.computeSpotFeatures(True) and trackmate.execSpotFiltering(True)):
+		raise RuntimeError(str(trackmate.getErrorMessage()))
+	return model, settings
+
+def detectSpotsInChunks(tm_img, data):
+	"""
+	Detects spots over blocks of frames and merges them into one SpotCollection.
+	Only one chunk is duplicated into memory at a time, so with a virtual stack
+	peak memory is bounded by the chunk size rather than the whole acquisition.
+	"""
+	nframes = tm_img.getNFrames()
+	chunk_frames = data.get("chunk_frames")
+	frame_interval = tm_img.getCalibration().frameInterval
+	if frame_interval == 0:
+		frame_interval = 1.0
+	merged = SpotCollection()
+	for first_frame in range(0, nframes, chunk_frames):
+		last_frame = min(nframes, first_frame + chunk_frames)
+		logger.log("Detecting frames " + str(first_frame) + " to " + str(last_frame - 1))
+		chunk_img = Duplicator().run(tm_img, 1, tm_img.getNChannels(), 1, tm_img.getNSlices(),
+			first_frame + 1, last_frame)
+		model, settings = runDetection(chunk_img, data)
+		for spot in model.getSpots().iterable(True):
+			frame = int(spot.getFeature("FRAME")) + first_frame
+			spot.putFeature("FRAME", float(frame))
+			spot.putFeature("POSITION_T", spot.getFeature("POSITION_T") + first_frame * frame_interval)
+			merged.add(spot, Integer(frame))
+		chunk_img.close()
+	merged.setVisible(True)
+	return merged
+
+def isChunked(tm_img, data):
+	return 0 < data.get("chunk_frames") < tm_img.getNFrames()
+
+def detectSpots(tm_img, tiff, data):
+	"""
+	Runs detection and spot filtering once and returns the filtered SpotCollection.
+	With persisting enabled, spots detected in a previous sweep are loaded instead,
+	as long as the TIFF and the detector settings did not change since.
+	"""
+	spots_file = spotsFileFor(tiff)
+	if data.get("persist_spots") and isfile(spots_file):
+		if persistedSpotsMatch(tiff, data):
+			reader = TmXmlReader(File(spots_file))
+			if reader.isReadingOk():
+				logger.log("Reusing detected spots from " + spots_file)
+				return reader.getModel().getSpots()
+		else:
+			logger.log("Detected spots in " + spots_file + " are stale, detecting again")
+	if isChunked(tm_img, data):
+		model = Model()
+		model.setLogger(logger)
+		model.setSpots(detectSpotsInChunks(tm_img, data), False)
+		settings = createTrackMateSettingsForImage(tm_img, data)
+	else:
+		model, settings = runDetection(tm_img, data)
+	if data.get("persist_spots"):
+		try:
+			makedirs(split(spots_file)[0])
+		except OSError:
+			# Already created, possibly by another worker
+			pass
+		saveToXML(spots_file, model, settings)
+		savePersistedSpotsInfo(tiff, data)
+	return model.getSpots()
+
+def sweepTIFF(tiff, data):
+	"""
+	Detects spots once and tracks them with every combination of the tracker grid,
+	writing one XML per combination. Also used for chunked detection.
+	"""
+	tm_img = openImage(tiff, data)
+	if tm_img is None:
+		return "Could not open " + tiff
+	try:
+		spots = detectSpots(tm_img, tiff, data)
+	except RuntimeError as e:
+		return str(e)
+	for (max_distance, max_frame_gap), output_file in zip(trackerGrid(data), outputFilesFor(tiff, data)):
+		model = Model()
+		model.setLogger(logger)
+		model.setSpots(spots, False)
+		settings = createTrackMateSettingsForImage(tm_img, data)
+		applyTrackerSettings(settings, max_distance, max_frame_gap, data)
+		trackmate = TrackMate(model, settings)
+		trackmate.setNumThreads(data.get("threads_per_image"))
+		if not (trackmate.execTracking() and trackmate.computeEdgeFeatures(True)
+				and trackmate.computeTrackFeatures(True) and trackmate.execTrackFiltering(True)):
+			return str(trackmate.getErrorMessage())
+		saveResults(output_file, model, settings, data)
+	tm_img.flush()
+	return None
+
+MANIFEST_NAME = ".batch_spotter_manifest.json"
+HASH_BLOCK = 1024 * 1024
+
+def fingerprint(tiff):
+	"""
+	Cheap content hash over size plus the first and last megabyte of the file.
+	Only computed when size or modification time changed.
+	"""
+	size = getsize(tiff)
+	digest = hashlib.md5(str(size))
+	handle = open(tiff, "rb")
+	try:
+		digest.update(handle.read(HASH_BLOCK))
+		if size > 2 * HASH_BLOCK:
+			handle.seek(size - HASH_BLOCK)
+			digest.update(handle.read(HASH_BLOCK))
+	finally:
+		handle.close()
+	return digest.hexdigest()
+
+DETECTOR_KEYS = ["radius", "threshold", "channel", "subpixel", "median"]
+
+def detectorKey(data):
+	"""
+	Detector settings that determine which spots are found.
+	"""
+	return json.dumps([[key, data.get(key)] for key in DETECTOR_KEYS])
+
+def parameterKey(data):
+	"""
+	Detector and tracker settings that determine the content of the output XMLs.
+	"""
+	keys = DETECTOR_KEYS + ["max_gap_distance",
+		"sweep_max_distance", "sweep_max_frame_gap", "sweep", "sidecar"]
+	return json.dumps([[key, data.get(key)] for key in keys])
+
+def loadManifest(directory):
+	manifest_file = join(directory, MANIFEST_NAME)
+	if not isfile(manifest_file):
+		return {}
+	handle = open(manifest_file, "r")
+	try:
+		return json.load(handle)
+	except ValueError:
+		logger.log("Ignoring unreadable manifest " + manifest_file)
+		return {}
+	finally:
+		handle.close()
+
+def saveManifest(directory, manifest):
+	handle = open(join(directory, MANIFEST_NAME), "w")
+	try:
+		json.dump(manifest, handle, indent=1, sort_keys=True)
+	finally:
+		handle.close()
+
+def isUpToDate(tiff, data, manifest):
+	"""
+	A TIFF is up to date if it was processed with the same parameters, all of its
+	XMLs still exist and its size/mtime (or, if those changed, its hash) still match.
+	"""
+	entry = manifest.get(split(tiff)[1])
+	if entry is None or entry.get("parameters") != parameterKey(data):
+		return False
+	if not all([isfile(output_file) for output_file in outputFilesFor(tiff, data)]):
+		return False
+	if entry.get("size") == getsize(tiff) and entry.get("mtime") == getmtime(tiff):
+		return True
+	if entry.get("hash") == fingerprint(tiff):
+		entry["size"] = getsize(tiff)
+		entry["mtime"] = getmtime(tiff)
+		return True
+	return False
+
+def recordProcessed(tiff, data, manifest):
+	manifest[split(tiff)[1]] = {
+		"size": getsize(tiff),
+		"mtime": getmtime(tiff),
+		"hash": fingerprint(tiff),
+		"parameters": parameterKey(data),
+		"outputs": [split(output_file)[1] for output_file in outputFilesFor(tiff, data)],
+	}
+
+class TIFFTask(Callable):
+	"""
+	Wraps processTIFF so that it can be submitted to a java worker pool.
+	"""
+
+	def __init__(self, tiff, data):
+		self.tiff = tiff
+		self.data = data
+
+	def call(self):
+		try:
+			if self.data.get("sweep") or self.data.get("chunk_frames") > 0:
+				return sweepTIFF(self.tiff, self.data)
+			return processTIFF(self.tiff, self.data)
+		except (Exception, JavaException) as e:
+			return str(e)
+
+def processAll(tiff_files, data, manifest):
+	"""
+	Processes all TIFFs with a fixed size pool of images in flight and
+	returns a list of (file, error message) tuples for failed images.
+	Successfully processed images are recorded in the manifest right away,
+	so an interrupted run keeps its progress.
+	"""
+	pool = Executors.newFixedThreadPool(data.get("images_in_parallel"))
+	try:
+		futures = [(tiff, pool.submit(TIFFTask(tiff, data))) for tiff in tiff_files]
+		failed = []
+		for tiff, future in futures:
+			error = future.get()
+			if error is not None:
+				failed.append((tiff, error))
+				continue
+			recordProcessed(tiff, data, manifest)
+			saveManifest(data.get("directory"), manifest)
+		return failed
+	finally:
+		pool.shutdown()
+
 if gui.wasOKed():
 	directory = gui.getNextString()
 	data = {}
@@ -90,20 +494,34 @@ if gui.wasOKed():
 	data["max_frame_gap"] = gui.getNextNumber()
 	data["max_distance"] = gui.getNextNumber()
 	data["max_gap_distance"] = gui.getNextNumber()
+	data["images_in_parallel"] = gui.getNextNumber()
+	data["threads_per_image"] = gui.getNextNumber()
+	data["chunk_frames"] = max(0, int(gui.getNextNumber()))
+	data["sweep_max_distance"] = parseSweepValues(gui.getNextString(), data["max_distance"])
+	data["sweep_max_frame_gap"] = parseSweepValues(gui.getNextString(), data["max_frame_gap"])
 	checkboxes = gui.getCheckboxes()
 	data["subpixel"] = checkboxes[0].state
 	data["median"] = checkboxes[1].state
+	data["persist_spots"] = checkboxes[2].state
+	data["incremental"] = checkboxes[3].state
+	data["virtual"] = checkboxes[4].state
+	data["sidecar"] = checkboxes[5].state
+	data["sweep"] = len(trackerGrid(data)) > 1 or data["persist_spots"]
+	images, threads = resolveThreadSplit(data)
+	data["images_in_parallel"] = images
+	data["threads_per_image"] = threads
+	logger.log("Processing " + str(images) + " image(s) at once with " + str(threads) + " thread(s) each")
 	# Creates a list of all xml files in the choosen directory
 	tiff_files = [join(directory,f) for f in listdir(directory) if isTIFFFile(join(directory, f))]
-	for tiff in tiff_files:
-		filename, extension = splitext(tiff)
-		data["output_file"] = filename + ".xml"
-		tm_img =  IJ.openImage(tiff)
-		settings = createTrackMateSettingsForImage(tm_img, data)
-		trackmate = TrackMate(model, settings)
-		if not trackmate.checkInput():
-			sys.exit(str(trackmate.getErrorMessage()))
-		if not trackmate.process():
-		    sys.exit(str(trackmate.getErrorMessage()))
-		saveToXML(data, model, settings)
-	
\ No newline at end of file
+	manifest = loadManifest(directory)
+	if data["incremental"]:
+		pending = [tiff for tiff in tiff_files if not isUpToDate(tiff, data, manifest)]
+		logger.log("Skipping " + str(len(tiff_files) - len(pending)) + " up to date image(s)")
+		# keep refreshed size/mtime of touched but unchanged images, so they are not hashed again
+		saveManifest(directory, manifest)
+		tiff_files = pending
+	failed = processAll(tiff_files, data, manifest)
+	for tiff, error in failed:
+		logger.log("Failed to process " + tiff + ": " + error)
+	if failed:
+		sys.exit(str(len(failed)) + " of " + str(len(tiff_files)) + " images failed")
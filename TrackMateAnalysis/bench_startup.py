@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for TrackMate SPT Analyzer.
+
+Times imports in fresh interpreters (what every spawned worker process
+pays) and lists which heavy dependencies each import pulls in.
+
+    python bench_startup.py [--repeat 7]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+TARGETS = [
+    ("baseline (python -c pass)", "pass"),
+    ("import trackmate_spt_analyzer", "import trackmate_spt_analyzer"),
+    ("import trackmate_spt_analyzer.core", "import trackmate_spt_analyzer.core"),
+    ("worker: core.pipeline", "import trackmate_spt_analyzer.core.pipeline"),
+    ("worker: core.scheduler", "import trackmate_spt_analyzer.core.scheduler"),
+    ("first use: parse_trackmate_xml",
+     "from trackmate_spt_analyzer import parse_trackmate_xml"),
+    ("GUI: TrackMateSPTAnalyzer", "from trackmate_spt_analyzer import TrackMateSPTAnalyzer"),
+]
+
+HEAVY = ["numpy", "pandas", "scipy", "tkinter", "numba", "matplotlib"]
+
+def run_once(stmt: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", stmt], check=True, cwd=Path(__file__).parent)
+    return time.perf_counter() - start
+
+def loaded_modules(stmt: str) -> list:
+    probe = f"{stmt}\nimport sys\nprint(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True,
+                         text=True, cwd=Path(__file__).parent).stdout
+    return out.split()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7, help="runs per target (median is shown)")
+    args = parser.parse_args()
+
+    print(f"{'target':<40} {'median ms':>10} {'min ms':>8}  heavy modules loaded")
+    for label, stmt in TARGETS:
+        try:
+            times = [run_once(stmt) * 1000 for _ in range(args.repeat)]
+            heavy = " ".join(loaded_modules(stmt)) or "-"
+        except subprocess.CalledProcessError:
+            print(f"{label:<40} {'failed':>10}")
+            continue
+        print(f"{label:<40} {statistics.median(times):>10.1f} {min(times):>8.1f}  {heavy}")
+
+if __name__ == "__main__":
+    main()
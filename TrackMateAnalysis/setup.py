@@ -47,6 +47,7 @@ setup(
     entry_points={
         "console_scripts": [
             "trackmate-spt-analyzer=trackmate_spt_analyzer.gui.app:main",
+            "trackmate-spt-watch=trackmate_spt_analyzer.core.watch:main",
         ],
     },
     include_package_data=True,
@@ -7,16 +7,36 @@ Tests the core analysis functions with the existing XML file.
 Updated to use the new modular structure.
 """
 
+import shutil
 import sys
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 # Import our analysis functions from the new modular structure
 from trackmate_spt_analyzer.core.analysis import (
     parse_trackmate_xml, 
     msd_per_track, 
-    rolling_window_analysis
+    track_statistics,
+    rolling_window_analysis,
+    _fit_msd,
+    sidecar_paths
 )
 from trackmate_spt_analyzer.core.utils import build_readme_text
+from trackmate_spt_analyzer.core.export import wide_track_table, write_wide_track_table
+from trackmate_spt_analyzer.core.bins import bin_sums, merge_bin_sums, finalize_bins
+from trackmate_spt_analyzer.core.pipeline import (add_file_columns, analyse_dataframe, file_summary,
+                                                  load_spots)
+from trackmate_spt_analyzer.core import kernels, xmlparse
+from trackmate_spt_analyzer.core.steps import (step_histograms, merge_step_histograms,
+                                               fit_jump_distances)
+from trackmate_spt_analyzer.core.spatial import SpotIndex, add_neighbour_columns, NEIGHBOUR_COLUMNS
+from trackmate_spt_analyzer.core.bootstrap import track_bootstrap, ensemble_confidence, _weighted_fit
+from trackmate_spt_analyzer.core.scheduler import run_files
 
 def test_analysis():
     """Test the analysis functions with the existing XML file."""
@@ -77,6 +97,535 @@ def test_analysis():
         traceback.print_exc()
         return False
 
+XML_FILE = Path(__file__).parent / "20241210_PK15_PrV1024_No3_18_40-01_CGT-1_BGD.xml"
+
+def _spotter_sidecar(xml_path: Path):
+    """Write the spot / edge sidecars the way BatchTrackmateSpotterForTIFF.saveSidecar does."""
+    root = ET.parse(xml_path).getroot()
+    spots = {sp.get("ID"): sp.attrib for sp in root.iter("Spot")}
+    visible = {ft.get("TRACK_ID") for ft in root.iter("TrackID")}
+    spots_path, edges_path = sidecar_paths(xml_path)
+    with open(spots_path, "w") as sfh, open(edges_path, "w") as efh:
+        sfh.write(f"# time_interval={float(root.find('.//ImageData').get('timeinterval'))!r}\n")
+        sfh.write("ID,track_id,track_visible,frame,t,x,y,z,intensity\n")
+        efh.write("track_id,source,target\n")
+        for track in root.iter("Track"):
+            tid = track.get("TRACK_ID")
+            edges = [(e.get("SPOT_SOURCE_ID"), e.get("SPOT_TARGET_ID")) for e in track.iter("Edge")]
+            for sid in sorted({s for edge in edges for s in edge}, key=int):
+                a = spots[sid]
+                sfh.write(",".join([sid, tid, "1" if tid in visible else "0", a["FRAME"],
+                                    a["POSITION_T"], a["POSITION_X"], a["POSITION_Y"],
+                                    a["POSITION_Z"], a["MEAN_INTENSITY_CH1"]]) + "\n")
+            for source, target in edges:
+                efh.write(f"{tid},{source},{target}\n")
+    return spots
+
+def test_sidecar_matches_xml():
+    """Sidecars in the batch spotter's format are loaded instead of the XML and give the same table."""
+    df_xml, meta_xml = parse_trackmate_xml(XML_FILE)
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_copy = Path(tmp) / XML_FILE.name
+        shutil.copy(XML_FILE, xml_copy)
+        spots = _spotter_sidecar(xml_copy)
+        df_side, meta_side = parse_trackmate_xml(xml_copy)
+
+    assert meta_side.keys() == meta_xml.keys()
+    np.testing.assert_allclose([meta_side[k] for k in meta_xml], list(meta_xml.values()))
+    cols = ["track_id", "frame", "t", "x", "y", "z", "intensity"]
+    np.testing.assert_allclose(df_side[cols].to_numpy(), df_xml[cols].to_numpy())
+    # both paths report the XML's channel-1 mean intensity of the tracked spots
+    by_position = {(int(a["FRAME"]), float(a["POSITION_X"]), float(a["POSITION_Y"])):
+                   float(a["MEAN_INTENSITY_CH1"]) for a in spots.values()}
+    expected = [by_position[key] for key in zip(df_xml["frame"], df_xml["x"], df_xml["y"])]
+    np.testing.assert_allclose(df_side["intensity"], expected)
+    np.testing.assert_allclose(df_xml["intensity"], expected)
+
+def test_wide_track_table():
+    """One column per track, one row per spot, NaN padding for shorter tracks."""
+    df, _ = parse_trackmate_xml(XML_FILE, spot_features=["QUALITY"])
+    table = wide_track_table(df, "QUALITY")
+
+    lengths = df.groupby("track_id").size()
+    assert list(table.columns) == [f"Track ID: {tid}" for tid in lengths.index]
+    assert len(table) == lengths.max()
+    np.testing.assert_array_equal(table.notna().sum().to_numpy(), lengths.to_numpy())
+    first = df.sort_values(["track_id", "frame"]).groupby("track_id")["QUALITY"].first()
+    np.testing.assert_allclose(table.iloc[0].to_numpy(), first.to_numpy())
+
+    # the block-wise writer produces the same table without building it first
+    with tempfile.TemporaryDirectory() as tmp:
+        out = write_wide_track_table(df, "QUALITY", Path(tmp) / "wide.csv", chunk_rows=3)
+        pd.testing.assert_frame_equal(pd.read_csv(out), table)
+
+def test_time_bins():
+    """Binned state fractions add up to one and merging files adds counts."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    per_track = msd_per_track(df, meta["dt"])
+    per_window = rolling_window_analysis(df, window=5, step=1, dt=meta["dt"], a_thr=(0.2, 1.2))
+    sums = bin_sums(per_window, per_track, bin_s=30.0)
+    bins = finalize_bins(sums, bin_s=30.0)
+
+    assert bins["n_windows"].sum() == len(per_window)
+    assert bins["n_tracks"].sum() == len(per_track)
+    fracs = bins.filter(like="frac_").sum(axis=1)[bins["n_windows"] > 0]
+    np.testing.assert_allclose(fracs, 1.0)
+
+    merged = finalize_bins(merge_bin_sums([sums, sums]), bin_s=30.0)
+    np.testing.assert_array_equal(merged["n_windows"], 2 * bins["n_windows"])
+    np.testing.assert_allclose(merged["alpha_mean"], bins["alpha_mean"])
+
+def test_fused_track_statistics():
+    """The fused kernel reproduces a straightforward per-track computation."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    dt = meta["dt"]
+    tables = track_statistics(df, dt)
+
+    rows = []
+    for tid, g in df.groupby("track_id"):
+        coords = g.sort_values("frame")[["x", "y"]].to_numpy()
+        n = len(coords)
+        if n < 3:
+            continue
+        msd = np.array([np.square(coords[i:] - coords[:-i]).sum(1).mean() for i in range(1, n)])
+        D, alpha = _fit_msd(np.arange(1, n) * dt, msd)
+        v = np.linalg.norm(np.diff(coords, axis=0), axis=1) / dt
+        rg = np.sqrt(((coords - coords.mean(0)) ** 2).sum(1).mean())
+        rows.append([tid, n, D, alpha, rg, v.mean(), v.max()])
+    expected = np.array(rows, dtype=float)
+    got = tables["tracks"][["track_id", "n_pts", "D", "alpha", "Rg", "v_mean", "v_max"]]
+    np.testing.assert_allclose(got.to_numpy(dtype=float), expected, rtol=1e-6)
+
+    inten = df.groupby("track_id")["intensity"].agg(["mean", "max", "std"])
+    np.testing.assert_allclose(tables["intensity"][["mean", "max", "std"]].to_numpy(),
+                               inten.to_numpy())
+
+def test_dt_inference():
+    """Vectorized dt matches the per-track median and reports its spread."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    per_track = df.groupby("track_id")["t_abs"].apply(lambda s: s.diff().median()).median()
+    assert np.isclose(meta["dt"], per_track)
+    assert meta["dt_min"] <= meta["dt"] <= meta["dt_max"]
+    assert meta["n_dropped_frames"] >= meta["n_gaps"] >= 0
+    _, meta_mode = parse_trackmate_xml(XML_FILE, dt_method="mode")
+    assert np.isclose(meta_mode["dt"], meta["dt"])
+
+def test_sharded_parallel_run_matches_serial():
+    """Largest-first pool + track sharding re-assembles the serial results in order."""
+    params = dict(window=5, step=1, alpha_low=0.2, alpha_high=1.2, intensity=True)
+    files = [XML_FILE, XML_FILE]
+    serial = list(run_files(files, params, n_workers=1))
+    # the second file is "huge" and gets sharded across workers
+    parallel = list(run_files(files, params, n_workers=2, estimates=[10, 1000],
+                              shard_min_spots=100))
+
+    assert [i for i, _, _ in parallel] == [0, 1]
+    for (_, _, (tables_s, meta_s)), (_, _, (tables_p, meta_p)) in zip(serial, parallel):
+        assert meta_s == meta_p
+        for key in tables_s:
+            np.testing.assert_allclose(tables_p[key].select_dtypes("number").to_numpy(),
+                                       tables_s[key].select_dtypes("number").to_numpy())
+
+def test_chunked_xml_parse(monkeypatch):
+    """Parsing the XML in small byte ranges (serially or in processes) gives the same table."""
+    df_ref, meta_ref = parse_trackmate_xml(XML_FILE, use_sidecar=False)
+    monkeypatch.setattr(xmlparse, "CHUNK_BYTES", 20_000)
+    chunks, _ = xmlparse.plan_chunks(XML_FILE)
+    assert len(chunks) > 10 and {c[0] for c in chunks} == {"spots", "tracks"}
+    for n_workers in (1, 2):
+        df, meta = parse_trackmate_xml(XML_FILE, use_sidecar=False, n_workers=n_workers)
+        assert meta == meta_ref
+        pd.testing.assert_frame_equal(df, df_ref)
+
+def test_trackmate_edge_and_track_features():
+    """Edge features land on the edge's target spot, track features on every spot of the track."""
+    df, meta = parse_trackmate_xml(XML_FILE, edge_features=["SPEED", "DISPLACEMENT"],
+                                   track_features=["TRACK_MEAN_SPEED", "TRACK_MAX_SPEED",
+                                                   "TOTAL_DISTANCE_TRAVELED"])
+    same = df["track_id"].to_numpy()[1:] == df["track_id"].to_numpy()[:-1]
+    step = np.sqrt(np.square(np.diff(df[["x", "y", "z"]].to_numpy(), axis=0)).sum(1))
+    np.testing.assert_allclose(df["DISPLACEMENT"].to_numpy()[1:][same], step[same], rtol=1e-6)
+    assert df["SPEED"].isna().sum() == df["track_id"].nunique()
+    per_track = df.groupby("track_id")
+    np.testing.assert_allclose(per_track["DISPLACEMENT"].sum(),
+                               per_track["TOTAL_DISTANCE_TRAVELED"].first(), rtol=1e-6)
+
+    features = ["TRACK_MEAN_SPEED", "TRACK_MAX_SPEED", "TOTAL_DISTANCE_TRAVELED"]
+    tracks = track_statistics(df, meta["dt"], track_features=features)["tracks"]
+    assert set(features) <= set(tracks.columns)   # 3-D data: speeds kept as extra columns
+    flat = track_statistics(df.assign(z=0.0), meta["dt"], track_features=features)["tracks"]
+    assert "TRACK_MEAN_SPEED" not in flat and "TOTAL_DISTANCE_TRAVELED" in flat
+    np.testing.assert_allclose(flat["v_mean"], tracks["TRACK_MEAN_SPEED"])
+    np.testing.assert_allclose(flat["v_max"], tracks["TRACK_MAX_SPEED"])
+
+def test_filtered_tracks_are_skipped(monkeypatch):
+    """Only tracks listed in <FilteredTracks> are read unless all_tracks is set (XML and sidecar)."""
+    df_all, _ = parse_trackmate_xml(XML_FILE, use_sidecar=False)
+    kept = np.unique(df_all["track_id"])[::3]
+    text = XML_FILE.read_text(encoding="utf8")
+    head, rest = text.split("<FilteredTracks>")
+    _, tail = rest.split("</FilteredTracks>")
+    ids = "".join(f'<TrackID TRACK_ID="{t}" />' for t in kept)
+    monkeypatch.setattr(xmlparse, "CHUNK_BYTES", 20_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_copy = Path(tmp) / XML_FILE.name
+        xml_copy.write_text(f"{head}<FilteredTracks>{ids}</FilteredTracks>{tail}", encoding="utf8")
+        for n_workers in (1, 2):
+            df, _ = parse_trackmate_xml(xml_copy, n_workers=n_workers)
+            np.testing.assert_array_equal(np.unique(df["track_id"]), kept)
+            expected = df_all[df_all["track_id"].isin(kept)]
+            np.testing.assert_allclose(df[["x", "y", "frame"]].to_numpy(),
+                                       expected[["x", "y", "frame"]].to_numpy())
+        df, _ = parse_trackmate_xml(xml_copy, all_tracks=True)
+        assert df["track_id"].nunique() == df_all["track_id"].nunique()
+
+        spots_path, _ = sidecar_paths(xml_copy)
+        with open(spots_path, "w", encoding="utf8") as fh:
+            (df_all.drop(columns="t").rename(columns={"t_abs": "t"})
+                   .assign(ID=np.arange(len(df_all)),
+                           track_visible=df_all["track_id"].isin(kept).astype(int))
+                   [["ID", "track_id", "track_visible", "frame", "t", "x", "y", "z", "intensity"]]
+                   .to_csv(fh, index=False))
+        np.testing.assert_array_equal(np.unique(parse_trackmate_xml(xml_copy)[0]["track_id"]), kept)
+        assert parse_trackmate_xml(xml_copy, all_tracks=True)[0]["track_id"].nunique() == \
+            df_all["track_id"].nunique()
+
+def _toy_trackmate_xml(path, spots, tracks, speeds=None):
+    """
+    Minimal TrackMate XML: spots = {ID: frame}, tracks = {TRACK_ID: [(source, target), ...]}.
+    With speeds = (mean, max), every track carries them as TRACK_MEAN_SPEED /
+    TRACK_MAX_SPEED and every edge its true SPEED (x = ID, one frame per time unit).
+    """
+    spot_xml = "".join(f'<SpotsInFrame frame="{f}"><Spot ID="{i}" FRAME="{f}" POSITION_T="{f}.0" '
+                       f'POSITION_X="{i}.0" POSITION_Y="0.0" /></SpotsInFrame>'
+                       for i, f in spots.items())
+    def attrs(a=None, b=None):
+        if speeds is None:
+            return ""
+        if a is None:
+            return f' TRACK_MEAN_SPEED="{speeds[0]}" TRACK_MAX_SPEED="{speeds[1]}"'
+        return f' SPEED="{abs(b - a) / abs(spots[b] - spots[a])}"'
+    track_xml = "".join(f'<Track name="Track_{t}" TRACK_ID="{t}"{attrs()}>'
+                        + "".join(f'<Edge SPOT_SOURCE_ID="{a}" SPOT_TARGET_ID="{b}"{attrs(a, b)} />'
+                                  for a, b in e)
+                        + "</Track>" for t, e in tracks.items())
+    filtered = "".join(f'<TrackID TRACK_ID="{t}" />' for t in tracks)
+    Path(path).write_text(f"<TrackMate><Model><AllSpots>{spot_xml}</AllSpots><AllTracks>{track_xml}"
+                          f"</AllTracks><FilteredTracks>{filtered}</FilteredTracks></Model>"
+                          f"<Settings /></TrackMate>", encoding="utf8")
+
+def test_split_and_merge_tracks_are_linearized():
+    """Branching tracks are cut into linear segments that share the branch spot."""
+    spots = {1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: 3, 7: 4,   # track 0 splits after spot 3
+             8: 0, 9: 0, 10: 1, 11: 2,                   # track 1: 8 and 9 merge into 10
+             12: 0, 13: 1}                               # track 2 is a plain track
+    tracks = {0: [(1, 2), (3, 2), (3, 4), (4, 5), (3, 6), (6, 7)],   # (3, 2) points back in time
+              1: [(8, 10), (9, 10), (10, 11)],
+              2: [(12, 13)]}
+    with tempfile.TemporaryDirectory() as tmp:
+        xml = Path(tmp) / "toy.xml"
+        _toy_trackmate_xml(xml, spots, tracks)
+        df, _ = parse_trackmate_xml(xml)
+        flat, _ = parse_trackmate_xml(xml, linearize=False)
+        # the spotter's sidecars (spots + edge list) are linearized the same way
+        spots_path, edges_path = sidecar_paths(xml)
+        track_of = {s: t for t, e in tracks.items() for edge in e for s in edge}
+        pd.DataFrame({"ID": list(spots), "track_id": [track_of[i] for i in spots],
+                      "track_visible": 1, "frame": list(spots.values()),
+                      "t": list(map(float, spots.values())), "x": list(map(float, spots)),
+                      "y": 0.0, "z": 0.0, "intensity": np.nan}).to_csv(spots_path, index=False)
+        pd.DataFrame([(t, a, b) for t, e in tracks.items() for a, b in e],
+                     columns=["track_id", "source", "target"]).to_csv(edges_path, index=False)
+        df_side, _ = parse_trackmate_xml(xml)
+
+    pd.testing.assert_frame_equal(df_side[df.columns], df, check_dtype=False)
+    segments = {tid: (g["parent_track"].iloc[0], g["x"].astype(int).tolist())
+                for tid, g in df.groupby("track_id")}
+    assert segments == {2: (2, [12, 13]),
+                        3: (0, [1, 2, 3]), 4: (0, [3, 4, 5]), 5: (0, [3, 6, 7]),
+                        6: (1, [8, 10]), 7: (1, [9, 10]), 8: (1, [10, 11])}
+    assert sorted(flat["track_id"].unique()) == [0, 1, 2]
+    assert not flat.duplicated(["track_id", "frame"]).any()
+
+    # a branch spot shared by several segments is one spot for the neighbour columns
+    spatial = add_file_columns(df, {"spatial": True, "radius": 2.0})
+    unique = add_neighbour_columns(df.drop_duplicates(["frame", "x"]).drop(columns="parent_track"),
+                                   radius=2.0)
+    expected = spatial[["frame", "x"]].merge(unique, on=["frame", "x"], how="left")
+    for col in NEIGHBOUR_COLUMNS:
+        np.testing.assert_array_equal(spatial[col].to_numpy(), expected[col].to_numpy())
+    assert (spatial["nn_dist"].dropna() > 0).all()
+
+def test_trackmate_speeds_of_split_tracks():
+    """Segments of a split track keep per-step velocities; whole tracks use TrackMate's speeds."""
+    spots = {1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: 3, 7: 4,   # track 0 splits after spot 3
+             8: 0, 9: 1, 10: 2}                          # track 1 is a plain track
+    tracks = {0: [(1, 2), (2, 3), (3, 4), (4, 5), (3, 6), (6, 7)],
+              1: [(8, 9), (9, 10)]}
+    params = dict(window=3, step=1, alpha_low=0.2, alpha_high=1.2, trackmate_features=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        xml = Path(tmp) / "toy.xml"
+        _toy_trackmate_xml(xml, spots, tracks, speeds=(9.0, 10.0))
+        df, meta = load_spots(xml, params)
+    per_track = analyse_dataframe(df, meta, params)["tracks"].set_index("track_id")
+
+    speeds = {tuple(g["x"].astype(int)): (per_track.loc[tid, "v_mean"], per_track.loc[tid, "v_max"])
+              for tid, g in df.groupby("track_id")}
+    assert speeds == {(8, 9, 10): (9.0, 10.0),
+                      (1, 2, 3): (1.0, 1.0), (3, 4, 5): (1.0, 1.0), (3, 6, 7): (2.0, 3.0)}
+
+def test_lag_cap_policies():
+    """Each lag policy sets the per-track lag cap; only those lags enter the fit."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    dt = meta["dt"]
+    full = track_statistics(df, dt, intensity=False)["tracks"]
+    n = full["n_pts"].to_numpy()
+    np.testing.assert_array_equal(full["n_lags"], n - 1)
+
+    fixed = track_statistics(df, dt, intensity=False, lag_policy="fixed", max_lag=4)["tracks"]
+    np.testing.assert_array_equal(fixed["n_lags"], np.minimum(4, n - 1))
+    fraction = track_statistics(df, dt, intensity=False, lag_policy="fraction")["tracks"]
+    np.testing.assert_array_equal(fraction["n_lags"], np.clip(n // 4, 2, n - 1))
+    for backend in ("numpy", "numba") if kernels.HAVE_NUMBA else ("numpy",):
+        optimal = track_statistics(df, dt, intensity=False, lag_policy="optimal",
+                                   backend=backend)["tracks"]
+        assert ((optimal["n_lags"] >= 2) & (optimal["n_lags"] <= n - 1)).all()
+        assert optimal["n_lags"].sum() < full["n_lags"].sum()
+
+    # the capped fit uses exactly lags 1..n_lags
+    row = fixed.loc[fixed["n_pts"].idxmax()]
+    xy = df.loc[df["track_id"] == row["track_id"], ["x", "y"]].to_numpy()
+    lags = np.arange(1, int(row["n_lags"]) + 1)
+    msd = np.array([np.square(xy[lag:] - xy[:-lag]).sum(1).mean() for lag in lags])
+    np.testing.assert_allclose([row["D"], row["alpha"]], _fit_msd(lags * dt, msd), rtol=1e-6)
+
+    ci = track_bootstrap(df, dt, n_boot=20, lag_policy="optimal")
+    assert len(ci) == len(full)
+
+def test_cancel_run_keeps_finished_files():
+    """A cancelled run stops between files and still yields the finished ones."""
+    params = dict(window=5, step=1, alpha_low=0.2, alpha_high=1.2, intensity=False)
+    cancel = threading.Event()
+    results = []
+    for i, _, result in run_files([XML_FILE] * 3, params, n_workers=1, cancel=cancel):
+        results.append(i)
+        cancel.set()
+    assert results == [0]
+
+    summary = file_summary(result[0])
+    assert summary["n_tracks"] == len(result[0]["tracks"])
+    assert np.isclose(sum(v for k, v in summary.items() if k.startswith("frac_")), 1.0)
+
+    cancel = threading.Event()
+    cancel.set()
+    assert list(run_files([XML_FILE] * 2, params, n_workers=2, cancel=cancel)) == []
+
+    # serial runs check for cancel between track chunks of a big file
+    class CancelAfter(threading.Event):
+        def __init__(self, n):
+            super().__init__()
+            self.n = n
+        def is_set(self):
+            self.n -= 1
+            return self.n < 0
+    whole = list(run_files([XML_FILE], params))[0][2][0]
+    chunked = list(run_files([XML_FILE], params, shard_min_spots=200))[0][2][0]
+    for key in whole:
+        np.testing.assert_allclose(chunked[key].select_dtypes("number").to_numpy(),
+                                   whole[key].select_dtypes("number").to_numpy())
+    assert list(run_files([XML_FILE], params, shard_min_spots=200, cancel=CancelAfter(3))) == []
+
+def test_kernel_backends_agree():
+    """The loop kernels (compiled with Numba when installed) match the NumPy backend."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    dt = meta["dt"]
+    df = df.sort_values(["track_id", "frame"])
+    tracks = msd_per_track(df, dt, backend="numpy")
+    windows = rolling_window_analysis(df, window=5, step=2, dt=dt, a_thr=(0.2, 1.2),
+                                      backend="numpy")
+
+    long = df[df.groupby("track_id")["frame"].transform("size") >= 3]
+    x, y = long["x"].to_numpy(), long["y"].to_numpy()
+    starts = np.r_[0, np.cumsum(tracks["n_pts"].to_numpy())[:-1]]
+    lengths = tracks["n_pts"].to_numpy()
+    D, alpha = kernels.msd_fit_loop(x, y, starts, lengths, lengths - 1, dt)
+    np.testing.assert_allclose(D, tracks["D"], rtol=1e-9)
+    np.testing.assert_allclose(alpha, tracks["alpha"], rtol=1e-9)
+
+    sizes = df.groupby("track_id").size().to_numpy()
+    n_win = np.maximum(sizes - 5 + 2, 0) // 2
+    alpha_w = kernels.window_alpha_loop(df["x"].to_numpy(), df["y"].to_numpy(),
+                                        np.r_[0, np.cumsum(sizes)[:-1]], sizes,
+                                        np.r_[0, np.cumsum(n_win)], 5, 2, dt)
+    np.testing.assert_allclose(alpha_w, windows["alpha"], rtol=1e-9)
+
+    if kernels.HAVE_NUMBA:
+        np.testing.assert_allclose(msd_per_track(df, dt, backend="numba")["alpha"],
+                                   tracks["alpha"], rtol=1e-9)
+        np.testing.assert_allclose(rolling_window_analysis(df, 5, 2, dt, (0.2, 1.2),
+                                                           backend="numba")["alpha"],
+                                   windows["alpha"], rtol=1e-9)
+
+def test_window_length_sweep():
+    """A sweep over window lengths equals one run per length, in one long table."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    dt = meta["dt"]
+    lengths, steps = [5, 7, 10], [1, 2, 3]
+    for backend in ("numpy", "numba") if kernels.HAVE_NUMBA else ("numpy",):
+        sweep = rolling_window_analysis(df, lengths, steps, dt, (0.2, 1.2), backend=backend)
+        assert sweep["window"].isin(lengths).all()
+        for length, step in zip(lengths, steps):
+            single = rolling_window_analysis(df, length, step, dt, (0.2, 1.2), backend=backend)
+            part = sweep[sweep["window"] == length].drop(columns="window").reset_index(drop=True)
+            pd.testing.assert_frame_equal(part.drop(columns="alpha"), single.drop(columns="alpha"))
+            np.testing.assert_allclose(part["alpha"], single["alpha"], rtol=1e-9)
+
+    # shared prefix-sum loop
+    d = df.sort_values(["track_id", "frame"])
+    sizes = d.groupby("track_id").size().to_numpy()
+    n_win = (np.maximum(sizes[:, None] - np.array(lengths) + steps, 0) // steps).ravel()
+    alpha = kernels.window_sweep_loop(d["x"].to_numpy(), d["y"].to_numpy(),
+                                      np.r_[0, np.cumsum(sizes)[:-1]], sizes,
+                                      np.r_[0, np.cumsum(n_win)], np.array(lengths),
+                                      np.array(steps), dt)
+    sweep = rolling_window_analysis(df, lengths, steps, dt, (0.2, 1.2), backend="numpy")
+    np.testing.assert_allclose(alpha, sweep["alpha"], rtol=1e-9, atol=1e-9)
+
+    # pipeline: windows / bins / summary keep using the first length, shards agree
+    params = dict(window=lengths, step=steps, alpha_low=0.2, alpha_high=1.2, intensity=False,
+                  spatial=True)
+    tables = list(run_files([XML_FILE], params))[0][2][0]
+    single = list(run_files([XML_FILE], dict(params, window=5, step=1)))[0][2][0]
+    pd.testing.assert_frame_equal(tables["windows"], single["windows"])
+    assert "nn_dist_mean" in tables["window_sweep"]
+    assert {"frac_static_w5", "frac_static_w10"} <= set(file_summary(tables))
+    sharded = list(run_files([XML_FILE, XML_FILE], params, n_workers=2, estimates=[1000, 10],
+                             shard_min_spots=100))[0][2][0]
+    pd.testing.assert_frame_equal(sharded["window_sweep"], tables["window_sweep"])
+
+def test_bootstrap_confidence_intervals():
+    """Unit weights give the point estimates; CIs bracket them and are reproducible."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    dt = meta["dt"]
+    tracks = msd_per_track(df, dt, backend="numpy")
+
+    long = df.sort_values(["track_id", "frame"])
+    long = long[long.groupby("track_id")["frame"].transform("size") >= 3]
+    lengths = tracks["n_pts"].to_numpy()
+    code = np.repeat(np.arange(len(lengths)), lengths)
+    D, alpha = _weighted_fit(long[["x", "y"]].to_numpy(), code, lengths - 1, dt,
+                             np.ones((2, len(long))))
+    np.testing.assert_allclose(D[1], tracks["D"], rtol=1e-9)
+    np.testing.assert_allclose(alpha[0], tracks["alpha"], rtol=1e-9)
+
+    ci = track_bootstrap(df, dt, n_boot=200, seed=1)
+    assert ci.equals(track_bootstrap(df, dt, n_boot=200, seed=1))
+    merged = tracks.merge(ci, on="track_id")
+    assert len(merged) == len(tracks)
+    assert (merged["alpha_ci_lo"] <= merged["alpha_ci_hi"]).all()
+    inside = (merged["alpha_ci_lo"] <= merged["alpha"]) & (merged["alpha"] <= merged["alpha_ci_hi"])
+    assert inside.mean() > 0.8
+
+    ens = ensemble_confidence(tracks.assign(file="a"), n_boot=500)
+    assert list(ens["file"]) == ["a", "all"]
+    assert (ens["alpha_ci_lo"] <= ens["alpha_mean"]).all()
+    assert (ens["alpha_mean"] <= ens["alpha_ci_hi"]).all()
+
+def test_step_histograms_merge_and_fit():
+    """Histograms of track chunks add up to the whole file; the fit finds two populations."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    whole = step_histograms(df)
+    ids = np.sort(df["track_id"].unique())
+    parts = [step_histograms(df[df["track_id"].isin(chunk)]) for chunk in np.array_split(ids, 3)]
+    merged = merge_step_histograms(parts)
+    np.testing.assert_array_equal(merged["count"], whole["count"])
+    steps = whole[(whole["kind"] == "step") & (whole["lag"] == 1)]
+    n_steps = ((df.sort_values(["track_id", "frame"]).groupby("track_id")["frame"]
+                .diff()) == 1).sum()
+    assert steps["count"].sum() == n_steps
+
+    rng = np.random.default_rng(0)
+    tracks = []
+    for tid, D in enumerate([0.001] * 40 + [0.01] * 40):
+        xy = np.cumsum(rng.normal(0, np.sqrt(2 * D), (100, 2)), axis=0)
+        tracks.append(pd.DataFrame(dict(track_id=tid, frame=np.arange(100), x=xy[:, 0], y=xy[:, 1])))
+    fits = fit_jump_distances(step_histograms(pd.concat(tracks), lags=(1,)), dt=1.0)
+    best = fits[fits["bic"] == fits["bic"].min()]
+    assert len(best) == 2
+    np.testing.assert_allclose(best["D"], [0.001, 0.01], rtol=0.1)
+    np.testing.assert_allclose(best["fraction"], [0.5, 0.5], atol=0.05)
+
+def test_spatial_neighbour_features():
+    """Frame-partitioned KD-tree queries match a brute-force per-frame scan."""
+    df, meta = parse_trackmate_xml(XML_FILE)
+    df = add_neighbour_columns(df.reset_index(drop=True), radius=2.0)
+    nn = np.full(len(df), np.nan)
+    count = np.zeros(len(df), dtype=int)
+    for _, g in df.groupby("frame"):
+        p = g[["x", "y", "z"]].to_numpy()
+        dist = np.sqrt(np.square(p[:, None] - p[None]).sum(-1))
+        np.fill_diagonal(dist, np.inf)
+        if len(p) > 1:
+            nn[g.index] = dist.min(1)
+        count[g.index] = (dist <= 2.0).sum(1)
+    np.testing.assert_allclose(df["nn_dist"], nn)
+    np.testing.assert_array_equal(df["n_within"], count)
+    hits = SpotIndex(df).query_radius(df[["x", "y", "z"]].to_numpy()[:5], df["frame"][:5], 2.0)
+    assert [len(h) for h in hits] == list(count[:5] + 1)
+
+    # neighbour columns need whole frames: track shards must give the same features
+    params = dict(window=5, step=1, alpha_low=0.2, alpha_high=1.2, intensity=False, spatial=True)
+    serial = list(run_files([XML_FILE], params))[0][2][0]
+    sharded = list(run_files([XML_FILE, XML_FILE], params, n_workers=2, estimates=[1000, 10],
+                             shard_min_spots=100))[0][2][0]
+    for key in ("tracks", "windows"):
+        assert "nn_dist_mean" in serial[key]
+        np.testing.assert_allclose(sharded[key].select_dtypes("number").to_numpy(),
+                                   serial[key].select_dtypes("number").to_numpy())
+
+def test_watch_folder_picks_up_completed_files(tmp_path):
+    """Watch mode waits for complete XMLs and adds every new file to the pooled outputs."""
+    from trackmate_spt_analyzer.core.watch import FolderWatcher, is_complete, watch_folder
+
+    data = XML_FILE.read_bytes()
+    (tmp_path / "a.xml").write_bytes(data)
+    (tmp_path / "b.xml").write_bytes(data[:len(data) // 2])  # still being written
+    watcher = FolderWatcher(tmp_path, settle_s=0)
+    assert watcher.poll() == []  # a file must look the same on two scans
+    assert watcher.poll() == [tmp_path / "a.xml"]
+    assert not is_complete(tmp_path / "b.xml")
+    (tmp_path / "b.xml").write_bytes(data)
+    assert watcher.poll() == []
+    assert watcher.poll() == [tmp_path / "b.xml"]
+    assert watcher.poll() == []
+
+    folder = tmp_path / "acquisition"
+    folder.mkdir()
+    shutil.copy(XML_FILE, folder / "first.xml")
+    done = []
+    def arrive(xml_file, result):
+        done.append(xml_file.name)
+        shutil.copy(XML_FILE, folder / "second.xml")
+
+    params = dict(window=5, step=1, alpha_low=0.2, alpha_high=1.2, intensity=True)
+    out_root = watch_folder(folder, params, tmp_path / "out", poll_s=0, settle_s=0,
+                            on_file=arrive, max_polls=4)
+    assert done == ["first.xml", "second.xml"]
+    summary = pd.read_csv(out_root / "summary_all.csv")
+    tracks = list(run_files([XML_FILE], params))[0][2][0]["tracks"]
+    assert summary["file"].tolist() == ["first.xml"] * len(tracks) + ["second.xml"] * len(tracks)
+    np.testing.assert_allclose(summary.loc[summary["file"] == "second.xml", "D"], tracks["D"])
+    assert (out_root / "windows_all.csv").exists()
+
+def test_core_import_is_lazy():
+    """Importing the package or core does not pull in tkinter, scipy or pandas."""
+    import subprocess
+    probe = ("import sys, trackmate_spt_analyzer.core; "
+             "print(' '.join(m for m in ('tkinter', 'scipy', 'pandas') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                         check=True, cwd=Path(__file__).parent).stdout
+    assert out.strip() == ""
+
 if __name__ == "__main__":
     success = test_analysis()
     sys.exit(0 if success else 1) 
\ No newline at end of file
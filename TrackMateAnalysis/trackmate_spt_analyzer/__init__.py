@@ -8,31 +8,26 @@ Main components:
 - Core analysis functions
 - GUI application
 - Utility functions
-"""
-
-from .core.analysis import (
-    parse_trackmate_xml,
-    msd_per_track,
-    rolling_window_analysis,
-    _fit_msd
-)
 
-from .core.utils import (
-    build_readme_text,
-    timestamp,
-    save_with_suffix,
-    qc_report_html
-)
+Everything is loaded lazily: importing the package (or ``.core``) does not
+import tkinter, scipy or the analysis modules until a name is first used.
+"""
 
-from .gui.app import TrackMateSPTAnalyzer
+import importlib
 
 __version__ = "1.0.0"
 __author__ = "Saskia Sanders, Bosse Lab, Medizinische Hochschule Hannover"
 
+# public name -> module that defines it (relative to this package)
+_LAZY = {
+    "TrackMateSPTAnalyzer": "gui.app",
+}
+
 __all__ = [
     # Core analysis functions
     "parse_trackmate_xml",
     "msd_per_track", 
+    "track_statistics",
     "rolling_window_analysis",
     "_fit_msd",
     
@@ -42,6 +37,44 @@ __all__ = [
     "save_with_suffix",
     "qc_report_html",
     
+    # Export functions
+    "wide_track_table",
+    "write_wide_track_table",
+    "export_track_table",
+    
+    # Pipeline
+    "analyse_file",
+    "analyse_dataframe",
+    "file_summary",
+    "load_spots",
+    "run_files",
+    "track_bootstrap",
+    "ensemble_confidence",
+    "step_histograms",
+    "merge_step_histograms",
+    "finalize_step_histograms",
+    "fit_jump_distances",
+    "SpotIndex",
+    "add_neighbour_columns",
+    "neighbour_features",
+    "RunOutputs",
+    "FolderWatcher",
+    "watch_folder",
+    
     # GUI
     "TrackMateSPTAnalyzer",
-] 
\ No newline at end of file
+] 
+
+def __getattr__(name):
+    if name in _LAZY:
+        module = importlib.import_module(f".{_LAZY[name]}", __name__)
+    elif name in __all__:
+        from . import core as module
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
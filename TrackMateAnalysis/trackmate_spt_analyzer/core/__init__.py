@@ -2,18 +2,53 @@
 Core analysis module for TrackMate SPT Analyzer.
 
 Contains the main analysis functions for processing TrackMate XML files.
+The names below are imported from their submodules on first access, so
+``import trackmate_spt_analyzer.core`` stays cheap for worker processes.
 """
 
-from .analysis import parse_trackmate_xml, msd_per_track, rolling_window_analysis, _fit_msd
-from .utils import build_readme_text, timestamp, save_with_suffix, qc_report_html
+import importlib
 
-__all__ = [
-    "parse_trackmate_xml",
-    "msd_per_track", 
-    "rolling_window_analysis",
-    "_fit_msd",
-    "build_readme_text",
-    "timestamp", 
-    "save_with_suffix",
-    "qc_report_html",
-] 
\ No newline at end of file
+# public name -> submodule that defines it
+_LAZY = {
+    "parse_trackmate_xml": "analysis",
+    "msd_per_track": "analysis",
+    "track_statistics": "analysis",
+    "rolling_window_analysis": "analysis",
+    "_fit_msd": "analysis",
+    "build_readme_text": "utils",
+    "timestamp": "utils",
+    "save_with_suffix": "utils",
+    "qc_report_html": "utils",
+    "wide_track_table": "export",
+    "write_wide_track_table": "export",
+    "export_track_table": "export",
+    "analyse_file": "pipeline",
+    "analyse_dataframe": "pipeline",
+    "file_summary": "pipeline",
+    "load_spots": "pipeline",
+    "run_files": "scheduler",
+    "track_bootstrap": "bootstrap",
+    "ensemble_confidence": "bootstrap",
+    "step_histograms": "steps",
+    "merge_step_histograms": "steps",
+    "finalize_step_histograms": "steps",
+    "fit_jump_distances": "steps",
+    "SpotIndex": "spatial",
+    "add_neighbour_columns": "spatial",
+    "neighbour_features": "spatial",
+    "RunOutputs": "outputs",
+    "FolderWatcher": "watch",
+    "watch_folder": "watch",
+}
+
+__all__ = list(_LAZY)
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
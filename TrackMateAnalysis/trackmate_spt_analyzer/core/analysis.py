@@ -7,9 +7,11 @@ Contains XML parsing, MSD calculations, and motion state classification.
 import xml.etree.ElementTree as ET
 import numpy as np
 import pandas as pd
-from scipy.optimize import curve_fit
 from pathlib import Path
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional, Sequence, Union
+
+from .kernels import use_numba, msd_fit_kernel, window_alpha_kernel, window_sweep_kernel
+from .xmlparse import Chunk, Columns, merge_chunks, parse_settings, read_trackmate_xml
 
 def _get_calibration(root: ET.Element) -> Tuple[float, Optional[float]]:
     """Helper: read pixel size + (optional) global dt from <ImageData>"""
@@ -20,60 +22,239 @@ def _get_calibration(root: ET.Element) -> Tuple[float, Optional[float]]:
     dt_global = img.get("time-interval")
     return px, (float(dt_global) if dt_global is not None else None)
 
-def parse_trackmate_xml(xml_path: Path) -> Tuple[pd.DataFrame, Dict[str, float]]:
+def sidecar_paths(xml_path: Path) -> Tuple[Path, Path]:
+    """Spot and edge CSVs written next to an XML by the batch spotter."""
+    xml_path = Path(xml_path)
+    return xml_path.with_suffix(".spots.csv"), xml_path.with_suffix(".edges.csv")
+
+def sidecar_is_current(xml_path: Path) -> bool:
+    """True if the spot sidecar exists and is not older than the XML."""
+    xml_path = Path(xml_path)
+    spots_path, _ = sidecar_paths(xml_path)
+    if not spots_path.exists():
+        return False
+    return not (xml_path.exists() and spots_path.stat().st_mtime < xml_path.stat().st_mtime)
+
+CORE_COLUMNS = ["frame", "t_abs", "x", "y", "z", "intensity", "track_id"]
+
+def _read_sidecar(xml_path: Path, all_tracks: bool = False
+                  ) -> Optional[Tuple[pd.DataFrame, Optional[pd.DataFrame], Optional[float]]]:
+    """
+    Helper: load the spot sidecar (and the edge sidecar, if it is current too)
+    if it exists and is not older than the XML, without the spots of tracks
+    TrackMate's filters hid (unless `all_tracks`) → (spots, edges | None, dt).
+    """
+    if not sidecar_is_current(xml_path):
+        return None
+    spots_path, edges_path = sidecar_paths(xml_path)
+
+    header: Dict[str, str] = {}
+    with open(spots_path, "r", encoding="utf8") as fh:
+        for line in fh:
+            if not line.startswith("#"):
+                break
+            key, _, value = line[1:].strip().partition("=")
+            header[key.strip()] = value.strip()
+    dt_global = header.get("time_interval")
+
+    spots = pd.read_csv(spots_path, comment="#")
+    if not all_tracks and "track_visible" in spots:
+        spots = spots[spots["track_visible"] != 0]
+    spots = spots.rename(columns={"t": "t_abs"})
+    edges = None
+    if "ID" in spots and edges_path.exists() and not (
+            Path(xml_path).exists() and edges_path.stat().st_mtime < Path(xml_path).stat().st_mtime):
+        edges = pd.read_csv(edges_path, comment="#")
+    return spots, edges, (float(dt_global) if dt_global else None)
+
+def parse_trackmate_xml(xml_path: Path, use_sidecar: bool = True,
+                        spot_features: Optional[Sequence[str]] = None,
+                        dt_method: str = "median", n_workers: int = 1,
+                        edge_features: Optional[Sequence[str]] = None,
+                        track_features: Optional[Sequence[str]] = None,
+                        all_tracks: bool = False,
+                        linearize: bool = True) -> Tuple[pd.DataFrame, Dict[str, float]]:
     """
     Parse TrackMate *Full XML* → (tidy DataFrame, metadata dict).
 
     DataFrame columns
     -----------------
-    track_id | frame | t_abs | t | x | y | z | intensity
+    track_id | frame | t_abs | t | x | y | z | intensity | parent_track
     (t_abs = acquisition time in s; t = t_abs – t_abs.min())
+
+    If the batch spotter wrote an up-to-date ``<name>.spots.csv`` sidecar next to
+    the XML, it is loaded instead and the XML is not parsed at all
+    (disable with ``use_sidecar=False``).
+
+    ``spot_features`` lists additional TrackMate spot attributes (e.g. ``QUALITY``,
+    ``SNR_CH1``) to keep as extra float columns under their TrackMate names.
+    The sidecar does not contain them, so requesting any forces the XML path.
+    ``edge_features`` (e.g. ``SPEED``, ``DISPLACEMENT``, ``EDGE_TIME``) and
+    ``track_features`` (e.g. ``TRACK_MEAN_SPEED``, ``TOTAL_DISTANCE_TRAVELED``)
+    work the same way: an edge feature is stored on the spot the edge leads
+    to (NaN on the first spot of a track), a track feature on every spot of
+    the track.
+
+    dt is the median (``dt_method="mode"``: most frequent value) of the per-frame
+    Δt inside tracks. ``meta`` also reports its spread (dt_min, dt_max, dt_iqr)
+    and the number of gaps / dropped frames inside tracks for QC.
+
+    Only the tracks listed in ``<FilteredTracks>`` – those that passed the
+    track filters in TrackMate – are read (sidecar: rows with track_visible
+    = 0 are dropped); ``all_tracks=True`` keeps every track.
+
+    Tracks that split or merge are cut into linear segments between branch
+    points (see `_segment_edges`); track_id is then the segment and
+    parent_track the TrackMate TRACK_ID. Unbranched tracks keep their
+    TRACK_ID. ``linearize=False`` keeps whole tracks, with one spot per frame.
+    A spot sidecar without its edge sidecar cannot be linearized.
+
+    The XML is read in byte ranges of whole ``<SpotsInFrame>`` / ``<Track>``
+    blocks; with ``n_workers > 1`` the ranges are parsed in that many processes.
+    """
+    features = _feature_lists(spot_features, edge_features, track_features)
+    if use_sidecar and not any(features):
+        sidecar = _read_sidecar(xml_path, all_tracks)
+        if sidecar is not None:
+            spots, edges, dt_global = sidecar
+            # sidecar positions are already in TrackMate's physical units
+            if edges is None:
+                df = spots[CORE_COLUMNS].assign(parent_track=spots["track_id"])
+                return _finalize_tracks(df, 1.0, dt_global, dt_method)
+            spots = {"spot_id": spots["ID"].to_numpy(),
+                     **{c: spots[c].to_numpy() for c in CORE_COLUMNS if c != "track_id"}}
+            edges = {c: edges[c].to_numpy() for c in ("track_id", "source", "target")}
+            return _tracks_from_columns(spots, edges, 1.0, dt_global, features,
+                                        dt_method, linearize)
+
+    spots, edges, settings = read_trackmate_xml(xml_path, *features, n_workers, all_tracks)
+    return _tracks_from_columns(spots, edges, *_get_calibration(settings), features,
+                                dt_method, linearize)
+
+def _feature_lists(*features: Optional[Sequence[str]]):
+    """Helper: requested spot / edge / track feature names, without the core columns."""
+    return tuple([f for f in (names or []) if f not in CORE_COLUMNS] for names in features)
+
+def assemble_trackmate_xml(xml_path: Path, chunks: Sequence[Chunk], parts: Sequence[Columns],
+                           settings: Tuple[int, int], spot_features: Optional[Sequence[str]] = None,
+                           edge_features: Optional[Sequence[str]] = None,
+                           track_features: Optional[Sequence[str]] = None,
+                           dt_method: str = "median",
+                           linearize: bool = True) -> Tuple[pd.DataFrame, Dict[str, float]]:
     """
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    # ---- calibration ----
-    px_size, dt_global = _get_calibration(root)
-
-    # ---- collect spots ----
-    spots: dict[int, dict] = {}
-    for sp in root.findall(".//SpotsInFrame/Spot"):
-        sid = int(sp.get("ID"))
-        spots[sid] = {
-            "frame": int(sp.get("FRAME")),
-            "t_abs": float(sp.get("POSITION_T", np.nan)),
-            "x": float(sp.get("POSITION_X")) * px_size,
-            "y": float(sp.get("POSITION_Y")) * px_size,
-            "z": float(sp.get("POSITION_Z", 0)) * px_size,
-            "intensity": float(sp.get("MEAN_INTENSITY_CH1", sp.get("MEAN_INTENSITY", np.nan))),
-        }
-
-    # ---- build per-frame rows ----
-    rows: list[dict] = []
-    for trk in root.findall(".//Track"):
-        tid = int(trk.get("TRACK_ID"))
-        for edge in trk.findall("Edge"):
-            for sid in (edge.get("SPOT_SOURCE_ID"), edge.get("SPOT_TARGET_ID")):
-                sdata = spots.get(int(sid))
-                if sdata:
-                    rows.append({**sdata, "track_id": tid})
-
-    df = (pd.DataFrame(rows)
-            .drop_duplicates(subset=["track_id", "frame"])
+    Finish a parse whose byte ranges (`xmlparse.plan_chunks`) were parsed
+    elsewhere, e.g. by the scheduler's workers → same result as `parse_trackmate_xml`.
+    """
+    features = _feature_lists(spot_features, edge_features, track_features)
+    spots, edges = merge_chunks(chunks, parts, *features)
+    calibration = _get_calibration(parse_settings(xml_path, *settings))
+    return _tracks_from_columns(spots, edges, *calibration, features, dt_method, linearize)
+
+def _segment_edges(track_id: np.ndarray, source: np.ndarray, target: np.ndarray,
+                   source_frame: np.ndarray, target_frame: np.ndarray
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Helper: cut split / merging tracks into linear segments → (segment ID,
+    whole-track flag) per edge.
+
+    Edges are oriented forward in time. An edge continues the segment of the
+    edge before it when the spot between them has exactly one incoming and
+    one outgoing edge; segments are the connected components of that
+    relation, found in time linear in the number of edges. Branch spots end
+    one segment and start the next, so every displacement is used once.
+    Tracks that are one segment keep their ID; the segments of the others
+    get new IDs above the largest track ID, by track and first frame.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(track_id)
+    forward = source_frame <= target_frame
+    src = np.where(forward, source, target)
+    tgt = np.where(forward, target, source)
+    nodes, inv = np.unique(np.r_[src, tgt], return_inverse=True)
+    s_idx, t_idx = inv[:n], inv[n:]
+    outdeg = np.bincount(s_idx, minlength=len(nodes))
+    indeg = np.bincount(t_idx, minlength=len(nodes))
+    in_edge = np.full(len(nodes), -1)
+    in_edge[t_idx] = np.arange(n)
+    out_edge = np.full(len(nodes), -1)
+    out_edge[s_idx] = np.arange(n)
+    inner = (indeg == 1) & (outdeg == 1)
+    links = coo_matrix((np.ones(inner.sum()), (in_edge[inner], out_edge[inner])), shape=(n, n))
+    n_seg, label = connected_components(links, directed=False)
+
+    seg_track = np.empty(n_seg, dtype=np.int64)
+    seg_track[label] = track_id
+    seg_start = np.full(n_seg, np.iinfo(np.int64).max)
+    np.minimum.at(seg_start, label, np.minimum(source_frame, target_frame))
+    tracks, n_segments = np.unique(seg_track, return_counts=True)
+    whole = n_segments[np.searchsorted(tracks, seg_track)] == 1
+    seg_id = seg_track.copy()
+    cut = np.flatnonzero(~whole)
+    cut = cut[np.lexsort((seg_start[cut], seg_track[cut]))]
+    seg_id[cut] = seg_track.max(initial=-1) + 1 + np.arange(len(cut))
+    return seg_id[label], whole[label]
+
+def _tracks_from_columns(spots: Columns, edges: Columns, px_size: float,
+                         dt_global: Optional[float], features: Tuple[List[str], ...],
+                         dt_method: str, linearize: bool
+                         ) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Helper: look up the spots of every edge (source, then target) → finalised rows."""
+    spot_features, edge_features, track_features = features
+
+    # spot IDs are unique; on duplicates the last spot wins. Edges to unknown
+    # spots are ignored.
+    order = np.argsort(spots["spot_id"], kind="stable")
+    ids = spots["spot_id"][order]
+    ends = np.c_[edges["source"], edges["target"]].astype(np.int64)
+    pos = np.searchsorted(ids, ends, side="right") - 1
+    found = pos >= 0
+    found[found] = ids[pos[found]] == ends[found]
+    ok = found.all(axis=1)
+    edges = {key: col[ok] for key, col in edges.items()}
+    src_row, tgt_row = order[pos[ok, 0]], order[pos[ok, 1]]
+
+    track_id = parent = edges["track_id"]
+    whole = np.ones(len(track_id), dtype=bool)
+    if linearize and len(track_id):
+        track_id, whole = _segment_edges(parent, edges["source"], edges["target"],
+                                         spots["frame"][src_row], spots["frame"][tgt_row])
+
+    row = np.c_[src_row, tgt_row].ravel()
+    df = pd.DataFrame({
+        "frame": spots["frame"][row],
+        "t_abs": spots["t_abs"][row],
+        "x": spots["x"][row] * px_size,
+        "y": spots["y"][row] * px_size,
+        "z": spots["z"][row] * px_size,
+        "intensity": spots["intensity"][row],
+        **{feat: spots[feat][row] for feat in spot_features},
+        # track features describe the whole TrackMate track, not a segment of it
+        **{feat: np.repeat(np.where(whole, edges[feat], np.nan), 2) for feat in track_features},
+        "track_id": np.repeat(track_id, 2),
+        "parent_track": np.repeat(parent, 2),
+    })
+    # an edge's values belong to its target spot (on merges the last edge wins)
+    for feat in edge_features:
+        values = np.full(len(spots["spot_id"]), np.nan)
+        values[tgt_row] = edges[feat]
+        df[feat] = values[row]
+    return _finalize_tracks(df, px_size, dt_global, dt_method)
+
+def _finalize_tracks(df: pd.DataFrame, px_size: float, dt_global: Optional[float],
+                     dt_method: str = "median") -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Helper: de-duplicate + sort spot rows, infer dt and build the metadata dict."""
+    df = (df.drop_duplicates(subset=["track_id", "frame"])
             .sort_values(["track_id", "frame"]))
 
     # ---- infer dt ----
-    if df["t_abs"].notna().sum() >= 2:
-        # median Δt between consecutive frames *inside each track*
-        dt_series = (df.groupby("track_id")["t_abs"]
-                       .apply(lambda s: s.diff().median()))
-        dt_val = dt_series.median()
-    elif dt_global is not None:
-        dt_val = dt_global
-        df["t_abs"] = df["frame"] * dt_val
-    else:
-        dt_val = 1.0
-        df["t_abs"] = df["frame"] * dt_val  # still populate t_abs for consistency
+    # median (or mode) Δt between consecutive frames *inside each track*
+    dt_val, dt_diag = _infer_dt(df, dt_method)
+    if np.isnan(dt_val):
+        dt_val = dt_global if dt_global is not None else 1.0
+        if df["t_abs"].notna().sum() < 2:
+            df["t_abs"] = df["frame"] * dt_val  # still populate t_abs for consistency
 
     # relative time starting at zero
     df["t"] = df["t_abs"] - df["t_abs"].min()
@@ -81,13 +262,50 @@ def parse_trackmate_xml(xml_path: Path) -> Tuple[pd.DataFrame, Dict[str, float]]
     meta = dict(pixel_size=px_size,
                 dt=dt_val,
                 n_tracks=df.track_id.nunique(),
-                n_frames=int(df.frame.max()) + 1)
+                n_frames=int(df.frame.max()) + 1,
+                **dt_diag)
     return df, meta
 
+def _infer_dt(df: pd.DataFrame, method: str = "median") -> Tuple[float, Dict[str, float]]:
+    """
+    Helper: frame interval from one vectorized diff over the (track, frame)-sorted
+    table, masked at track boundaries. Each step's Δt is divided by its frame
+    difference so gap-closed links do not inflate dt.
+
+    ``method`` is "median" or "mode" (most frequent Δt after rounding to 6
+    significant digits). Returns (dt or NaN, diagnostics) where diagnostics hold
+    the spread of per-frame Δt and the number of dropped frames (gaps) in tracks.
+    """
+    tid = df["track_id"].to_numpy()
+    frame = df["frame"].to_numpy()
+    t_abs = df["t_abs"].to_numpy(dtype=float)
+    same = tid[1:] == tid[:-1]
+    dframe = (frame[1:] - frame[:-1])[same]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dt_step = (t_abs[1:] - t_abs[:-1])[same] / dframe
+    dt_step = dt_step[np.isfinite(dt_step) & (dt_step > 0)]
+
+    diag = dict(dt_min=np.nan, dt_max=np.nan, dt_iqr=np.nan,
+                n_gaps=int((dframe > 1).sum()),
+                n_dropped_frames=int(np.clip(dframe - 1, 0, None).sum()))
+    if len(dt_step) == 0:
+        return np.nan, diag
+
+    q25, q50, q75 = np.percentile(dt_step, [25, 50, 75])
+    diag.update(dt_min=float(dt_step.min()), dt_max=float(dt_step.max()),
+                dt_iqr=float(q75 - q25))
+    if method == "mode":
+        scale = 10.0 ** (np.floor(np.log10(dt_step)) - 5)
+        rounded = np.round(dt_step / scale) * scale
+        vals, counts = np.unique(rounded, return_counts=True)
+        return float(np.median(dt_step[rounded == vals[counts.argmax()]])), diag
+    return float(q50), diag
+
 def _fit_msd(tau: np.ndarray, msd: np.ndarray) -> Tuple[float, float]:
     """Log-log fit MSD ≈ 4D·τ^α  → returns D, α."""
     if len(tau) < 2 or np.any(msd <= 0):
         return np.nan, np.nan
+    from scipy.optimize import curve_fit  # slow import, only needed here
     try:
         popt, _ = curve_fit(lambda lnt, logD, alpha: logD + alpha * lnt,
                             np.log(tau), np.log(msd), maxfev=2000)
@@ -96,55 +314,295 @@ def _fit_msd(tau: np.ndarray, msd: np.ndarray) -> Tuple[float, float]:
     except Exception:
         return np.nan, np.nan
 
-def msd_per_track(df: pd.DataFrame, dt: float, max_lag: Optional[int] = None) -> pd.DataFrame:
-    """Calculate MSD and related metrics for each track."""
-    records = []
-    for tid, g in df.groupby("track_id"):
-        g = g.sort_values("frame")
-        coords = g[["x", "y"]].to_numpy()
-        n = len(coords)
-        if n < 3:
-            continue
-        max_tau = max_lag or (n - 1)
-        msd = np.array([(np.square(coords[i:] - coords[:-i]).sum(1)).mean()
-                        for i in range(1, max_tau + 1)])
-        tau = np.arange(1, len(msd) + 1) * dt
-        D, alpha = _fit_msd(tau, msd)
-
-        v_inst = np.linalg.norm(np.diff(coords, axis=0), axis=1) / dt
-        rg = np.sqrt(((coords - coords.mean(0)) ** 2).sum(1).mean())
-
-        records.append(dict(track_id=tid, n_pts=n, D=D, alpha=alpha,
-                            Rg=rg, v_mean=v_inst.mean(), v_max=v_inst.max(),
-                            dur_s=n*dt))
-    return pd.DataFrame.from_records(records)
-
-def rolling_window_analysis(df: pd.DataFrame, window: int, step: int,
-                            dt: float, a_thr: Tuple[float, float]) -> pd.DataFrame:
-    """Perform sliding window analysis for motion state classification."""
-    records = []
+def _sorted_by_track(df: pd.DataFrame) -> pd.DataFrame:
+    """Helper: sort by (track_id, frame) unless the table already is (parser output)."""
+    tid = df["track_id"].to_numpy()
+    frame = df["frame"].to_numpy()
+    same = tid[1:] == tid[:-1]
+    if np.all(tid[1:] >= tid[:-1]) and np.all(frame[1:][same] > frame[:-1][same]):
+        return df
+    return df.sort_values(["track_id", "frame"], kind="stable")
+
+def _track_bounds(track_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Helper: start index + length of every contiguous run in a sorted track-id array."""
+    if len(track_ids) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    starts = np.flatnonzero(np.r_[True, track_ids[1:] != track_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(track_ids)])
+    return starts, lengths
+
+def _fit_loglog(group: np.ndarray, tau: np.ndarray, msd: np.ndarray,
+                n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form version of `_fit_msd` for many curves at once.
+
+    (group, tau, msd) are flat arrays holding the MSD points of all curves;
+    returns D, α per group. Least squares on log-log data is linear, so this
+    equals the `curve_fit` result without iterating. Groups with < 2 points or
+    any MSD ≤ 0 give NaN, as in `_fit_msd`.
+    """
+    bad = np.bincount(group, weights=(msd <= 0), minlength=n_groups) > 0
+    pos = msd > 0
+    g = group[pos]
+    lx = np.log(tau[pos])
+    ly = np.log(msd[pos])
+
+    n = np.bincount(g, minlength=n_groups).astype(float)
+    sx = np.bincount(g, weights=lx, minlength=n_groups)
+    sy = np.bincount(g, weights=ly, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mx, my = sx / n, sy / n
+        sxx = np.bincount(g, weights=(lx - mx[g]) ** 2, minlength=n_groups)
+        sxy = np.bincount(g, weights=(lx - mx[g]) * (ly - my[g]), minlength=n_groups)
+        alpha = sxy / sxx
+        D = np.exp(my - alpha * mx) / 4
+    invalid = bad | (n < 2) | ~(sxx > 0)
+    alpha[invalid] = np.nan
+    D[invalid] = np.nan
+    return D, alpha
+
+LAG_POLICIES = ("all", "fixed", "fraction", "optimal")
+
+def _msd_at_lag(xy: np.ndarray, code: np.ndarray, n_tracks: int, lag: int) -> np.ndarray:
+    """Helper: MSD of every track at one lag (rows sorted by track, `code` = track index)."""
+    same = code[lag:] == code[:-lag]
+    d2 = np.square(xy[lag:] - xy[:-lag]).sum(1)[same]
+    g = code[lag:][same]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (np.bincount(g, weights=d2, minlength=n_tracks)
+                / np.bincount(g, minlength=n_tracks))
+
+def _lag_caps(xy: np.ndarray, code: np.ndarray, n: np.ndarray, dt: float,
+              lag_policy: str = "all", max_lag: Optional[int] = None,
+              lag_fraction: float = 0.25, loc_error: Optional[float] = None) -> np.ndarray:
+    """
+    Helper: highest lag of the MSD fit of every track (`n` points each, ≥ 3).
+
+    "all"       N − 1, or min(max_lag, N − 1) if `max_lag` is given
+    "fixed"     min(max_lag, N − 1)
+    "fraction"  ⌊lag_fraction · N⌋
+    "optimal"   Michalet's (2010) optimal number of MSD points for D,
+                p = 2 + 2.7·√x but at most 0.8 + 0.564·N, with the reduced
+                localisation error x = σ²/(D·dt). D comes from the MSD at
+                lags 1 and 2 of each track, σ is `loc_error` (µm) or, if
+                not given, estimated from the same two points.
+    "fraction" and "optimal" are kept within 2 … N − 1.
+    """
+    if lag_policy not in LAG_POLICIES:
+        raise ValueError(f"Unknown lag policy {lag_policy!r}, expected one of {LAG_POLICIES}")
+    if lag_policy == "fixed" and max_lag is None:
+        raise ValueError("The fixed lag policy needs max_lag")
+    if lag_policy in ("all", "fixed"):
+        return n - 1 if max_lag is None else np.minimum(max_lag, n - 1)
+    if lag_policy == "fraction":
+        p = np.floor(lag_fraction * n)
+    else:
+        msd1 = _msd_at_lag(xy, code, len(n), 1)
+        msd2 = _msd_at_lag(xy, code, len(n), 2)
+        # MSD(k) = 4·D·k·dt + 4σ²  (2-D)
+        D = (msd2 - msd1) / (4 * dt)
+        sigma2 = np.maximum(2 * msd1 - msd2, 0) / 4 if loc_error is None else loc_error ** 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x = np.where(D > 0, sigma2 / (D * dt), np.inf)
+        p = np.rint(np.minimum(2 + 2.7 * np.sqrt(x), 0.8 + 0.564 * n))
+    return np.clip(p, 2, n - 1).astype(np.int64)
+
+# TrackMate track features that stand in for an analyzer metric when they were
+# parsed and the data are planar (TrackMate measures distances in x, y and z).
+# TrackMate divides each link by its own time span, so a gap-closing link does
+# not count as a one-frame step.
+TRACKMATE_METRICS = {"TRACK_MEAN_SPEED": "v_mean", "TRACK_MAX_SPEED": "v_max"}
+
+def track_statistics(df: pd.DataFrame, dt: float, max_lag: Optional[int] = None,
+                     intensity: bool = True, backend: str = "auto",
+                     track_features: Sequence[str] = (), lag_policy: str = "all",
+                     lag_fraction: float = 0.25,
+                     loc_error: Optional[float] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Fused per-track kernel: sorts once and computes MSD fit (D, α), Rg,
+    velocities, duration and intensity statistics over contiguous track segments.
+
+    Returns ``{"tracks": <msd_per_track table>, "intensity": <mean/max/std table>}``;
+    the intensity table covers every track, the motion table tracks with ≥ 3 points.
+    `backend` selects the MSD engine: "numpy", "numba" or "auto" (Numba if installed).
+    The MSD is computed and fitted for lags 1 … cap only, with the cap per
+    track set by `lag_policy` (see `_lag_caps`; the tracks table reports it
+    as n_lags).
+
+    `track_features` names per-track TrackMate columns of `df` (see
+    `parse_trackmate_xml`) to copy into the tracks table. For planar data
+    (constant z), TRACK_MEAN_SPEED and TRACK_MAX_SPEED are used as v_mean /
+    v_max of whole tracks instead of recomputing them; otherwise (and for
+    the segments of split / merging tracks, where they are NaN) a parsed
+    edge SPEED column replaces the per-step velocities.
+    """
+    df = _sorted_by_track(df)
+    tid = df["track_id"].to_numpy()
+    xy = df[["x", "y"]].to_numpy(dtype=float)
+    starts, lengths = _track_bounds(tid)
+    code = np.repeat(np.arange(len(starts)), lengths)
+    out: Dict[str, pd.DataFrame] = {}
+
+    if intensity:
+        inten = df["intensity"].to_numpy(dtype=float)
+        ok = np.isfinite(inten)
+        cnt = np.bincount(code[ok], minlength=len(starts)).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(code[ok], weights=inten[ok], minlength=len(starts)) / cnt
+            dev2 = np.bincount(code[ok], weights=(inten[ok] - mean[code[ok]]) ** 2,
+                               minlength=len(starts))
+            std = np.sqrt(dev2 / (cnt - 1))
+        std[cnt < 2] = np.nan
+        imax = (np.fmax.reduceat(inten, starts) if len(starts)
+                else np.empty(0))
+        out["intensity"] = pd.DataFrame({"track_id": tid[starts], "mean": mean,
+                                         "max": imax, "std": std})
+
+    keep = lengths >= 3
+    sel = np.repeat(keep, lengths)
+    tid, xy, code = tid[sel], xy[sel], code[sel]
+    t_first = df["t"].to_numpy(dtype=float)[starts[keep]]
+    extra = {feat: df[feat].to_numpy()[starts[keep]] for feat in track_features}
+    starts, n = _track_bounds(tid)
+    code = np.repeat(np.arange(len(starts)), n)
+    n_tracks = len(starts)
+
+    # ---- Rg ----
+    cnt = n.astype(float)
+    cx = np.bincount(code, weights=xy[:, 0], minlength=n_tracks) / np.maximum(cnt, 1)
+    cy = np.bincount(code, weights=xy[:, 1], minlength=n_tracks) / np.maximum(cnt, 1)
+    r2 = (xy[:, 0] - cx[code]) ** 2 + (xy[:, 1] - cy[code]) ** 2
+    rg = np.sqrt(np.bincount(code, weights=r2, minlength=n_tracks) / np.maximum(cnt, 1))
+
+    # ---- instantaneous velocity (steps inside a track only) ----
+    z = df["z"].to_numpy(dtype=float)
+    planar = np.nanmax(z, initial=0) - np.nanmin(z, initial=0) == 0
+    step_ok = code[1:] == code[:-1]
+    if planar and "SPEED" in df:
+        v_inst = df["SPEED"].to_numpy(dtype=float)[sel][1:][step_ok]
+    else:
+        v_inst = np.linalg.norm(np.diff(xy, axis=0), axis=1)[step_ok] / dt
+    step_code = code[1:][step_ok]
+    v_mean = np.bincount(step_code, weights=v_inst, minlength=n_tracks) / np.maximum(cnt - 1, 1)
+    v_max = np.full(n_tracks, np.nan)
+    np.fmax.at(v_max, step_code, v_inst)
+    if planar and all(feat in extra for feat in TRACKMATE_METRICS):
+        # NaN for segments of split / merging tracks: keep the per-step values there
+        tm_mean, tm_max = (extra.pop(feat).astype(float) for feat in TRACKMATE_METRICS)
+        v_mean = np.where(np.isfinite(tm_mean), tm_mean, v_mean)
+        v_max = np.where(np.isfinite(tm_max), tm_max, v_max)
+
+    # ---- MSD over lags 1..lag_cap, only touching tracks long enough ----
+    lag_cap = _lag_caps(xy, code, n, dt, lag_policy, max_lag, lag_fraction, loc_error)
+    extra = dict(n_lags=lag_cap, **extra)
+    if use_numba(backend):
+        D, alpha = msd_fit_kernel(np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1]),
+                                  starts, n, lag_cap.astype(np.int64), float(dt))
+        return _tracks_table(out, tid, starts, n, D, alpha, rg, v_mean, v_max, dt, t_first,
+                             extra)
+    msd_group, msd_tau, msd_val = [], [], []
+    rows = np.arange(len(tid))
+    for lag in range(1, int(lag_cap.max(initial=0)) + 1):
+        active = lag_cap[code[rows]] >= lag
+        rows = rows[active]
+        src = rows[(rows + lag < len(tid))]
+        src = src[code[np.minimum(src + lag, len(tid) - 1)] == code[src]]
+        d2 = np.square(xy[src + lag] - xy[src]).sum(1)
+        g = code[src]
+        sums = np.bincount(g, weights=d2, minlength=n_tracks)
+        hits = np.bincount(g, minlength=n_tracks)
+        has = np.flatnonzero(hits)
+        msd_group.append(has)
+        msd_tau.append(np.full(len(has), lag * dt))
+        msd_val.append(sums[has] / hits[has])
+    if msd_group:
+        D, alpha = _fit_loglog(np.concatenate(msd_group), np.concatenate(msd_tau),
+                               np.concatenate(msd_val), n_tracks)
+    else:
+        D = alpha = np.empty(0)
+    return _tracks_table(out, tid, starts, n, D, alpha, rg, v_mean, v_max, dt, t_first, extra)
+
+def _tracks_table(out, tid, starts, n, D, alpha, rg, v_mean, v_max, dt, t_first, extra):
+    out["tracks"] = pd.DataFrame(dict(track_id=tid[starts], n_pts=n, D=D, alpha=alpha,
+                                      Rg=rg, v_mean=v_mean, v_max=v_max,
+                                      dur_s=n * dt, t_start=t_first, **extra))
+    return out
+
+def msd_per_track(df: pd.DataFrame, dt: float, max_lag: Optional[int] = None,
+                  backend: str = "auto", lag_policy: str = "all", lag_fraction: float = 0.25,
+                  loc_error: Optional[float] = None) -> pd.DataFrame:
+    """Calculate MSD and related metrics for each track (see `track_statistics`)."""
+    return track_statistics(df, dt, max_lag=max_lag, intensity=False, backend=backend,
+                            lag_policy=lag_policy, lag_fraction=lag_fraction,
+                            loc_error=loc_error)["tracks"]
+
+def rolling_window_analysis(df: pd.DataFrame, window: Union[int, Sequence[int]],
+                            step: Union[int, Sequence[int]], dt: float,
+                            a_thr: Tuple[float, float], backend: str = "auto") -> pd.DataFrame:
+    """
+    Perform sliding window analysis for motion state classification.
+
+    Every window of `window` points (advanced by `step`) gets α from a log-log
+    fit of its MSD over lags 1..window-1. All windows of all tracks are fitted
+    at once; `backend` is used as in `track_statistics`.
+
+    `window` may also be a list of window lengths (with one `step` for all or
+    one per length) to compare them in one pass: the squared displacements
+    at each lag are computed once and shared by all lengths (the Numba
+    kernel keeps per-track prefix sums of them). The result is then a long
+    table with a ``window`` column, ordered by track, window length (as
+    listed) and first frame.
+    """
+    sweep = not np.isscalar(window)
+    windows = np.atleast_1d(np.asarray(window, dtype=np.int64))
+    if windows.size == 0:
+        raise ValueError("At least one window length is required")
+    steps = np.broadcast_to(np.asarray(step, dtype=np.int64), windows.shape)
+    df = _sorted_by_track(df)
+    xy = df[["x", "y"]].to_numpy(dtype=float)
+    starts, lengths = _track_bounds(df["track_id"].to_numpy())
+    # number of windows per (track, window length), stored track by track
+    n_win = (np.maximum(lengths[:, None] - windows + steps, 0) // steps).ravel()
+    offsets = np.r_[0, np.cumsum(n_win)].astype(np.int64)
+    # first row and length of every window
+    first = (np.repeat(np.repeat(starts, len(windows)), n_win)
+             + (np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_win))
+             * np.repeat(np.tile(steps, len(starts)), n_win))
+    win_len = np.repeat(np.tile(windows, len(starts)), n_win)
+
+    if use_numba(backend):
+        x, y = np.ascontiguousarray(xy[:, 0]), np.ascontiguousarray(xy[:, 1])
+        if sweep:
+            alpha = window_sweep_kernel(x, y, starts, lengths, offsets, windows,
+                                        np.ascontiguousarray(steps), float(dt))
+        else:
+            alpha = window_alpha_kernel(x, y, starts, lengths, offsets, int(window), int(step),
+                                        float(dt))
+    else:
+        # fit length by length (contiguous groups), then restore the track order
+        order = np.argsort(np.repeat(np.tile(np.arange(len(windows)), len(starts)), n_win),
+                           kind="stable")
+        bounds = np.r_[0, np.cumsum(n_win.reshape(-1, len(windows)).sum(0))]
+        group, tau, msd = [], [], []
+        for lag in range(1, int(windows.max())):
+            # squared displacements at this lag, shared by all window lengths
+            sq = np.square(xy[lag:] - xy[:-lag]).sum(-1)
+            for length, lo, hi in zip(windows, bounds[:-1], bounds[1:]):
+                if length > lag:
+                    idx = first[order[lo:hi], None] + np.arange(length - lag)
+                    msd.append(sq[idx].mean(1))
+                    group.append(np.arange(lo, hi))
+                    tau.append(np.full(hi - lo, lag * dt))
+        alpha = np.full(len(first), np.nan)
+        if group:
+            alpha[order] = _fit_loglog(np.concatenate(group), np.concatenate(tau),
+                                       np.concatenate(msd), len(first))[1]
+
     alo, ahi = a_thr
-    for tid, g in df.groupby("track_id"):
-        g = g.sort_values("frame").reset_index(drop=True)
-        coords = g[["x", "y"]].to_numpy()
-        n = len(coords)
-        for i0 in range(0, n - window + 1, step):
-            seg = coords[i0:i0 + window]
-            msd = np.array([
-                np.square(seg[j:] - seg[:-j]).sum(axis=1).mean()
-                for j in range(1, window)
-            ])
-            tau = np.arange(1, len(msd) + 1) * dt
-            _, alpha = _fit_msd(tau, msd)
-            if np.isnan(alpha):
-                state = "undetermined"
-            elif alpha <= alo:
-                state = "static"
-            elif alpha <= ahi:
-                state = "diffusive"
-            else:
-                state = "active"
-            records.append(dict(track_id=tid,
-                                frame_start=int(g.loc[i0, "frame"]),
-                                alpha=alpha, state=state))
-    return pd.DataFrame.from_records(records) 
\ No newline at end of file
+    state = np.select([np.isnan(alpha), alpha <= alo, alpha <= ahi],
+                      ["undetermined", "static", "diffusive"], "active")
+    out = pd.DataFrame(dict(track_id=df["track_id"].to_numpy()[first], window=win_len,
+                            frame_start=df["frame"].to_numpy()[first].astype(int),
+                            t_start=df["t"].to_numpy(dtype=float)[first],
+                            alpha=alpha, state=state))
+    return out if sweep else out.drop(columns="window")
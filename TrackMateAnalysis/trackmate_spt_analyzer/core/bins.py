@@ -0,0 +1,95 @@
+"""
+Time-binned statistics for TrackMate SPT Analyzer.
+
+Aggregates sliding-window states / α and per-track D / velocity into fixed
+time bins along ``t``. Binning is done with ``np.bincount`` over the window
+and track tables, producing additive sums that can be merged across files
+before being turned into fractions and means.
+"""
+
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+STATES = ("static", "diffusive", "active", "undetermined")
+
+# additive columns produced by `bin_sums` – everything else is derived from them
+SUM_COLUMNS = (["n_windows"] + [f"n_{s}" for s in STATES]
+               + ["n_alpha", "alpha_sum", "alpha_sq_sum",
+                  "n_tracks", "n_D", "D_sum", "n_v", "v_mean_sum"])
+
+def _bincount(idx: np.ndarray, n_bins: int, weights: np.ndarray = None) -> np.ndarray:
+    return np.bincount(idx, weights=weights, minlength=n_bins)[:n_bins].astype(float)
+
+def _masked_sums(idx: np.ndarray, values: np.ndarray, n_bins: int):
+    """Count, sum and sum of squares of the finite `values` per bin."""
+    ok = np.isfinite(values)
+    return (_bincount(idx[ok], n_bins),
+            _bincount(idx[ok], n_bins, values[ok]),
+            _bincount(idx[ok], n_bins, values[ok] ** 2))
+
+def bin_sums(per_window: pd.DataFrame, per_track: pd.DataFrame, bin_s: float) -> pd.DataFrame:
+    """
+    Additive per-bin sums for one file.
+
+    Windows are assigned to the bin containing their ``t_start``, tracks to the
+    bin containing their first point. Returns one row per bin (``bin`` = index)
+    with the columns in ``SUM_COLUMNS``.
+    """
+    w_bin = np.floor(per_window.get("t_start", pd.Series(dtype=float)).to_numpy() / bin_s).astype(int)
+    t_bin = np.floor(per_track.get("t_start", pd.Series(dtype=float)).to_numpy() / bin_s).astype(int)
+    n_bins = int(max(w_bin.max(initial=-1), t_bin.max(initial=-1))) + 1
+
+    out = {"bin": np.arange(n_bins)}
+    out["n_windows"] = _bincount(w_bin, n_bins)
+
+    if len(w_bin):
+        state_code = pd.Categorical(per_window["state"], categories=STATES).codes
+        counts = _bincount(w_bin * len(STATES) + state_code, n_bins * len(STATES))
+        counts = counts.reshape(n_bins, len(STATES))
+        alpha = per_window["alpha"].to_numpy(dtype=float)
+    else:
+        counts = np.zeros((n_bins, len(STATES)))
+        alpha = np.empty(0)
+    for k, state in enumerate(STATES):
+        out[f"n_{state}"] = counts[:, k]
+    out["n_alpha"], out["alpha_sum"], out["alpha_sq_sum"] = _masked_sums(w_bin, alpha, n_bins)
+
+    out["n_tracks"] = _bincount(t_bin, n_bins)
+    D = per_track["D"].to_numpy(dtype=float) if len(t_bin) else np.empty(0)
+    v = per_track["v_mean"].to_numpy(dtype=float) if len(t_bin) else np.empty(0)
+    out["n_D"], out["D_sum"], _ = _masked_sums(t_bin, D, n_bins)
+    out["n_v"], out["v_mean_sum"], _ = _masked_sums(t_bin, v, n_bins)
+    return pd.DataFrame(out)
+
+def merge_bin_sums(sums: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Add per-bin sums of several files (bins are aligned on the bin index)."""
+    sums = list(sums)
+    n_bins = max((len(s) for s in sums), default=0)
+    total = np.zeros((n_bins, len(SUM_COLUMNS)))
+    for s in sums:
+        total[:len(s)] += s[SUM_COLUMNS].to_numpy()
+    merged = pd.DataFrame(total, columns=SUM_COLUMNS)
+    merged.insert(0, "bin", np.arange(n_bins))
+    return merged
+
+def finalize_bins(sums: pd.DataFrame, bin_s: float) -> pd.DataFrame:
+    """Turn additive per-bin sums into state fractions and mean α / D / velocity."""
+    def ratio(num, den):
+        num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+        return np.divide(num, den, out=np.full(len(den), np.nan), where=den > 0)
+
+    out = pd.DataFrame({"bin": sums["bin"].astype(int),
+                        "t_lo": sums["bin"] * bin_s,
+                        "t_hi": (sums["bin"] + 1) * bin_s,
+                        "n_windows": sums["n_windows"].astype(int)})
+    for state in STATES:
+        out[f"frac_{state}"] = ratio(sums[f"n_{state}"], sums["n_windows"])
+    out["alpha_mean"] = ratio(sums["alpha_sum"], sums["n_alpha"])
+    alpha_var = ratio(sums["alpha_sq_sum"], sums["n_alpha"]) - out["alpha_mean"] ** 2
+    out["alpha_std"] = np.sqrt(np.clip(alpha_var, 0, None))
+    out["n_tracks"] = sums["n_tracks"].astype(int)
+    out["D_mean"] = ratio(sums["D_sum"], sums["n_D"])
+    out["v_mean"] = ratio(sums["v_mean_sum"], sums["n_v"])
+    return out
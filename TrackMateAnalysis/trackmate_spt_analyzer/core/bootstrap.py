@@ -0,0 +1,149 @@
+"""
+Bootstrap confidence intervals for TrackMate SPT Analyzer.
+
+Track level: every localisation gets a Poisson(1) weight per resample and
+all displacements starting at it are weighted with it, so resampling keeps
+the correlation between lags of the same start point. The weighted MSD
+curves of a whole batch of resamples are reduced per track with
+``np.add.reduceat`` and fitted with the closed-form log-log fit while
+iterating over the lags – no Python loop over resamples or tracks.
+
+Ensemble level: tracks are resampled with replacement (multinomial counts)
+to get confidence intervals of the mean D and α per file and overall.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .analysis import _lag_caps, _sorted_by_track, _track_bounds
+
+def _weighted_fit(xy: np.ndarray, code: np.ndarray, lag_cap: np.ndarray, dt: float,
+                  w: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    D, α per (resample, track) from MSD curves weighted by start point.
+
+    `w` has shape (n_resamples, n_rows); with all weights 1 this reproduces
+    the point estimates of `track_statistics`.
+    """
+    n_b, n_rows = w.shape
+    n_tracks = len(lag_cap)
+    cnt = np.zeros((n_b, n_tracks))
+    sx, sy, sxx, sxy = (np.zeros((n_b, n_tracks)) for _ in range(4))
+    bad = np.zeros((n_b, n_tracks), dtype=bool)
+
+    rows = np.arange(n_rows)
+    for lag in range(1, int(lag_cap.max(initial=0)) + 1):
+        rows = rows[lag_cap[code[rows]] >= lag]
+        src = rows[rows + lag < n_rows]
+        src = src[code[np.minimum(src + lag, n_rows - 1)] == code[src]]
+        if len(src) == 0:
+            continue
+        d2 = np.square(xy[src + lag] - xy[src]).sum(1)
+        g = code[src]
+        first = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        has = g[first]
+        ws = w[:, src]
+        num = np.add.reduceat(ws * d2, first, axis=1)
+        den = np.add.reduceat(ws, first, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            msd = num / den
+        used = den > 0
+        bad[:, has] |= used & ~(msd > 0)
+        ok = used & (msd > 0)
+        lx = np.log(lag * dt)
+        ly = np.log(np.where(ok, msd, 1.0))
+        cnt[:, has] += ok
+        sx[:, has] += ok * lx
+        sxx[:, has] += ok * lx * lx
+        sy[:, has] += ok * ly
+        sxy[:, has] += ok * lx * ly
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = sxx - sx * sx / cnt
+        alpha = (sxy - sx * sy / cnt) / var
+        D = np.exp((sy - alpha * sx) / cnt) / 4
+    invalid = bad | (cnt < 2) | ~(var > 0)
+    alpha[invalid] = np.nan
+    D[invalid] = np.nan
+    return D, alpha
+
+def _percentiles(samples: np.ndarray, ci: float) -> Tuple[np.ndarray, np.ndarray]:
+    q = 50 * (1 - ci), 50 * (1 + ci)
+    if samples.shape[0] == 0 or samples.shape[1] == 0:
+        empty = np.full(samples.shape[1], np.nan)
+        return empty, empty.copy()
+    ok = np.isfinite(samples).any(axis=0)
+    lo = np.full(samples.shape[1], np.nan)
+    hi = np.full(samples.shape[1], np.nan)
+    if ok.any():
+        lo[ok], hi[ok] = np.nanpercentile(samples[:, ok], q, axis=0)
+    return lo, hi
+
+def track_bootstrap(df: pd.DataFrame, dt: float, n_boot: int = 1000, ci: float = 0.95,
+                    max_lag: Optional[int] = None, seed: Optional[int] = 0,
+                    batch: int = 64, lag_policy: str = "all", lag_fraction: float = 0.25,
+                    loc_error: Optional[float] = None) -> pd.DataFrame:
+    """
+    Per-track bootstrap confidence intervals of D and α.
+
+    Covers the same tracks (≥ 3 points) and lags as `track_statistics` with
+    the same lag options.
+    Returns track_id, D_ci_lo, D_ci_hi, alpha_ci_lo, alpha_ci_hi; resamples
+    are processed `batch` at a time to bound memory.
+    """
+    df = _sorted_by_track(df)
+    tid = df["track_id"].to_numpy()
+    starts, lengths = _track_bounds(tid)
+    sel = np.repeat(lengths >= 3, lengths)
+    tid = tid[sel]
+    xy = df[["x", "y"]].to_numpy(dtype=float)[sel]
+    starts, n = _track_bounds(tid)
+    code = np.repeat(np.arange(len(starts)), n)
+    lag_cap = _lag_caps(xy, code, n, dt, lag_policy, max_lag, lag_fraction, loc_error)
+
+    rng = np.random.default_rng(seed)
+    D_b = np.empty((n_boot, len(starts)))
+    alpha_b = np.empty((n_boot, len(starts)))
+    for b0 in range(0, n_boot, batch):
+        w = rng.poisson(1.0, (min(batch, n_boot - b0), len(tid))).astype(float)
+        D_b[b0:b0 + len(w)], alpha_b[b0:b0 + len(w)] = _weighted_fit(xy, code, lag_cap, dt, w)
+
+    D_lo, D_hi = _percentiles(D_b, ci)
+    a_lo, a_hi = _percentiles(alpha_b, ci)
+    return pd.DataFrame(dict(track_id=tid[starts], D_ci_lo=D_lo, D_ci_hi=D_hi,
+                             alpha_ci_lo=a_lo, alpha_ci_hi=a_hi))
+
+def ensemble_bootstrap(values: np.ndarray, n_boot: int = 1000, ci: float = 0.95,
+                       seed: Optional[int] = 0, batch: int = 256) -> Tuple[float, float, float]:
+    """Mean of `values` (NaN ignored) and its bootstrap CI from resampling with replacement."""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+    rng = np.random.default_rng(seed)
+    means = np.empty(n_boot)
+    p = np.full(len(values), 1.0 / len(values))
+    for b0 in range(0, n_boot, batch):
+        counts = rng.multinomial(len(values), p, size=min(batch, n_boot - b0))
+        means[b0:b0 + len(counts)] = counts @ values / len(values)
+    lo, hi = np.percentile(means, [50 * (1 - ci), 50 * (1 + ci)])
+    return float(values.mean()), float(lo), float(hi)
+
+def ensemble_confidence(summary_df: pd.DataFrame, n_boot: int = 1000, ci: float = 0.95,
+                        seed: Optional[int] = 0) -> pd.DataFrame:
+    """
+    Bootstrap CIs of the mean D and mean α per file plus one row "all" that
+    pools every track of `summary_df` (a `summary_all` table).
+    """
+    groups = [(name, g) for name, g in summary_df.groupby("file", sort=False)]
+    groups.append(("all", summary_df))
+    rows = []
+    for name, g in groups:
+        row: Dict[str, float] = {"file": name, "n_tracks": len(g)}
+        for col in ("D", "alpha"):
+            row[f"{col}_mean"], row[f"{col}_ci_lo"], row[f"{col}_ci_hi"] = \
+                ensemble_bootstrap(g[col].to_numpy(), n_boot, ci, seed)
+        rows.append(row)
+    return pd.DataFrame(rows)
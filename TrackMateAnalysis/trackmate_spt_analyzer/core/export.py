@@ -0,0 +1,113 @@
+"""
+Table export functions for TrackMate SPT Analyzer.
+
+Contains the Fiji-free equivalent of ``TrackTable.py``: one column per track,
+one row per spot, for any spot feature. Runs headless:
+
+    python -m trackmate_spt_analyzer.core.export data.xml --feature QUALITY
+"""
+
+import argparse
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .analysis import parse_trackmate_xml, CORE_COLUMNS
+
+def wide_track_table(df: pd.DataFrame, feature: str) -> pd.DataFrame:
+    """
+    Pivot a tidy spot table to *one column per track, one row per spot*.
+
+    Row i holds the i-th spot (in frame order) of every track; shorter tracks
+    are padded with NaN. Columns are named ``Track ID: <id>`` like TrackTable.
+    """
+    return next(_wide_blocks(df, feature, max(len(df), 1)))
+
+def _wide_blocks(df: pd.DataFrame, feature: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Helper: the rows of `wide_track_table`, built from the tidy table `chunk_rows` at a time."""
+    df = df.sort_values(["track_id", "frame"], kind="stable")
+    codes, track_ids = pd.factorize(df["track_id"], sort=True)
+    row = df.groupby("track_id", sort=True).cumcount().to_numpy()
+    values = df[feature].to_numpy(dtype=float)
+    columns = [f"Track ID: {tid}" for tid in track_ids]
+
+    n_rows = int(row.max()) + 1 if len(row) else 0
+    order = np.argsort(row, kind="stable")
+    sorted_rows = row[order]
+    for start in range(0, max(n_rows, 1), chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        lo, hi = np.searchsorted(sorted_rows, [start, stop])
+        sel = order[lo:hi]
+        block = np.full((max(stop - start, 0), len(track_ids)), np.nan)
+        block[row[sel] - start, codes[sel]] = values[sel]
+        yield pd.DataFrame(block, columns=columns)
+
+def write_wide_track_table(df: pd.DataFrame, feature: str, out_path: Path,
+                           chunk_rows: int = 10000) -> Path:
+    """
+    Write :func:`wide_track_table` to ``.csv`` or ``.parquet`` (chosen by suffix).
+
+    The wide rows are built from the tidy table and written in blocks of
+    ``chunk_rows`` rows, so the full padded table is never held in memory.
+    Parquet needs ``pyarrow`` and is written one row group per block.
+    """
+    out_path = Path(out_path)
+    blocks = _wide_blocks(df, feature, chunk_rows)
+
+    if out_path.suffix.lower() == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+        writer = None
+        try:
+            for block in blocks:
+                block = pa.Table.from_pandas(block, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, block.schema)
+                writer.write_table(block)
+        finally:
+            if writer is not None:
+                writer.close()
+        return out_path
+
+    with open(out_path, "w", encoding="utf8", newline="") as fh:
+        for i, block in enumerate(blocks):
+            block.to_csv(fh, header=(i == 0), index=False, na_rep="")
+    return out_path
+
+def export_track_table(xml_path: Path, feature: str, out_dir: Optional[Path] = None,
+                       extension: str = "", fmt: str = "csv") -> Path:
+    """Parse one XML and write its wide track table as ``<name><extension>.<fmt>``."""
+    xml_path = Path(xml_path)
+    extra = [] if feature in CORE_COLUMNS + ["t"] else [feature]
+    df, _ = parse_trackmate_xml(xml_path, spot_features=extra)
+    out_dir = Path(out_dir) if out_dir is not None else xml_path.parent
+    return write_wide_track_table(df, feature, out_dir / f"{xml_path.stem}{extension}.{fmt}")
+
+def main(argv: Optional[List[str]] = None):
+    """Command-line entry point for headless wide track-table export."""
+    parser = argparse.ArgumentParser(
+        description="Export one column per track, one row per spot for a spot feature.")
+    parser.add_argument("inputs", nargs="+", type=Path,
+                        help="TrackMate XML files or folders containing them")
+    parser.add_argument("--feature", default="intensity",
+                        help="spot feature: x, y, z, t, intensity or any TrackMate spot attribute")
+    parser.add_argument("--out-dir", type=Path, default=None,
+                        help="output folder (default: next to each XML)")
+    parser.add_argument("--extension", default="", help="suffix added to output file names")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args(argv)
+
+    xml_files = []
+    for inp in args.inputs:
+        xml_files.extend(sorted(inp.glob("*.xml")) if inp.is_dir() else [inp])
+    for xml_file in xml_files:
+        out = export_track_table(xml_file, args.feature, args.out_dir, args.extension, args.format)
+        print(f"{xml_file.name} → {out}")
+
+if __name__ == "__main__":
+    main()
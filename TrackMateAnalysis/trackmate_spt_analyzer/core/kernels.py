@@ -0,0 +1,193 @@
+"""
+Optional compiled kernels for TrackMate SPT Analyzer.
+
+Loop versions of the per-track MSD fit and the sliding-window α fit that run
+directly over the sorted coordinate arrays without per-lag temporaries. When
+Numba is installed they are JIT-compiled with a parallel loop over tracks the
+first time the Numba backend is used; otherwise `analysis` uses its NumPy
+code. The plain-Python loops stay importable so the two backends can be
+compared in tests.
+"""
+
+import importlib.util
+import math
+import types
+
+import numpy as np
+
+# only probe for Numba here – importing it is slow and most runs never need it
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+
+# plain-Python loops run serially; the compiled copies see numba.prange instead
+prange = range
+
+_compiled = {}
+
+BACKENDS = ("auto", "numpy", "numba")
+
+def use_numba(backend: str = "auto") -> bool:
+    """Resolve a backend name: True if the Numba kernels should be used."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "numba" and not HAVE_NUMBA:
+        raise ImportError("The numba backend requires numba (pip install numba)")
+    return HAVE_NUMBA and backend != "numpy"
+
+def _fit_sums(cnt, sx, sy, sxx, sxy, bad):
+    """D, α from running log-log sums (same validity rules as `_fit_loglog`)."""
+    if bad or cnt < 2:
+        return np.nan, np.nan
+    var = sxx - sx * sx / cnt
+    if not var > 0:
+        return np.nan, np.nan
+    alpha = (sxy - sx * sy / cnt) / var
+    return math.exp((sy - alpha * sx) / cnt) / 4, alpha
+
+def msd_fit_loop(x, y, starts, lengths, lag_cap, dt):
+    """
+    Per-track MSD over lags 1..lag_cap[k] and its log-log fit → (D, α) arrays.
+
+    `x`, `y` hold all tracks back to back; track k occupies
+    ``starts[k]:starts[k] + lengths[k]``.
+    """
+    n_tracks = len(starts)
+    D = np.empty(n_tracks)
+    alpha = np.empty(n_tracks)
+    for k in prange(n_tracks):
+        s = starts[k]
+        n = lengths[k]
+        cnt = 0
+        sx = sy = sxx = sxy = 0.0
+        bad = False
+        for lag in range(1, lag_cap[k] + 1):
+            acc = 0.0
+            for i in range(s, s + n - lag):
+                dx = x[i + lag] - x[i]
+                dy = y[i + lag] - y[i]
+                acc += dx * dx + dy * dy
+            msd = acc / (n - lag)
+            if not msd > 0:
+                bad = True
+                continue
+            lx = math.log(lag * dt)
+            ly = math.log(msd)
+            cnt += 1
+            sx += lx
+            sy += ly
+            sxx += lx * lx
+            sxy += lx * ly
+        D[k], alpha[k] = _fit_sums(cnt, sx, sy, sxx, sxy, bad)
+    return D, alpha
+
+def window_alpha_loop(x, y, starts, lengths, offsets, window, step, dt):
+    """
+    α of every sliding window (lags 1..window-1) of every track.
+
+    Windows of track k are written to ``offsets[k]:offsets[k + 1]`` of the
+    result, in order of their first point.
+    """
+    alpha = np.empty(offsets[-1])
+    for k in prange(len(starts)):
+        s = starts[k]
+        out = offsets[k]
+        for i0 in range(s, s + lengths[k] - window + 1, step):
+            cnt = 0
+            sx = sy = sxx = sxy = 0.0
+            bad = False
+            for lag in range(1, window):
+                acc = 0.0
+                for i in range(i0, i0 + window - lag):
+                    dx = x[i + lag] - x[i]
+                    dy = y[i + lag] - y[i]
+                    acc += dx * dx + dy * dy
+                msd = acc / (window - lag)
+                if not msd > 0:
+                    bad = True
+                    continue
+                lx = math.log(lag * dt)
+                ly = math.log(msd)
+                cnt += 1
+                sx += lx
+                sy += ly
+                sxx += lx * lx
+                sxy += lx * ly
+            alpha[out] = _fit_sums(cnt, sx, sy, sxx, sxy, bad)[1]
+            out += 1
+    return alpha
+
+def window_sweep_loop(x, y, starts, lengths, offsets, windows, steps, dt):
+    """
+    α of the sliding windows of several window lengths from shared sums.
+
+    Per track and lag, the squared displacements are summed once into a
+    prefix array; the MSD of every window of every length at that lag is a
+    difference of two entries. Windows of length ``windows[j]`` (advanced by
+    ``steps[j]``) of track k go to ``offsets[k * m + j]:offsets[k * m + j + 1]``
+    with ``m = len(windows)``.
+    """
+    m = len(windows)
+    alpha = np.empty(offsets[-1])
+    max_window = 0
+    for j in range(m):
+        max_window = max(max_window, windows[j])
+    for k in prange(len(starts)):
+        s = starts[k]
+        n = lengths[k]
+        lo = offsets[k * m]
+        n_out = offsets[(k + 1) * m] - lo
+        cnt = np.zeros(n_out, dtype=np.int64)
+        sx = np.zeros(n_out)
+        sy = np.zeros(n_out)
+        sxx = np.zeros(n_out)
+        sxy = np.zeros(n_out)
+        bad = np.zeros(n_out, dtype=np.bool_)
+        prefix = np.zeros(n + 1)
+        for lag in range(1, min(max_window, n)):
+            for i in range(n - lag):
+                dx = x[s + i + lag] - x[s + i]
+                dy = y[s + i + lag] - y[s + i]
+                prefix[i + 1] = prefix[i] + dx * dx + dy * dy
+            lx = math.log(lag * dt)
+            for j in range(m):
+                window = windows[j]
+                if window <= lag:
+                    continue
+                out = offsets[k * m + j] - lo
+                for i0 in range(0, n - window + 1, steps[j]):
+                    msd = (prefix[i0 + window - lag] - prefix[i0]) / (window - lag)
+                    if not msd > 0:
+                        bad[out] = True
+                    else:
+                        ly = math.log(msd)
+                        cnt[out] += 1
+                        sx[out] += lx
+                        sy[out] += ly
+                        sxx[out] += lx * lx
+                        sxy[out] += lx * ly
+                    out += 1
+        for w in range(n_out):
+            alpha[lo + w] = _fit_sums(cnt[w], sx[w], sy[w], sxx[w], sxy[w], bad[w])[1]
+    return alpha
+
+def _jit(name: str):
+    """Compile the loop `name` with Numba on first use (parallel over tracks)."""
+    if name not in _compiled:
+        import numba
+        env = dict(globals(), prange=numba.prange,
+                   _fit_sums=numba.njit(cache=True)(_fit_sums))
+        fn = globals()[name]
+        fn = types.FunctionType(fn.__code__, env, fn.__name__, fn.__defaults__)
+        _compiled[name] = numba.njit(parallel=True, cache=True)(fn)
+    return _compiled[name]
+
+def msd_fit_kernel(*args):
+    """Numba-compiled `msd_fit_loop`."""
+    return _jit("msd_fit_loop")(*args)
+
+def window_alpha_kernel(*args):
+    """Numba-compiled `window_alpha_loop`."""
+    return _jit("window_alpha_loop")(*args)
+
+def window_sweep_kernel(*args):
+    """Numba-compiled `window_sweep_loop`."""
+    return _jit("window_sweep_loop")(*args)
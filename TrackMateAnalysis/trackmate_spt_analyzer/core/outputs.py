@@ -0,0 +1,137 @@
+"""
+Output folder of an analysis run for TrackMate SPT Analyzer.
+
+Writes the per-file CSVs as files finish and the pooled tables (summary_all,
+time bins, merged windows, step histograms, QC report) from all files added
+so far, so a GUI run and the watch mode produce the same layout.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from .bins import bin_sums, merge_bin_sums, finalize_bins
+from .bootstrap import ensemble_confidence
+from .steps import merge_step_histograms, finalize_step_histograms, fit_jump_distances
+from .utils import build_readme_text, qc_report_html, save_with_suffix
+
+SUBDIRS = ["all_tracks", "bins", "windows", "qc_reports", "logs"]
+
+def file_warnings(name: str, meta: Dict[str, float]) -> List[str]:
+    """QC warnings from the parser metadata of one file (gaps, irregular frame interval)."""
+    warnings_ = []
+    if meta["n_dropped_frames"] > 0:
+        warnings_.append(f"{name}: {meta['n_gaps']} gap(s) inside tracks, "
+                         f"{meta['n_dropped_frames']} dropped frame(s)")
+    if meta["dt_iqr"] > 0.05 * meta["dt"]:
+        warnings_.append(f"{name}: irregular frame interval "
+                         f"(Δt {meta['dt_min']:.4g}–{meta['dt_max']:.4g} s)")
+    return warnings_
+
+class RunOutputs:
+    """
+    Per-file and pooled output tables of one run below `out_root`.
+
+    `params` are the analysis parameters (histograms / bootstrap decide which
+    outputs exist), `bin_s` the time-bin width and `merge_windows` whether
+    the window tables of all files are merged. Existing files are kept
+    (new names via `save_with_suffix`) unless `overwrite` is set, which the
+    watch mode uses to refresh the same files after every update.
+    """
+
+    def __init__(self, out_root: Path, params: Dict[str, Any], bin_s: float,
+                 merge_windows: bool = False, overwrite: bool = False):
+        self.out_root = Path(out_root)
+        self.params = params
+        self.bin_s = bin_s
+        self.merge_windows = merge_windows
+        self.overwrite = overwrite
+        # one entry per input file, in the order the files were first added
+        self.files: Dict[str, Dict[str, Any]] = {}
+        for sub in SUBDIRS + (["steps"] if params.get("histograms") else []):
+            (self.out_root / sub).mkdir(parents=True, exist_ok=True)
+
+    def _target(self, *parts: str) -> Path:
+        path = self.out_root.joinpath(*parts)
+        return path if self.overwrite else save_with_suffix(path)
+
+    def add_file(self, xml_file: Path, tables: Dict[str, pd.DataFrame],
+                 meta: Dict[str, float]) -> List[str]:
+        """
+        Write the CSVs of one analysed file and keep its tables for the pooled
+        outputs (replacing earlier results of the same file). Returns the QC
+        warnings of the file.
+        """
+        name, stem = Path(xml_file).name, Path(xml_file).stem
+        per_track = tables["tracks"]
+        per_track["file"] = name
+        per_window = tables["windows"]
+        per_window["file"] = name
+
+        per_window.to_csv(self._target("windows", f"{stem}__windows.csv"), index=False)
+        per_track.to_csv(self._target("all_tracks", f"{stem}__tracks.csv"), index=False)
+        if "window_sweep" in tables:
+            tables["window_sweep"]["file"] = name
+            tables["window_sweep"].to_csv(self._target("windows", f"{stem}__window_sweep.csv"),
+                                          index=False)
+        if "intensity" in tables:
+            tables["intensity"].to_csv(self._target("all_tracks", f"{stem}__intensity.csv"),
+                                       index=False)
+
+        # Time-binned states / α / D / velocity
+        sums = bin_sums(per_window, per_track, self.bin_s)
+        finalize_bins(sums, self.bin_s).assign(file=name).to_csv(
+            self._target("bins", f"{stem}__bins.csv"), index=False)
+
+        pt = per_track.assign(pixel=meta["pixel_size"], dt=meta["dt"])
+        cols = ["file"] + [c for c in pt.columns if c != "file"]
+        self.files[str(xml_file)] = dict(tracks=pt[cols], windows=per_window,
+                                         window_sweep=tables.get("window_sweep"),
+                                         bins=sums, steps=tables.get("steps"),
+                                         meta=meta, file_meta={"file": name, **meta})
+        return file_warnings(name, meta)
+
+    def remove_file(self, xml_file: Path):
+        """Leave a file out of the pooled outputs (its per-file CSVs stay)."""
+        self.files.pop(str(xml_file), None)
+
+    def write_summaries(self, warnings_: List[str]):
+        """(Re)write the pooled tables, QC report and README from all files added so far."""
+        entries = list(self.files.values())
+        if not entries:
+            return
+        summary_all = pd.concat([e["tracks"] for e in entries], ignore_index=True)
+        summary_all.to_csv(self._target("summary_all.csv"), index=False)
+
+        bins_all = finalize_bins(merge_bin_sums([e["bins"] for e in entries]), self.bin_s)
+        bins_all.to_csv(self._target("bins", "bins_all.csv"), index=False)
+
+        file_meta = pd.DataFrame([e["file_meta"] for e in entries])
+        # Pooled step-length / van Hove histograms and jump-distance fits
+        step_hists = [e["steps"] for e in entries if e["steps"] is not None]
+        if step_hists:
+            hist = merge_step_histograms(step_hists)
+            dens = finalize_step_histograms(hist)
+            for kind, name in (("step", "step_lengths.csv"), ("vanhove", "van_hove.csv")):
+                dens[dens["kind"] == kind].drop(columns="kind").to_csv(
+                    self._target("steps", name), index=False)
+            fit_jump_distances(hist, float(file_meta["dt"].median())).to_csv(
+                self._target("steps", "jump_distance_fits.csv"), index=False)
+
+        if self.merge_windows:
+            windows_all = pd.concat([e["windows"] for e in entries], ignore_index=True)
+            windows_all.to_csv(self._target("windows_all.csv"), index=False)
+            sweeps = [e["window_sweep"] for e in entries if e["window_sweep"] is not None]
+            if sweeps:
+                pd.concat(sweeps, ignore_index=True).to_csv(
+                    self._target("window_sweep_all.csv"), index=False)
+
+        # Generate QC report
+        ensemble_ci = ensemble_confidence(summary_all) if self.params.get("bootstrap") else None
+        qc_html = qc_report_html(summary_all, entries[-1]["meta"], warnings_, file_meta,
+                                 ensemble_ci)
+        self._target("qc_reports", "QC_report.html").write_text(qc_html, encoding="utf8")
+
+        # Save README
+        self._target("summary_README.txt").write_text(build_readme_text(), encoding="utf8")
@@ -0,0 +1,126 @@
+"""
+Per-file analysis pipeline for TrackMate SPT Analyzer.
+
+Bundles the analysis steps that run for every XML file so the GUI, the
+parallel scheduler and worker processes all compute exactly the same tables.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .analysis import (parse_trackmate_xml, track_statistics, rolling_window_analysis,
+                       _sorted_by_track)
+from .bins import STATES
+from .bootstrap import track_bootstrap
+from .steps import step_histograms
+from .spatial import NEIGHBOUR_RADIUS, add_neighbour_columns, neighbour_features
+
+# TrackMate features read with the spots when params["trackmate_features"] is set
+EDGE_FEATURES = ["SPEED", "DISPLACEMENT", "EDGE_TIME"]
+TRACK_FEATURES = ["TRACK_MEAN_SPEED", "TRACK_MAX_SPEED", "TOTAL_DISTANCE_TRAVELED"]
+
+LAG_OPTIONS = ("lag_policy", "max_lag", "lag_fraction", "loc_error")
+
+def parse_options(params: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Feature keyword arguments of `parse_trackmate_xml` for these params."""
+    if params.get("trackmate_features"):
+        return dict(edge_features=EDGE_FEATURES, track_features=TRACK_FEATURES)
+    return {}
+
+def load_spots(xml_file: Path, params: Dict[str, Any]
+               ) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    Parse one TrackMate XML (only the tracks that passed TrackMate's track
+    filters unless params["all_tracks"] is set; split / merging tracks cut
+    into linear segments unless params["linearize"] is False) and add the per-spot columns
+    that need all spots of the file (neighbour distance / density when
+    params["spatial"] is set), so the result can be analysed in track chunks
+    afterwards.
+    """
+    df, meta = parse_trackmate_xml(xml_file, all_tracks=bool(params.get("all_tracks")),
+                                   linearize=params.get("linearize", True),
+                                   **parse_options(params))
+    return add_file_columns(df, params), meta
+
+def add_file_columns(df: pd.DataFrame, params: Dict[str, Any]) -> pd.DataFrame:
+    """The part of `load_spots` that runs after parsing (for tables parsed in pieces)."""
+    if params.get("spatial"):
+        df = add_neighbour_columns(_sorted_by_track(df), params.get("radius", NEIGHBOUR_RADIUS))
+    return df
+
+def analyse_dataframe(df: pd.DataFrame, meta: Dict[str, float],
+                      params: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    """
+    Run all per-track analyses on a parsed spot table (or a track-aligned part of it).
+
+    `params` holds window, step, alpha_low, alpha_high, intensity (bool) and
+    optionally backend ("auto", "numpy" or "numba"), bootstrap (number of
+    resamples for per-track CIs of D and α, 0 = off), histograms (bool) and
+    spatial (bool; adds mean neighbour distance / density within radius) and
+    trackmate_features (bool; TrackMate's speeds and TOTAL_DISTANCE_TRAVELED
+    are taken from the XML, see `track_statistics`) and the MSD lag options
+    lag_policy, max_lag, lag_fraction and loc_error (see `analysis._lag_caps`).
+    Returns ``{"tracks", "windows"}`` plus ``"intensity"`` when requested and
+    the file has intensity values, and ``"steps"`` (additive step-length /
+    van Hove counts) when histograms are requested. window and step may be
+    lists to compare several window lengths in one run; ``"window_sweep"``
+    then holds the windows of all lengths (``window`` column) and
+    ``"windows"`` those of the first length.
+    """
+    has_intensity = bool(params.get("intensity", True)) and df["intensity"].notna().any()
+    backend = params.get("backend", "auto")
+    track_features = [f for f in ["parent_track", *parse_options(params).get("track_features", [])]
+                      if f in df]
+    lags = {key: params[key] for key in LAG_OPTIONS if params.get(key) is not None}
+    tables = track_statistics(df, meta["dt"], intensity=has_intensity, backend=backend,
+                              track_features=track_features, **lags)
+    if params.get("bootstrap"):
+        ci = track_bootstrap(df, meta["dt"], n_boot=int(params["bootstrap"]), **lags)
+        tables["tracks"] = tables["tracks"].merge(ci, on="track_id", how="left")
+    windows = rolling_window_analysis(df, params["window"], params["step"], meta["dt"],
+                                      (params["alpha_low"], params["alpha_high"]),
+                                      backend=backend)
+    if params.get("histograms"):
+        tables["steps"] = step_histograms(df)
+    if params.get("spatial"):
+        if "nn_dist" not in df:
+            df = add_neighbour_columns(df, params.get("radius", NEIGHBOUR_RADIUS))
+        tables["tracks"], windows = neighbour_features(
+            _sorted_by_track(df), tables["tracks"], windows,
+            windows["window"].to_numpy() if "window" in windows else params["window"])
+    if "window" in windows:
+        tables["window_sweep"] = windows
+        first = windows["window"] == np.atleast_1d(params["window"])[0]
+        windows = windows[first].drop(columns="window").reset_index(drop=True)
+    tables["windows"] = windows
+    return tables
+
+def analyse_file(xml_file: Path, params: Dict[str, Any]
+                 ) -> Tuple[Dict[str, pd.DataFrame], Dict[str, float]]:
+    """Load one TrackMate XML and run `analyse_dataframe` on it → (tables, meta)."""
+    df, meta = load_spots(xml_file, params)
+    return analyse_dataframe(df, meta, params), meta
+
+def file_summary(tables: Dict[str, pd.DataFrame]) -> Dict[str, float]:
+    """
+    One-line overview of a file's tables: number of tracks, mean D, mean α
+    (over tracks) and the fraction of sliding windows in each motion state
+    (also per window length, ``frac_<state>_w<length>``, for a window sweep).
+    """
+    tracks, windows = tables["tracks"], tables["windows"]
+    summary = {"n_tracks": len(tracks),
+               "D_mean": float(np.nanmean(tracks["D"])) if tracks["D"].notna().any() else np.nan,
+               "alpha_mean": float(np.nanmean(tracks["alpha"])) if tracks["alpha"].notna().any() else np.nan}
+    states = windows["state"].value_counts(normalize=True) if len(windows) else pd.Series(dtype=float)
+    for state in STATES:
+        summary[f"frac_{state}"] = float(states.get(state, 0.0))
+    if "window_sweep" in tables:
+        sweep = tables["window_sweep"]
+        for length, group in sweep.groupby("window", sort=False)["state"]:
+            states = group.value_counts(normalize=True)
+            for state in STATES:
+                summary[f"frac_{state}_w{length}"] = float(states.get(state, 0.0))
+    return summary
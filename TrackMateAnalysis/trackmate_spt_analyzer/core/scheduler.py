@@ -0,0 +1,264 @@
+"""
+Parallel scheduling of the per-file pipeline for TrackMate SPT Analyzer.
+
+Files are dispatched largest-first (by estimated spot count) to a process
+pool. A file big enough to hold up the whole batch is parsed in byte ranges
+by several workers at once (see `xmlparse`), its sorted coordinate arrays are placed in shared memory and its tracks are
+split into shards that different workers analyse. Results are yielded in
+the original file order, with shard tables re-assembled in track order.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .analysis import _sorted_by_track, _track_bounds, assemble_trackmate_xml, sidecar_is_current
+from .pipeline import add_file_columns, analyse_dataframe, analyse_file, load_spots, parse_options
+from .xmlparse import parse_chunk, plan_chunks
+
+FileResult = Tuple[Dict[str, pd.DataFrame], Dict[str, float]]
+
+# spot columns shared with shard workers (all stored as float64), followed by
+# any further columns of `load_spots` (neighbour columns, TrackMate features)
+SHARED_COLUMNS = ["track_id", "frame", "t_abs", "t", "x", "y", "z", "intensity"]
+INT_COLUMNS = ["track_id", "frame", "parent_track"]
+
+def _shared_columns(df: pd.DataFrame) -> List[str]:
+    return SHARED_COLUMNS + [c for c in df.columns if c not in SHARED_COLUMNS]
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing block without handing it to this process' resource tracker."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers the block again; `run_files` starts the resource
+        # tracker before the pool, so this lands in the parent's (shared) tracker
+        # as a no-op instead of a per-worker tracker that would report a leak.
+        return shared_memory.SharedMemory(name=name)
+
+def _shard_task(shm_name: str, n_rows: int, columns: List[str], lo: int, hi: int,
+                meta: Dict[str, float], params: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    """Worker: analyse rows lo:hi (whole tracks) of a file held in shared memory."""
+    shm = _attach(shm_name)
+    try:
+        rows = np.ndarray((n_rows, len(columns)), dtype=np.float64, buffer=shm.buf)[lo:hi].copy()
+    finally:
+        shm.close()
+    df = pd.DataFrame(rows, columns=columns)
+    for col in INT_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype(np.int64)
+    return analyse_dataframe(df, meta, params)
+
+def _to_shared(df: pd.DataFrame) -> shared_memory.SharedMemory:
+    """Copy the sorted spot columns into a new shared memory block."""
+    columns = _shared_columns(df)
+    shape = (len(df), len(columns))
+    shm = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+    np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[:] = df[columns].to_numpy(np.float64)
+    return shm
+
+def shard_bounds(track_ids: np.ndarray, n_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split a sorted track-id array into ≤ `n_shards` row ranges on track
+    boundaries with roughly equal MSD cost (∝ track length²).
+    """
+    starts, lengths = _track_bounds(track_ids)
+    if len(starts) == 0:
+        return []
+    cost = np.cumsum(lengths.astype(float) ** 2)
+    cuts = np.searchsorted(cost, cost[-1] * np.arange(1, n_shards) / n_shards, side="right")
+    edges = np.unique(np.r_[0, cuts, len(starts)])
+    bounds = np.r_[starts, len(track_ids)]
+    return [(int(bounds[a]), int(bounds[b])) for a, b in zip(edges[:-1], edges[1:])]
+
+def _merge_shards(parts: List[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    return {key: pd.concat([p[key] for p in parts if key in p], ignore_index=True)
+            for key in parts[0]}
+
+def _analyse_in_chunks(xml_file: Path, params: Dict[str, Any], chunk_spots: int,
+                       cancel: threading.Event) -> Optional[FileResult]:
+    """Serial counterpart of sharding: analyse a big file in track chunks, None if cancelled."""
+    df, meta = load_spots(xml_file, params)
+    if len(df) < chunk_spots:
+        return analyse_dataframe(df, meta, params), meta
+    df = _sorted_by_track(df)
+    parts = []
+    for lo, hi in shard_bounds(df["track_id"].to_numpy(), -(-len(df) // chunk_spots)):
+        if cancel.is_set():
+            return None
+        parts.append(analyse_dataframe(df.iloc[lo:hi], meta, params))
+    return _merge_shards(parts), meta
+
+def run_files(xml_files: Sequence[Path], params: Dict[str, Any], n_workers: int = 1,
+              estimates: Optional[Sequence[Optional[int]]] = None,
+              shard_min_spots: int = 50_000,
+              cancel: Optional[threading.Event] = None
+              ) -> Iterator[Tuple[int, Path, Union[FileResult, Exception]]]:
+    """
+    Analyse `xml_files` and yield ``(index, xml_file, (tables, meta) | exception)``
+    in input order.
+
+    With ``n_workers > 1`` files run in a process pool, largest estimated spot
+    count first. A file with at least `shard_min_spots` spots that is larger
+    than an even share of the total work is parsed in byte ranges and then
+    sharded by track across workers.
+    With one worker, files of at least `shard_min_spots` spots are analysed
+    in track chunks of about that size instead.
+
+    Setting `cancel` stops the run between files / track chunks: nothing new is
+    submitted, queued tasks are dropped, running tasks finish, and files that
+    are already complete are still yielded (possibly with gaps in the order).
+    """
+    xml_files = list(xml_files)
+    cancel = cancel or threading.Event()
+    if n_workers <= 1:
+        for i, xml_file in enumerate(xml_files):
+            if cancel.is_set():
+                return
+            try:
+                result = _analyse_in_chunks(xml_file, params, shard_min_spots, cancel)
+            except Exception as e:
+                yield i, xml_file, e
+                continue
+            if result is None:
+                return
+            yield i, xml_file, result
+        return
+
+    est = [float(e or 0) for e in (estimates or [None] * len(xml_files))]
+    total = sum(est)
+    seq = itertools.count()
+    pending: List[tuple] = []
+    for i, cost in enumerate(est):
+        kind = "parse" if cost >= shard_min_spots and cost > total / n_workers else "file"
+        heapq.heappush(pending, (-cost, next(seq), kind, (i,)))
+
+    in_flight: Dict[Any, tuple] = {}
+    results: Dict[int, Union[FileResult, Exception]] = {}
+    parsing: Dict[int, dict] = {}
+    shards: Dict[int, dict] = {}
+    next_out = 0
+
+    def _start_shards(i: int, df: pd.DataFrame, meta: Dict[str, float], cost: float):
+        df = _sorted_by_track(df)
+        bounds = shard_bounds(df["track_id"].to_numpy(), n_workers)
+        if len(bounds) <= 1:
+            results[i] = (analyse_dataframe(df, meta, params), meta)
+            return
+        shm = _to_shared(df)
+        shards[i] = dict(shm=shm, n_rows=len(df), columns=_shared_columns(df),
+                         meta=meta, parts=[None] * len(bounds))
+        for k, (lo, hi) in enumerate(bounds):
+            heapq.heappush(pending, (-cost, next(seq), "shard", (i, k, lo, hi)))
+
+    def _release(i: int):
+        parsing.pop(i, None)
+        state = shards.pop(i, None)
+        if state is not None:
+            state["shm"].close()
+            state["shm"].unlink()
+
+    # workers must share the parent's resource tracker (see `_attach`)
+    resource_tracker.ensure_running()
+    # spawn, not fork: forking after threaded (e.g. Numba) kernels ran can deadlock
+    pool = ProcessPoolExecutor(max_workers=n_workers,
+                               mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while (pending or in_flight) and not cancel.is_set():
+            # keep at most one task per worker queued so priorities are honoured
+            while pending and len(in_flight) < n_workers:
+                neg_cost, _, kind, payload = heapq.heappop(pending)
+                i = payload[0]
+                if kind == "file":
+                    fut = pool.submit(analyse_file, xml_files[i], params)
+                elif kind == "parse":
+                    chunks = []
+                    options = parse_options(params)
+                    if options or not sidecar_is_current(xml_files[i]):
+                        try:
+                            chunks, settings = plan_chunks(xml_files[i], n_workers,
+                                                           bool(params.get("all_tracks")))
+                        except Exception as e:
+                            results[i] = e
+                            continue
+                    if len(chunks) < 2:
+                        fut = pool.submit(load_spots, xml_files[i], params)
+                    else:
+                        # byte ranges of the XML are parsed in parallel, then joined here
+                        parsing[i] = dict(chunks=chunks, settings=settings, options=options,
+                                          parts=[None] * len(chunks))
+                        for k in range(len(chunks)):
+                            heapq.heappush(pending, (neg_cost, next(seq), "chunk", (i, k)))
+                        continue
+                elif kind == "chunk":
+                    state = parsing[i]
+                    fut = pool.submit(parse_chunk, xml_files[i], *state["chunks"][payload[1]],
+                                      **state["options"])
+                else:
+                    state = shards[i]
+                    fut = pool.submit(_shard_task, state["shm"].name, state["n_rows"],
+                                      state["columns"], payload[2], payload[3],
+                                      state["meta"], params)
+                in_flight[fut] = (kind, payload, -neg_cost)
+
+            # wake up regularly so a cancel request is noticed while tasks run
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, payload, cost = in_flight.pop(fut)
+                i = payload[0]
+                if i in results or (kind == "shard" and i not in shards) \
+                        or (kind == "chunk" and i not in parsing):
+                    continue  # file already failed in another shard / chunk
+                try:
+                    value = fut.result()
+                except Exception as e:
+                    results[i] = e
+                    _release(i)
+                    continue
+
+                if kind == "file":
+                    results[i] = value
+                elif kind == "parse":
+                    _start_shards(i, *value, cost)
+                elif kind == "chunk":
+                    state = parsing[i]
+                    state["parts"][payload[1]] = value
+                    if all(p is not None for p in state["parts"]):
+                        del parsing[i]
+                        try:
+                            df, meta = assemble_trackmate_xml(xml_files[i], state["chunks"],
+                                                              state["parts"], state["settings"],
+                                                              linearize=params.get("linearize", True),
+                                                              **state["options"])
+                            _start_shards(i, add_file_columns(df, params), meta, cost)
+                        except Exception as e:
+                            results[i] = e
+                else:
+                    state = shards[i]
+                    state["parts"][payload[1]] = value
+                    if all(p is not None for p in state["parts"]):
+                        results[i] = (_merge_shards(state["parts"]), state["meta"])
+                        _release(i)
+
+            while next_out in results:
+                yield next_out, xml_files[next_out], results.pop(next_out)
+                next_out += 1
+
+        # cancelled: hand out whatever finished, in file order
+        for i in sorted(results):
+            yield i, xml_files[i], results.pop(i)
+    finally:
+        for fut in in_flight:
+            fut.cancel()
+        pool.shutdown(wait=True)
+        for i in list(shards):
+            _release(i)
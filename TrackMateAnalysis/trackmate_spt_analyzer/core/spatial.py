@@ -0,0 +1,127 @@
+"""
+Spatial neighbour queries for TrackMate SPT Analyzer.
+
+All spots of a file go into one KD-tree in which every frame is moved far
+away from the others along an extra axis. The tree is built once per file,
+behaves like one tree per frame, and answers the queries of all spots in a
+single vectorized call: nearest-neighbour distance, neighbour counts and
+density within a radius, or the spots within a radius of arbitrary points.
+"""
+
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+NEIGHBOUR_RADIUS = 1.0   # µm
+
+# per-spot columns added by `add_neighbour_columns`
+NEIGHBOUR_COLUMNS = ["nn_dist", "n_within", "density"]
+
+class SpotIndex:
+    """Frame-partitioned KD-tree over the x/y (and z, if used) positions of a spot table."""
+
+    def __init__(self, df: pd.DataFrame):
+        from scipy.spatial import cKDTree
+
+        cols = ["x", "y"]
+        if "z" in df and np.nanmax(df["z"], initial=0) - np.nanmin(df["z"], initial=0) > 0:
+            cols.append("z")
+        self.dims = len(cols)
+        pts = np.nan_to_num(df[cols].to_numpy(dtype=float))
+        extent = float(np.ptp(pts, axis=0).max()) if len(pts) else 0.0
+        # any two spots of one frame are closer than `gap`, spots of different frames farther
+        self.gap = 10.0 * (extent * np.sqrt(self.dims) + 1.0)
+        self.frames = df["frame"].to_numpy()
+        self.points = np.c_[pts, self.frames * self.gap]
+        self.tree = cKDTree(self.points)
+
+    def _check(self, radius: float):
+        if not 0 < radius < self.gap:
+            raise ValueError(f"radius must be in (0, {self.gap:.3g}), got {radius}")
+
+    def nearest_neighbour(self):
+        """Distance to and row of the nearest other spot in the same frame (NaN / -1 if none)."""
+        if len(self.points) < 2:
+            return np.full(len(self.points), np.nan), np.full(len(self.points), -1)
+        dist, idx = self.tree.query(self.points, k=2)
+        dist, idx = dist[:, 1], idx[:, 1]
+        alone = dist >= self.gap
+        dist[alone] = np.nan
+        idx[alone] = -1
+        return dist, idx
+
+    def count_within(self, radius: float) -> np.ndarray:
+        """Number of other spots of the same frame within `radius` of every spot."""
+        self._check(radius)
+        return self.tree.query_ball_point(self.points, radius, return_length=True) - 1
+
+    def query_radius(self, points: np.ndarray, frames: np.ndarray,
+                     radius: float) -> List[np.ndarray]:
+        """
+        Rows of the spots within `radius` of each point ``points[i]`` (x, y and
+        z if the index uses it) in frame ``frames[i]``.
+        """
+        self._check(radius)
+        pts = np.c_[np.asarray(points, dtype=float), np.asarray(frames) * self.gap]
+        return [np.asarray(rows, dtype=int) for rows in self.tree.query_ball_point(pts, radius)]
+
+def add_neighbour_columns(df: pd.DataFrame, radius: float = NEIGHBOUR_RADIUS) -> pd.DataFrame:
+    """
+    Add nn_dist, n_within and density (neighbours per µm² – µm³ for 3-D data –
+    within `radius`) to every spot. Needs all spots of a file, so it runs
+    before the table is split into track chunks.
+
+    A branch spot that linearization copied into several segments (same
+    parent_track, frame and position) is indexed once and is not its own
+    neighbour; every copy gets the values of that spot.
+    """
+    keys = [c for c in ("parent_track", "frame", "x", "y", "z") if c in df]
+    spot = (df.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+            if "parent_track" in df else np.arange(len(df)))
+    first = np.unique(spot, return_index=True)[1]
+    index = SpotIndex(df.iloc[first])
+    n_within = index.count_within(radius)
+    volume = np.pi * radius ** 2 if index.dims == 2 else 4 / 3 * np.pi * radius ** 3
+    return df.assign(nn_dist=index.nearest_neighbour()[0][spot], n_within=n_within[spot],
+                     density=(n_within / volume)[spot])
+
+def _mean_per_range(values: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """NaN-ignoring mean of values[lo:hi] for many ranges via prefix sums."""
+    ok = np.isfinite(values)
+    s = np.r_[0.0, np.cumsum(np.where(ok, values, 0.0))]
+    c = np.r_[0, np.cumsum(ok)]
+    n = c[hi] - c[lo]
+    return np.divide(s[hi] - s[lo], n, out=np.full(len(lo), np.nan), where=n > 0)
+
+def neighbour_features(df: pd.DataFrame, tracks: pd.DataFrame, windows: pd.DataFrame,
+                       window: Union[int, np.ndarray]):
+    """
+    Mean nn_dist and density per track and per sliding window.
+
+    `df` must carry the columns of `add_neighbour_columns` and be sorted by
+    (track_id, frame); `window` is the window length, or one length per row
+    of `windows` (window-length sweep). Returns the `tracks` and `windows`
+    tables with nn_dist_mean and density_mean added.
+    """
+    tid = df["track_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, tid[1:] != tid[:-1]]) if len(tid) else np.empty(0, int)
+    ends = np.r_[starts[1:], len(tid)].astype(int)
+
+    # tracks: all of their rows
+    k = pd.Series(np.arange(len(starts)), index=tid[starts]).loc[tracks["track_id"]].to_numpy()
+    ranges = [(tracks, starts[k], ends[k])]
+    # windows: `window` rows from the window's first point on
+    row = pd.Series(np.arange(len(df)),
+                    index=pd.MultiIndex.from_arrays([tid, df["frame"].to_numpy()]))
+    first = (row.loc[list(zip(windows["track_id"], windows["frame_start"]))].to_numpy()
+             if len(windows) else np.empty(0, int))
+    ranges.append((windows, first, first + window))
+
+    out = []
+    for table, lo, hi in ranges:
+        table = table.copy()
+        for col in ("nn_dist", "density"):
+            table[f"{col}_mean"] = _mean_per_range(df[col].to_numpy(dtype=float), lo, hi)
+        out.append(table)
+    return tuple(out)
@@ -0,0 +1,133 @@
+"""
+Step-length and van Hove distributions for TrackMate SPT Analyzer.
+
+Displacements over a few lags are histogrammed per file straight from the
+sorted coordinate arrays, one lag at a time, onto fixed bin edges. The
+resulting counts are additive (like the sums in `bins`), so histograms of
+shards, files and worker processes are merged by adding them up, and only
+the histograms are kept – never the displacements of a whole experiment.
+
+Pooled step-length (jump-distance) histograms are fitted with 1…K
+diffusing populations,
+
+    p(r, τ) = Σ_k f_k · r / (2 D_k τ) · exp(−r² / (4 D_k τ)),
+
+by expectation-maximisation on the binned counts, vectorized over bins and
+components.
+"""
+
+from typing import Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .analysis import _sorted_by_track
+
+LAGS = (1, 2, 4, 8)
+BIN_WIDTH = 0.005      # µm
+N_BINS = 400           # step lengths up to 2 µm, van Hove ±2 µm
+
+HIST_COLUMNS = ["kind", "lag", "bin", "count"]
+
+def _displacements(tid: np.ndarray, frame: np.ndarray, xy: np.ndarray, lag: int) -> np.ndarray:
+    """Displacement vectors between points exactly `lag` frames apart in the same track."""
+    if len(tid) <= lag:
+        return np.empty((0, xy.shape[1]))
+    ok = (tid[lag:] == tid[:-lag]) & (frame[lag:] - frame[:-lag] == lag)
+    return (xy[lag:] - xy[:-lag])[ok]
+
+def step_histograms(df: pd.DataFrame, lags: Sequence[int] = LAGS,
+                    bin_width: float = BIN_WIDTH, n_bins: int = N_BINS) -> pd.DataFrame:
+    """
+    Additive displacement histograms of one file (or a track-aligned part of it).
+
+    Rows with kind "step" count step lengths r on ``[0, n_bins·bin_width)``,
+    kind "vanhove" the 1-D displacements Δx and Δy (pooled) on
+    ``[−n_bins·bin_width, n_bins·bin_width)``. Values outside the range are
+    counted in the outermost bins. Only pairs exactly `lag` frames apart
+    within a track are used, so gaps do not blur the distributions.
+    """
+    df = _sorted_by_track(df)
+    tid = df["track_id"].to_numpy()
+    frame = df["frame"].to_numpy()
+    xy = df[["x", "y"]].to_numpy(dtype=float)
+
+    parts = []
+    for lag in lags:
+        d = _displacements(tid, frame, xy, lag)
+        r = np.sqrt(np.square(d).sum(1))
+        step_idx = np.clip((r / bin_width).astype(np.int64), 0, n_bins - 1)
+        vh_idx = np.clip(np.floor(d.ravel() / bin_width).astype(np.int64) + n_bins, 0, 2 * n_bins - 1)
+        for kind, idx, size in (("step", step_idx, n_bins), ("vanhove", vh_idx, 2 * n_bins)):
+            parts.append(pd.DataFrame({"kind": kind, "lag": lag, "bin": np.arange(size),
+                                       "count": np.bincount(idx, minlength=size)}))
+    if not parts:
+        return pd.DataFrame(columns=HIST_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values(["kind", "lag", "bin"], ignore_index=True)
+
+def merge_step_histograms(hists: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Add histograms of several shards / files (aligned on kind, lag and bin)."""
+    hists = [h for h in hists if len(h)]
+    if not hists:
+        return pd.DataFrame(columns=HIST_COLUMNS)
+    return (pd.concat(hists, ignore_index=True)
+            .groupby(["kind", "lag", "bin"], as_index=False, sort=True)["count"].sum())
+
+def finalize_step_histograms(hist: pd.DataFrame, bin_width: float = BIN_WIDTH,
+                             n_bins: int = N_BINS) -> pd.DataFrame:
+    """Add bin edges (µm) and probability densities to merged counts."""
+    out = hist.copy()
+    offset = np.where(out["kind"] == "vanhove", n_bins, 0)
+    out["lo"] = (out["bin"] - offset) * bin_width
+    out["hi"] = out["lo"] + bin_width
+    total = out.groupby(["kind", "lag"])["count"].transform("sum")
+    out["density"] = np.divide(out["count"], total * bin_width,
+                               out=np.full(len(out), np.nan), where=total > 0)
+    return out[["kind", "lag", "bin", "lo", "hi", "count", "density"]]
+
+def fit_jump_distances(hist: pd.DataFrame, dt: float, max_components: int = 3,
+                       n_iter: int = 500, bin_width: float = BIN_WIDTH) -> pd.DataFrame:
+    """
+    Fit 1…`max_components` populations to every pooled step-length histogram.
+
+    Returns one row per (lag, n_components, component) with D, fraction, the
+    log-likelihood and BIC of the model (lower BIC = preferred number of
+    populations). The outermost (overflow) bin is left out of the fit.
+    """
+    rows = []
+    steps = hist[hist["kind"] == "step"]
+    for lag, h in steps.groupby("lag", sort=True):
+        h = h.sort_values("bin")
+        c = h["count"].to_numpy(dtype=float)[:-1]
+        r = (h["bin"].to_numpy(dtype=float)[:-1] + 0.5) * bin_width
+        n = c.sum()
+        if n == 0:
+            continue
+        tau = lag * dt
+        D_all = (c * r ** 2).sum() / (4 * tau * n)
+        for K in range(1, max_components + 1):
+            D = D_all * np.geomspace(0.1, 3.0, K) if K > 1 else np.array([D_all])
+            f = np.full(K, 1.0 / K)
+            for _ in range(n_iter):
+                dens = (f[:, None] * r / (2 * D[:, None] * tau)
+                        * np.exp(-r ** 2 / (4 * D[:, None] * tau)))
+                total = dens.sum(0)
+                resp = np.divide(dens, total, out=np.zeros_like(dens), where=total > 0) * c
+                mass = resp.sum(1)
+                f_new = mass / n
+                D_new = np.divide((resp * r ** 2).sum(1), 4 * tau * mass,
+                                  out=D.copy(), where=mass > 0)
+                converged = np.allclose(D_new, D, rtol=1e-8) and np.allclose(f_new, f, atol=1e-10)
+                D, f = D_new, f_new
+                if converged:
+                    break
+            dens = (f[:, None] * r / (2 * D[:, None] * tau)
+                    * np.exp(-r ** 2 / (4 * D[:, None] * tau))).sum(0)
+            loglik = float((c * np.log(np.maximum(dens * bin_width, 1e-300))).sum())
+            bic = -2 * loglik + (2 * K - 1) * np.log(n)
+            order = np.argsort(D)
+            for k, j in enumerate(order):
+                rows.append(dict(lag=int(lag), tau=tau, n_components=K, component=k + 1,
+                                 D=D[j], fraction=f[j], n_steps=int(n),
+                                 loglik=loglik, bic=bic))
+    return pd.DataFrame(rows)
@@ -5,12 +5,14 @@ Contains helper functions for file operations, timestamps, and report generation
 """
 
 import io
+import os
+import re
 import datetime as dt
 import textwrap
 import html
 import warnings
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 
 import pandas as pd
 
@@ -42,9 +44,14 @@ Column glossary + formulas
 ------------------------------------------------------------
 
 file       – TrackMate XML file name
-track_id   – integer ID assigned by TrackMate
+track_id   – integer ID assigned by TrackMate; tracks that split or merge
+             are cut into linear segments between branch points, which get
+             new IDs above the largest TrackMate ID
+parent_track – TrackMate ID of the track a segment belongs to (= track_id
+             for tracks without splits / merges)
 n_pts      – number of localisation points (N) in the track
 dur_s      – N · dt     (dt = frame interval)
+t_start    – time of the first point of the track (s, relative to file start)
 
 D          – *effective* diffusion coefficient      [µm²·s⁻¹]
              Estimated from the ensemble MSD fit:
@@ -56,6 +63,12 @@ D          – *effective* diffusion coefficient      [µm²·s⁻¹]
              Obtained as the slope of log(MSD) vs log(τ):
                  α  =  d[log(MSD)] / d[log(τ)]
 
+n_lags     – number of lags τ = 1 … n_lags·dt used in the MSD fit, set by
+             the "MSD Lags" choice: all (N – 1), the first 25 % of N, or the
+             optimal number for the track's localisation error x = σ²/(D·dt)
+             (Michalet 2010):  n_lags ≈ min(2 + 2.7·√x, 0.8 + 0.564·N),
+             with σ² from "Loc. Error" or estimated as (2·MSD(1) – MSD(2)) / 4
+
 Rg         – radius of gyration of the track         [µm]
                  Rg²  =  (1/N) · Σ_{i=1..N} ( (x_i – x̄)² + (y_i – ȳ)² )
 
@@ -65,6 +78,21 @@ v_mean     – mean instantaneous velocity             [µm·s⁻¹]
 v_max      – maximum instantaneous velocity          [µm·s⁻¹]
                  v_max   =  max_i ( Δr_i / dt )
 
+D_ci_lo, D_ci_hi,
+alpha_ci_lo, alpha_ci_hi
+           – 95 % bootstrap confidence interval of D and α (only with
+             "Bootstrap CIs" enabled). Each resample weights all
+             displacements starting at a localisation with a Poisson(1)
+             weight and repeats the log-log fit; the bounds are the 2.5 /
+             97.5 percentiles over 1000 resamples. The QC report adds
+             CIs of the mean D and α per file (resampling tracks).
+
+TRACK_MEAN_SPEED, TRACK_MAX_SPEED, TOTAL_DISTANCE_TRAVELED
+           – TrackMate's own track features, read from the XML (only with
+             "Use TrackMate Speeds / Distance"). TrackMate measures in x, y
+             and z and divides each link by its own time span. For planar
+             data the two speeds replace v_mean / v_max and are not repeated.
+
 pixel      – pixel size used to convert TrackMate positions   [µm·px⁻¹]
 dt         – frame interval (median Δt from `POSITION_T`)     [s]
 
@@ -72,7 +100,11 @@ dt         – frame interval (median Δt from `POSITION_T`)     [s]
 Sliding-window metrics (in per-window CSVs)
 ------------------------------------------------------------
 
+window        window length in frames (only in window_sweep CSVs, which
+              hold every window length of a sweep; windows CSVs use the
+              first length)
 frame_start   first frame of the window
+t_start       time of the first frame of the window (s)
 alpha         local exponent computed on that window
 state         motion class:
                  static      if   α ≤ α_low
@@ -80,6 +112,50 @@ state         motion class:
                  active      if   α > α_high
                (α_low / α_high set in the GUI)
 
+------------------------------------------------------------
+Time bins (bins/<file>__bins.csv, bins/bins_all.csv)
+------------------------------------------------------------
+
+Windows are assigned to the bin containing t_start, tracks to the bin
+containing their first point. bins_all.csv pools all files.
+
+t_lo, t_hi        bin edges (s); width set in the GUI
+n_windows         number of windows starting in the bin
+frac_<state>      fraction of those windows in each motion state
+alpha_mean/std    mean / standard deviation of window α
+n_tracks          number of tracks starting in the bin
+D_mean, v_mean    mean D and v_mean of those tracks
+
+------------------------------------------------------------
+Neighbour features (with "Neighbour / Density Features")
+------------------------------------------------------------
+
+For every spot, among the other spots of the same frame (x, y and z when
+the data has z):
+
+nn_dist           distance to the nearest other spot              [µm]
+density           number of other spots within r = 1 µm, divided by
+                  π r² (4/3 π r³ for 3-D data)                    [µm⁻² / µm⁻³]
+
+nn_dist_mean, density_mean
+                  mean of these over the track (summary_all.csv) or over
+                  the points of a sliding window (per-window CSVs)
+
+------------------------------------------------------------
+Step lengths (steps/, with "Step-Length / van Hove Histograms")
+------------------------------------------------------------
+
+Histograms pooled over all files, for lags of 1, 2, 4 and 8 frames, using
+only point pairs exactly `lag` frames apart within a track.
+Bin width 0.005 µm; the outermost bins also hold everything beyond them.
+
+step_lengths.csv      r = |Δr| over the lag: count and density per bin
+van_hove.csv          1-D displacements Δx and Δy (pooled), ±2 µm
+jump_distance_fits.csv
+                      fits of  p(r) = Σ_k f_k · r/(2 D_k τ) · exp(−r²/(4 D_k τ))
+                      with 1–3 populations (τ = lag · median dt);
+                      the model with the lowest BIC is preferred
+
 ------------------------------------------------------------
 Abbreviations
 ------------------------------------------------------------
@@ -101,14 +177,66 @@ def save_with_suffix(path: Path, suffix: str = "") -> Path:
     warnings.warn(f"File {path.name} exists → writing to {new_path.name} instead.")
     return new_path
 
+# folders written by the analyzer / batch spotter that never hold tracking results
+SKIP_DIRS = {"analysis", "detected_spots"}
+
+_ALL_SPOTS_RE = re.compile(rb'<AllSpots[^>]*?nspots="(\d+)"')
+_ADDED_SPOTS_RE = re.compile(rb"Added (\d+) spots")
+
+def iter_xml_files(folder: Path, recursive: bool = False) -> Iterator[Path]:
+    """Yield *.xml files in `folder` as they are found (sub-folders if `recursive`)."""
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(d for d in dirnames
+                             if recursive and d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(filenames):
+            if name.lower().endswith(".xml"):
+                yield Path(dirpath) / name
+
+def estimate_spot_count(xml_path: Path, block_size: int = 1 << 16,
+                        max_bytes: int = 64 << 20) -> Optional[int]:
+    """
+    Cheap workload estimate: read the XML head until ``<AllSpots nspots="N">``.
+
+    Falls back to the last ``Added N spots`` line of the TrackMate log if the
+    tag is not found within `max_bytes`. Returns None if neither is present.
+    """
+    added = None
+    tail = b""
+    with open(xml_path, "rb") as fh:
+        for _ in range(max(1, max_bytes // block_size)):
+            block = fh.read(block_size)
+            if not block:
+                break
+            chunk = tail + block
+            m = _ALL_SPOTS_RE.search(chunk)
+            if m:
+                return int(m.group(1))
+            for m in _ADDED_SPOTS_RE.finditer(chunk):
+                added = int(m.group(1))
+            tail = chunk[-256:]
+    return added
+
 def qc_report_html(summary_df: pd.DataFrame, meta: Dict[str, float],
-                   warnings_: List[str]) -> str:
-    """Return HTML string containing a tiny QC report."""
+                   warnings_: List[str], file_meta: Optional[pd.DataFrame] = None,
+                   ensemble_ci: Optional[pd.DataFrame] = None) -> str:
+    """
+    Return HTML string containing a tiny QC report.
+
+    `file_meta` (one row of parser metadata per file: dt, its spread, dropped
+    frames, …) is shown as an acquisition table when given, `ensemble_ci`
+    (see `bootstrap.ensemble_confidence`) as a table of mean D / α with CIs.
+    """
     buf = io.StringIO()
     buf.write("<h2>TrackMate SPT Analyzer – QC Report</h2>")
     buf.write(f"<p><b>Generated:</b> {timestamp('%Y-%m-%d %H:%M:%S')}</p>")
     buf.write("<h3>Dataset overview</h3>")
     buf.write(summary_df.describe().to_html(float_format="%.3g"))
+    if file_meta is not None and len(file_meta):
+        buf.write("<h3>Acquisition per file</h3>")
+        buf.write(file_meta.to_html(index=False, float_format="%.4g"))
+    if ensemble_ci is not None and len(ensemble_ci):
+        buf.write("<h3>Mean D and α with 95 % bootstrap confidence intervals</h3>")
+        buf.write(ensemble_ci.to_html(index=False, float_format="%.4g"))
     if warnings_:
         buf.write("<h3>Warnings</h3><ul>")
         for w in warnings_:
@@ -0,0 +1,171 @@
+"""
+Watch-folder mode for TrackMate SPT Analyzer.
+
+Polls an acquisition folder for TrackMate XML files while they are being
+written, analyses every new or changed file once it is complete, and
+refreshes the pooled tables of one output folder (summary_all, bins,
+merged windows, QC report) after each batch, so results follow the
+acquisition instead of waiting for a full re-run at the end of the day.
+
+    python -m trackmate_spt_analyzer.core.watch FOLDER [--window 5] [--workers 4]
+"""
+
+import argparse
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .outputs import RunOutputs
+from .scheduler import FileResult, run_files
+from .utils import estimate_spot_count, iter_xml_files, timestamp
+
+POLL_S = 10.0     # seconds between folder scans
+SETTLE_S = 30.0   # a file must be unmodified this long before it is analysed
+
+def is_complete(xml_path: Path, tail_bytes: int = 4096) -> bool:
+    """True if the file ends with the closing </TrackMate> tag, i.e. TrackMate finished writing it."""
+    with open(xml_path, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        fh.seek(max(0, fh.tell() - tail_bytes))
+        return b"</TrackMate>" in fh.read()
+
+class FolderWatcher:
+    """
+    Polling scan of `folder` for XML files that are new or changed since
+    they were last reported and completely written: same size and mtime as
+    at the previous poll, not modified for `settle_s` seconds and closed by
+    ``</TrackMate>``.
+    """
+
+    def __init__(self, folder: Path, recursive: bool = False, settle_s: float = SETTLE_S):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.settle_s = settle_s
+        # (size, mtime_ns) of every file at the previous poll / when it was reported
+        self._last: Dict[Path, Tuple[int, int]] = {}
+        self._reported: Dict[Path, Tuple[int, int]] = {}
+
+    def poll(self) -> List[Path]:
+        """Scan once → files that became ready since the previous poll."""
+        now = time.time()
+        seen, ready = {}, []
+        for path in iter_xml_files(self.folder, self.recursive):
+            try:
+                st = path.stat()
+                sig = (st.st_size, st.st_mtime_ns)
+                seen[path] = sig
+                if (self._reported.get(path) != sig and self._last.get(path) == sig
+                        and now - st.st_mtime >= self.settle_s and is_complete(path)):
+                    self._reported[path] = sig
+                    ready.append(path)
+            except OSError:  # removed or replaced while scanning; seen again next poll
+                continue
+        self._last = seen
+        return ready
+
+def watch_folder(folder: Path, params: Dict[str, Any], out_root: Optional[Path] = None,
+                 bin_s: float = 30.0, n_workers: int = 1, recursive: bool = False,
+                 merge_windows: bool = True, poll_s: float = POLL_S, settle_s: float = SETTLE_S,
+                 stop: Optional[threading.Event] = None,
+                 on_file: Optional[Callable[[Path, Union[FileResult, Exception]], None]] = None,
+                 max_polls: Optional[int] = None) -> Path:
+    """
+    Analyse the XML files of `folder` as they are completed until `stop` is set.
+
+    Ready files (see `FolderWatcher`) are analysed with `run_files` and the
+    usual `params`; their per-file CSVs and the pooled tables in `out_root`
+    (default: ``folder/analysis/watch_<timestamp>``) are overwritten in place
+    after every batch, a changed file replacing its earlier results.
+    `on_file(xml_file, (tables, meta) | exception)` is called for every
+    analysed file. Stops after `max_polls` folder scans if given (a file is
+    ready at the earliest on the second scan that sees it); returns the
+    output folder.
+    """
+    folder = Path(folder)
+    out = RunOutputs(out_root or folder / "analysis" / f"watch_{timestamp()}", params, bin_s,
+                     merge_windows=merge_windows, overwrite=True)
+    watcher = FolderWatcher(folder, recursive, settle_s)
+    stop = stop or threading.Event()
+    warnings_: Dict[str, List[str]] = {}
+    n_polls = 0
+    while not stop.is_set():
+        ready = watcher.poll()
+        n_polls += 1
+        if ready:
+            estimates = []
+            for xml_file in ready:
+                try:
+                    estimates.append(estimate_spot_count(xml_file))
+                except OSError:
+                    estimates.append(None)
+            for _, xml_file, result in run_files(ready, params, n_workers, estimates, cancel=stop):
+                if isinstance(result, Exception):
+                    out.remove_file(xml_file)
+                    warnings_[str(xml_file)] = [f"Failed to analyse {xml_file.name}: {result}"]
+                else:
+                    warnings_[str(xml_file)] = out.add_file(xml_file, *result)
+                if on_file is not None:
+                    on_file(xml_file, result)
+            out.write_summaries([w for file_warnings in warnings_.values() for w in file_warnings])
+        if max_polls is not None and n_polls >= max_polls:
+            break
+        stop.wait(poll_s)
+    return out.out_root
+
+def main():
+    """Command line: watch a folder and print one line per analysed file until Ctrl+C."""
+    from .pipeline import file_summary
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder", type=Path, help="acquisition folder with TrackMate XML files")
+    parser.add_argument("--out", type=Path, help="output folder (default: FOLDER/analysis/watch_<time>)")
+    parser.add_argument("--window", type=int, nargs="+", default=[5],
+                        help="sliding-window length(s) in frames")
+    parser.add_argument("--step", type=int, nargs="+", default=[1],
+                        help="window step(s) in frames, one or one per window length")
+    parser.add_argument("--alpha-low", type=float, default=0.2, help="α static threshold")
+    parser.add_argument("--alpha-high", type=float, default=1.2, help="α active threshold")
+    parser.add_argument("--bin", type=float, default=30.0, help="time-bin width (s)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--recursive", action="store_true", help="include sub-folders")
+    parser.add_argument("--bootstrap", type=int, default=0, help="bootstrap resamples (0 = off)")
+    parser.add_argument("--histograms", action="store_true", help="step-length histograms")
+    parser.add_argument("--spatial", action="store_true", help="neighbour / density features")
+    parser.add_argument("--lag-policy", default="all", choices=["all", "fraction", "optimal"],
+                        help="lags used in the per-track MSD fit")
+    parser.add_argument("--loc-error", type=float, help="localisation error (µm) for --lag-policy optimal")
+    parser.add_argument("--poll", type=float, default=POLL_S, help="seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=SETTLE_S,
+                        help="seconds a file must be unmodified before it is analysed")
+    parser.add_argument("--once", action="store_true",
+                        help="analyse the files that are complete now (two scans), then exit")
+    args = parser.parse_args()
+
+    params = dict(window=args.window[0] if len(args.window) == 1 else args.window,
+                  step=args.step[0] if len(args.step) == 1 else args.step, alpha_low=args.alpha_low,
+                  alpha_high=args.alpha_high, intensity=True, bootstrap=args.bootstrap,
+                  histograms=args.histograms, spatial=args.spatial, lag_policy=args.lag_policy,
+                  loc_error=args.loc_error)
+
+    def report(xml_file, result):
+        if isinstance(result, Exception):
+            print(f"{xml_file.name}: failed ({result})", flush=True)
+        else:
+            s = file_summary(result[0])
+            print(f"{xml_file.name}: {s['n_tracks']} tracks, D̄ = {s['D_mean']:.4g}, "
+                  f"ᾱ = {s['alpha_mean']:.2f}", flush=True)
+
+    out_root = args.out or args.folder / "analysis" / f"watch_{timestamp()}"
+    print(f"Watching {args.folder} (Ctrl+C to stop)", flush=True)
+    try:
+        watch_folder(args.folder, params, out_root, args.bin, args.workers, args.recursive,
+                     poll_s=args.poll, settle_s=args.settle, on_file=report,
+                     max_polls=2 if args.once else None)
+    except KeyboardInterrupt:
+        pass
+    print(f"Outputs in: {out_root.resolve()}")
+
+if __name__ == "__main__":
+    main()
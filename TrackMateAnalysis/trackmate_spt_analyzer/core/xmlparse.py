@@ -0,0 +1,216 @@
+"""
+Block-wise reading of TrackMate XML files for TrackMate SPT Analyzer.
+
+TrackMate keeps all spots in ``<SpotsInFrame>`` blocks under ``<AllSpots>``
+and all links in ``<Track>`` blocks under ``<AllTracks>``. One regex scan
+over the memory-mapped file finds where every block starts; consecutive
+blocks are grouped into byte ranges of similar size that parse on their own
+into column arrays – in worker processes for big files – and the arrays of
+all ranges are concatenated. Only one range is held as an element tree at
+a time, instead of the whole document. Precomputed TrackMate edge and track
+features are read in the same pass when asked for.
+
+The scan also reads the ID set of ``<FilteredTracks>`` (the tracks kept by
+TrackMate's track filters) and leaves the blocks of all other tracks out of
+the ranges, so they are never parsed.
+"""
+
+import mmap
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Columns = Dict[str, np.ndarray]
+# ("spots" | "tracks", (n, 2) array of byte spans parsed together)
+Chunk = Tuple[str, np.ndarray]
+
+# upper bound for the size of one parsed range
+CHUNK_BYTES = 64 << 20
+
+_SECTIONS = {
+    "spots": (b"<AllSpots", b"</AllSpots>", re.compile(rb"<SpotsInFrame[\s/>]")),
+    "tracks": (b"<AllTracks", b"</AllTracks>",
+               re.compile(rb'<Track[\s/>][^>]*?\bTRACK_ID="(-?\d+)"')),
+}
+_TRACK_ID = re.compile(rb'TRACK_ID="(-?\d+)"')
+
+def _blocks(mm: mmap.mmap, section: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(n, 2) byte offsets (start, end) of the blocks of one section + their track IDs."""
+    open_tag, close_tag, pattern = _SECTIONS[section]
+    lo = mm.find(open_tag)
+    hi = mm.find(close_tag, max(lo, 0))
+    if lo < 0 or hi < 0:  # missing or self-closing (empty) section
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    matches = list(pattern.finditer(mm, lo, hi))
+    starts = np.array([m.start() for m in matches], dtype=np.int64)
+    ids = np.array([int(m.group(1)) if m.groups() else -1 for m in matches], dtype=np.int64)
+    return np.c_[starts, np.r_[starts[1:], hi]].astype(np.int64), ids
+
+def filtered_track_ids(mm: mmap.mmap) -> Optional[np.ndarray]:
+    """Sorted IDs listed in <FilteredTracks>, or None if the file has no such element."""
+    lo = mm.find(b"<FilteredTracks")
+    if lo < 0:
+        return None
+    hi = mm.find(b"</FilteredTracks>", lo)
+    if hi < 0:  # <FilteredTracks /> – every track was filtered out
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.array([int(m.group(1)) for m in _TRACK_ID.finditer(mm, lo, hi)],
+                              dtype=np.int64))
+
+def _group(blocks: np.ndarray, n_chunks: int) -> List[np.ndarray]:
+    """
+    Split the (ascending) blocks into ≤ `n_chunks` groups of similar size
+    and merge adjacent blocks of each group into byte spans.
+    """
+    if len(blocks) == 0:
+        return []
+    size = np.cumsum(blocks[:, 1] - blocks[:, 0])
+    n_chunks = max(n_chunks, -(-int(size[-1]) // CHUNK_BYTES))
+    cuts = np.searchsorted(size, size[-1] * np.arange(1, n_chunks) / n_chunks, side="right")
+    edges = np.unique(np.r_[0, cuts, len(blocks)])
+    groups = []
+    for a, b in zip(edges[:-1], edges[1:]):
+        g = blocks[a:b]
+        first = np.flatnonzero(np.r_[True, g[1:, 0] != g[:-1, 1]])
+        last = np.r_[first[1:], len(g)] - 1
+        groups.append(np.c_[g[first, 0], g[last, 1]])
+    return groups
+
+def plan_chunks(xml_path: Path, n_chunks: int = 1,
+                all_tracks: bool = False) -> Tuple[List[Chunk], Tuple[int, int]]:
+    """
+    Scan a TrackMate XML once → (chunks, settings range).
+
+    `chunks` are ``("spots" | "tracks", spans)`` pairs, about `n_chunks` per
+    section (more if one would exceed CHUNK_BYTES), whose byte spans hold
+    whole blocks. Unless `all_tracks` is set, only the tracks listed in
+    ``<FilteredTracks>`` are included (all of them if the file has none).
+    The settings range covers the elements after ``<Model>`` (Settings,
+    GUIState, …) for `parse_settings`.
+    """
+    with open(xml_path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm.find(b"<AllSpots") < 0:
+            raise ValueError(f"{Path(xml_path).name} is not a TrackMate XML file (no <AllSpots>)")
+        keep = None if all_tracks else filtered_track_ids(mm)
+        chunks = []
+        for section in _SECTIONS:
+            blocks, ids = _blocks(mm, section)
+            if section == "tracks" and keep is not None:
+                blocks = blocks[np.isin(ids, keep)]
+            chunks += [(section, spans) for spans in _group(blocks, n_chunks)]
+        model_end = mm.find(b"</Model>")
+        file_end = mm.rfind(b"</TrackMate>")
+        if model_end < 0 or file_end < model_end:
+            return chunks, (0, 0)
+        return chunks, (model_end + len(b"</Model>"), file_end)
+
+def _parse_spans(xml_path: Path, spans: Sequence[Tuple[int, int]]) -> ET.Element:
+    """Element tree of the bytes of all (start, end) spans, wrapped in one <chunk> root."""
+    parser = ET.XMLParser()
+    parser.feed(b"<chunk>")
+    with open(xml_path, "rb") as fh:
+        for start, end in spans:
+            fh.seek(start)
+            parser.feed(fh.read(end - start))
+    parser.feed(b"</chunk>")
+    return parser.close()
+
+def _spot_columns(root: ET.Element, spot_features: Sequence[str]) -> Columns:
+    spots = [sp.attrib for sp in root.iter("Spot")]
+    cols = {
+        "spot_id": np.array([int(a["ID"]) for a in spots], dtype=np.int64),
+        "frame": np.array([int(a["FRAME"]) for a in spots], dtype=np.int64),
+        "t_abs": np.array([float(a.get("POSITION_T", np.nan)) for a in spots]),
+        "x": np.array([float(a["POSITION_X"]) for a in spots]),
+        "y": np.array([float(a["POSITION_Y"]) for a in spots]),
+        "z": np.array([float(a.get("POSITION_Z", 0)) for a in spots]),
+        "intensity": np.array([float(a.get("MEAN_INTENSITY_CH1", a.get("MEAN_INTENSITY", np.nan)))
+                               for a in spots]),
+    }
+    for feat in spot_features:
+        cols[feat] = np.array([float(a.get(feat, np.nan)) for a in spots])
+    return cols
+
+def _edge_columns(root: ET.Element, edge_features: Sequence[str],
+                  track_features: Sequence[str]) -> Columns:
+    track_id, source, target = [], [], []
+    edge_values: List[List[float]] = [[] for _ in edge_features]
+    track_values: List[List[float]] = [[] for _ in track_features]
+    for trk in root.iter("Track"):
+        tid = int(trk.get("TRACK_ID"))
+        edges = trk.findall("Edge")
+        track_id.extend([tid] * len(edges))
+        for values, feat in zip(track_values, track_features):
+            values.extend([float(trk.get(feat, np.nan))] * len(edges))
+        for edge in edges:
+            source.append(int(edge.get("SPOT_SOURCE_ID")))
+            target.append(int(edge.get("SPOT_TARGET_ID")))
+            for values, feat in zip(edge_values, edge_features):
+                values.append(float(edge.get(feat, np.nan)))
+    cols = {"track_id": np.array(track_id, dtype=np.int64),
+            "source": np.array(source, dtype=np.int64),
+            "target": np.array(target, dtype=np.int64)}
+    for feat, values in zip([*edge_features, *track_features], [*edge_values, *track_values]):
+        cols[feat] = np.array(values, dtype=float)
+    return cols
+
+def parse_chunk(xml_path: Path, section: str, spans: np.ndarray,
+                spot_features: Sequence[str] = (), edge_features: Sequence[str] = (),
+                track_features: Sequence[str] = ()) -> Columns:
+    """
+    Worker: parse one chunk of `plan_chunks` → column arrays.
+
+    Spot ranges give spot_id, frame, t_abs, x, y, z (in file units),
+    intensity and the requested spot features; track ranges give one row
+    per edge with track_id, source and target spot IDs, the requested edge
+    features and the requested track features (repeated for every edge).
+    """
+    root = _parse_spans(xml_path, spans)
+    if section == "spots":
+        return _spot_columns(root, spot_features)
+    return _edge_columns(root, edge_features, track_features)
+
+def parse_settings(xml_path: Path, start: int, end: int) -> ET.Element:
+    """The elements after <Model> (settings range of `plan_chunks`) under one root."""
+    return _parse_spans(xml_path, [(start, end)] if end > start else [])
+
+def merge_chunks(chunks: Sequence[Chunk], parts: Sequence[Columns],
+                 spot_features: Sequence[str] = (), edge_features: Sequence[str] = (),
+                 track_features: Sequence[str] = ()) -> Tuple[Columns, Columns]:
+    """Concatenate the column arrays of all parsed ranges → (spots, edges)."""
+    empty = ET.Element("chunk")
+    out = []
+    for section, template in (("spots", _spot_columns(empty, spot_features)),
+                              ("tracks", _edge_columns(empty, edge_features, track_features))):
+        mine = [p for (s, _), p in zip(chunks, parts) if s == section]
+        out.append({key: np.concatenate([p[key] for p in mine]) if mine else col
+                    for key, col in template.items()})
+    return out[0], out[1]
+
+def read_trackmate_xml(xml_path: Path, spot_features: Sequence[str] = (),
+                       edge_features: Sequence[str] = (), track_features: Sequence[str] = (),
+                       n_workers: int = 1, all_tracks: bool = False
+                       ) -> Tuple[Columns, Columns, ET.Element]:
+    """
+    Read spots, edges and settings of a TrackMate XML → (spots, edges, settings).
+
+    With ``n_workers > 1`` the chunks are parsed in a process pool;
+    `all_tracks` is passed on to `plan_chunks`.
+    """
+    features = (list(spot_features), list(edge_features), list(track_features))
+    chunks, settings = plan_chunks(xml_path, n_workers, all_tracks)
+    if n_workers > 1 and len(chunks) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            parts = list(pool.map(parse_chunk, *zip(*[(xml_path, *c, *features)
+                                                      for c in chunks])))
+    else:
+        parts = [parse_chunk(xml_path, *c, *features) for c in chunks]
+    spots, edges = merge_chunks(chunks, parts, *features)
+    return spots, edges, parse_settings(xml_path, *settings)
@@ -1,9 +1,17 @@
 """
 GUI module for TrackMate SPT Analyzer.
 
-Contains the main GUI application and related components.
+Contains the main GUI application and related components. tkinter is only
+imported once the application class is accessed.
 """
 
-from .app import TrackMateSPTAnalyzer
+import importlib
 
-__all__ = ["TrackMateSPTAnalyzer"] 
\ No newline at end of file
+__all__ = ["TrackMateSPTAnalyzer"]
+
+def __getattr__(name):
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(".app", __name__), name)
+    globals()[name] = value
+    return value
@@ -9,16 +9,29 @@ import sys
 import threading
 import queue
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Union
 from datetime import datetime
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from tkinter import font as tkfont
 
-from ..core.analysis import parse_trackmate_xml, msd_per_track, rolling_window_analysis
-from ..core.utils import build_readme_text, qc_report_html, save_with_suffix
-import pandas as pd
+from ..core.scheduler import run_files
+from ..core.pipeline import file_summary
+from ..core.outputs import RunOutputs
+from ..core.watch import watch_folder
+from ..core.utils import iter_xml_files, estimate_spot_count
+from ..core.bins import STATES
+
+# "MSD Lags" choices → lag_policy of core.analysis.track_statistics
+LAG_CHOICES = {"All (N − 1)": "all", "First 25 % of N": "fraction", "Optimal (Michalet)": "optimal"}
+
+def _parse_lengths(text: str) -> Union[int, List[int]]:
+    """Frame count(s) from an entry: "5" → 5, "5, 7, 10" → [5, 7, 10]."""
+    values = [int(v) for v in text.replace(",", " ").split()]
+    if not values:
+        raise ValueError("empty entry")
+    return values[0] if len(values) == 1 else values
 
 class TrackMateSPTAnalyzer:
     """Main GUI application for TrackMate SPT analysis."""
@@ -30,8 +43,11 @@ class TrackMateSPTAnalyzer:
         
         # Data storage
         self.xml_files = []
+        self.spot_estimates = {}
+        self.scan_id = 0
         self.warnings = []
         self.analysis_queue = queue.Queue()
+        self.cancel_event = threading.Event()
         
         # Configure style
         self.setup_styles()
@@ -120,6 +136,11 @@ class TrackMateSPTAnalyzer:
         self.scan_button = ttk.Button(parent, text="Scan for XML Files", 
                                      command=self.scan_folder)
         self.scan_button.grid(row=3, column=1, sticky=tk.W, pady=(5, 0))
+        
+        self.recursive_var = tk.BooleanVar(value=False)
+        self.recursive_check = ttk.Checkbutton(parent, text="Include subfolders",
+                                               variable=self.recursive_var)
+        self.recursive_check.grid(row=3, column=2, sticky=tk.W, pady=(5, 0))
     
     def create_parameters_section(self, parent):
         """Create analysis parameters widgets."""
@@ -155,16 +176,64 @@ class TrackMateSPTAnalyzer:
         self.alpha_high_entry = ttk.Entry(param_frame, textvariable=self.alpha_high_var, width=10)
         self.alpha_high_entry.grid(row=1, column=3, sticky=tk.W, padx=(5, 0), pady=(10, 0))
         
+        # Time bins
+        ttk.Label(param_frame, text="Time Bin (s):").grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
+        self.bin_var = tk.StringVar(value="30")
+        self.bin_entry = ttk.Entry(param_frame, textvariable=self.bin_var, width=10)
+        self.bin_entry.grid(row=2, column=1, sticky=tk.W, padx=(5, 20), pady=(10, 0))
+        
+        ttk.Label(param_frame, text="Worker Processes:").grid(row=2, column=2, sticky=tk.W, pady=(10, 0))
+        self.workers_var = tk.StringVar(value="1")
+        self.workers_entry = ttk.Entry(param_frame, textvariable=self.workers_var, width=10)
+        self.workers_entry.grid(row=2, column=3, sticky=tk.W, padx=(5, 0), pady=(10, 0))
+        
+        # MSD lags
+        ttk.Label(param_frame, text="MSD Lags:").grid(row=3, column=0, sticky=tk.W, pady=(10, 0))
+        self.lag_policy_var = tk.StringVar(value=next(iter(LAG_CHOICES)))
+        self.lag_policy_combo = ttk.Combobox(param_frame, textvariable=self.lag_policy_var,
+                                             values=list(LAG_CHOICES), state="readonly", width=18)
+        self.lag_policy_combo.grid(row=3, column=1, sticky=tk.W, padx=(5, 20), pady=(10, 0))
+        
+        ttk.Label(param_frame, text="Loc. Error (µm):").grid(row=3, column=2, sticky=tk.W, pady=(10, 0))
+        self.loc_error_var = tk.StringVar(value="")
+        self.loc_error_entry = ttk.Entry(param_frame, textvariable=self.loc_error_var, width=10)
+        self.loc_error_entry.grid(row=3, column=3, sticky=tk.W, padx=(5, 0), pady=(10, 0))
+        
         # Checkboxes
         self.intensity_var = tk.BooleanVar(value=True)
         self.intensity_check = ttk.Checkbutton(param_frame, text="Include Intensity Metrics", 
                                               variable=self.intensity_var)
-        self.intensity_check.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        self.intensity_check.grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
         
         self.merge_windows_var = tk.BooleanVar(value=False)
         self.merge_windows_check = ttk.Checkbutton(param_frame, text="Merge Window Tables", 
                                                   variable=self.merge_windows_var)
-        self.merge_windows_check.grid(row=2, column=2, columnspan=2, sticky=tk.W, pady=(10, 0))
+        self.merge_windows_check.grid(row=4, column=2, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        self.bootstrap_var = tk.BooleanVar(value=False)
+        self.bootstrap_check = ttk.Checkbutton(param_frame, text="Bootstrap CIs for D and α",
+                                              variable=self.bootstrap_var)
+        self.bootstrap_check.grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        self.histograms_var = tk.BooleanVar(value=False)
+        self.histograms_check = ttk.Checkbutton(param_frame, text="Step-Length / van Hove Histograms",
+                                               variable=self.histograms_var)
+        self.histograms_check.grid(row=5, column=2, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        self.spatial_var = tk.BooleanVar(value=False)
+        self.spatial_check = ttk.Checkbutton(param_frame, text="Neighbour / Density Features (1 µm)",
+                                            variable=self.spatial_var)
+        self.spatial_check.grid(row=6, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        self.trackmate_features_var = tk.BooleanVar(value=False)
+        self.trackmate_features_check = ttk.Checkbutton(param_frame, text="Use TrackMate Speeds / Distance",
+                                                       variable=self.trackmate_features_var)
+        self.trackmate_features_check.grid(row=6, column=2, columnspan=2, sticky=tk.W, pady=(5, 0))
+        
+        self.all_tracks_var = tk.BooleanVar(value=False)
+        self.all_tracks_check = ttk.Checkbutton(param_frame, text="Include Tracks Removed by TrackMate Filters",
+                                               variable=self.all_tracks_var)
+        self.all_tracks_check.grid(row=7, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
     
     def create_control_buttons(self, parent):
         """Create control buttons."""
@@ -177,6 +246,13 @@ class TrackMateSPTAnalyzer:
         self.run_button = ttk.Button(button_frame, text="Run Analysis", 
                                    command=self.run_analysis, style="Success.TButton")
         self.run_button.pack(side=tk.LEFT)
+        
+        self.watch_button = ttk.Button(button_frame, text="Watch Folder", command=self.start_watch)
+        self.watch_button.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_analysis,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
     
     def create_progress_section(self, parent):
         """Create progress bar."""
@@ -215,27 +291,45 @@ class TrackMateSPTAnalyzer:
             self.scan_folder()
     
     def scan_folder(self):
-        """Scan selected folder for XML files."""
+        """Scan selected folder for XML files in a background thread."""
         folder = self.folder_var.get()
         if not folder:
             messagebox.showwarning("Warning", "Please select a folder first.")
             return
         
-        folder_path = Path(folder)
-        xml_files = sorted(folder_path.glob("*.xml"))
-        self.xml_files = xml_files
-        
+        # A newer scan supersedes any scan still running
+        self.scan_id += 1
+        self.xml_files = []
+        self.spot_estimates = {}
+        self.run_button.config(state=tk.DISABLED)
         self.output_text.delete(1.0, tk.END)
-        if not xml_files:
-            self.output_text.insert(tk.END, "No *.xml files found in the selected folder.\n")
-        else:
-            self.output_text.insert(tk.END, f"Found {len(xml_files)} XML files:\n")
-            for xml_file in xml_files[:10]:
-                self.output_text.insert(tk.END, f" • {xml_file.name}\n")
-            if len(xml_files) > 10:
-                self.output_text.insert(tk.END, " ...\n")
-        
-        self.status_var.set(f"Found {len(xml_files)} XML files")
+        self.status_var.set("Scanning for XML files...")
+        
+        scan_thread = threading.Thread(target=self._scan_folder_thread,
+                                       args=(self.scan_id, Path(folder), self.recursive_var.get()))
+        scan_thread.daemon = True
+        scan_thread.start()
+    
+    def _scan_folder_thread(self, scan_id: int, folder_path: Path, recursive: bool):
+        """Stream found XML files + their spot count estimate to the GUI."""
+        try:
+            for xml_file in iter_xml_files(folder_path, recursive):
+                if scan_id != self.scan_id:
+                    return
+                try:
+                    n_spots = estimate_spot_count(xml_file)
+                except OSError:
+                    n_spots = None
+                self.analysis_queue.put(("scan_file", scan_id, xml_file, n_spots))
+        except OSError as e:
+            self.warnings.append(f"Scanning {folder_path} failed: {e}")
+        self.analysis_queue.put(("scan_done", scan_id))
+    
+    def _file_weights(self) -> List[float]:
+        """Estimated spots per file; unknown files get the mean of the known ones."""
+        known = [n for n in self.spot_estimates.values() if n]
+        fallback = sum(known) / len(known) if known else 1.0
+        return [float(self.spot_estimates.get(f) or fallback) for f in self.xml_files]
     
     def show_help(self):
         """Show help dialog with metric explanations."""
@@ -254,7 +348,9 @@ Metric Glossary
 • Intensity – TrackMate MEAN_INTENSITY averaged over the track
 
 Sliding-window MSD uses the same α-classification inside each window
-to label static / diffusive / active segments.
+to label static / diffusive / active segments. Several window lengths
+(e.g. "5, 7, 10, 15") are compared in one run; bins and the summary use
+the first one.
         """
         
         help_window = tk.Toplevel(self.root)
@@ -266,162 +362,277 @@ to label static / diffusive / active segments.
         text_widget.insert(1.0, help_text.strip())
         text_widget.config(state=tk.DISABLED)
     
-    def run_analysis(self):
-        """Start the analysis in a separate thread."""
-        if not self.xml_files:
-            messagebox.showwarning("Warning", "No XML files found. Please scan a folder first.")
-            return
-        
-        # Validate parameters
+    def _read_parameters(self) -> Optional[tuple]:
+        """Validated (window, step, alpha_low, alpha_high, bin_s, n_workers, lags), or None after an error dialog."""
         try:
-            window = int(self.window_var.get())
-            step = int(self.step_var.get())
+            window = _parse_lengths(self.window_var.get())
+            step = _parse_lengths(self.step_var.get())
             alpha_low = float(self.alpha_low_var.get())
             alpha_high = float(self.alpha_high_var.get())
+            bin_s = float(self.bin_var.get())
+            n_workers = int(self.workers_var.get())
+            loc_error = float(self.loc_error_var.get()) if self.loc_error_var.get().strip() else None
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric parameters.")
-            return
-        
-        # Disable controls during analysis
+            return None
+        if bin_s <= 0:
+            messagebox.showerror("Error", "Time bin must be positive.")
+            return None
+        n_windows = len(window) if isinstance(window, list) else 1
+        if isinstance(step, list) and len(step) != n_windows:
+            messagebox.showerror("Error", "Give one step size, or one per window length.")
+            return None
+        if loc_error is not None and loc_error < 0:
+            messagebox.showerror("Error", "Localisation error must not be negative.")
+            return None
+        lags = dict(lag_policy=LAG_CHOICES[self.lag_policy_var.get()], loc_error=loc_error)
+        n_workers = max(1, min(n_workers, os.cpu_count() or 1))
+        return window, step, alpha_low, alpha_high, bin_s, n_workers, lags
+    
+    def _analysis_params(self, window, step, alpha_low: float, alpha_high: float,
+                         lags: Optional[dict] = None) -> dict:
+        """`analyse_dataframe` params from the entries and checkboxes."""
+        return dict(window=window, step=step, alpha_low=alpha_low,
+                    alpha_high=alpha_high, intensity=self.intensity_var.get(),
+                    bootstrap=1000 if self.bootstrap_var.get() else 0,
+                    histograms=self.histograms_var.get(), spatial=self.spatial_var.get(),
+                    trackmate_features=self.trackmate_features_var.get(),
+                    all_tracks=self.all_tracks_var.get(), **(lags or {}))
+    
+    def _disable_controls(self):
+        """Disable controls while an analysis or watch runs."""
         self.run_button.config(state=tk.DISABLED)
+        self.watch_button.config(state=tk.DISABLED)
         self.scan_button.config(state=tk.DISABLED)
         self.browse_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.cancel_event.clear()
+    
+    def run_analysis(self):
+        """Start the analysis in a separate thread."""
+        if not self.xml_files:
+            messagebox.showwarning("Warning", "No XML files found. Please scan a folder first.")
+            return
+        args = self._read_parameters()
+        if args is None:
+            return
+        
+        # Disable controls during analysis
+        self._disable_controls()
+        self.output_text.insert(tk.END, "\nPer-file results:\n")
         
         # Start analysis thread
-        analysis_thread = threading.Thread(target=self._run_analysis_thread,
-                                         args=(window, step, alpha_low, alpha_high))
+        analysis_thread = threading.Thread(target=self._run_analysis_thread, args=args)
         analysis_thread.daemon = True
         analysis_thread.start()
     
-    def _run_analysis_thread(self, window: int, step: int, alpha_low: float, alpha_high: float):
-        """Run analysis in background thread."""
+    def start_watch(self):
+        """Analyse XML files in the folder as they are written, until cancelled."""
+        folder = self.folder_var.get()
+        if not folder:
+            messagebox.showwarning("Warning", "Please select a folder first.")
+            return
+        args = self._read_parameters()
+        if args is None:
+            return
+        
+        self._disable_controls()
+        self.progress_bar.config(mode="indeterminate")
+        self.progress_bar.start()
+        self.output_text.insert(tk.END, f"\nWatching {folder} for new or changed XML files "
+                                        f"(Cancel to stop):\n")
+        
+        watch_thread = threading.Thread(target=self._watch_folder_thread,
+                                        args=(Path(folder), *args))
+        watch_thread.daemon = True
+        watch_thread.start()
+    
+    def cancel_analysis(self):
+        """Ask the running analysis to stop after the files / track chunks in progress."""
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_var.set("Cancelling... waiting for running files / track chunks to finish")
+        self.status_var.set("Cancelling...")
+    
+    def _run_analysis_thread(self, window: Union[int, List[int]], step: Union[int, List[int]],
+                             alpha_low: float, alpha_high: float,
+                             bin_s: float, n_workers: int = 1, lags: Optional[dict] = None):
+        """Run analysis in background thread (files in a process pool if n_workers > 1)."""
         try:
-            # Get parameters
-            use_intensity = self.intensity_var.get()
-            merge_windows = self.merge_windows_var.get()
-            
             # Create timestamped run directory
             timestamp = datetime.now().strftime("%Y%m%d-%H%M")
             src_folder = Path(self.folder_var.get())
             out_root = src_folder / "analysis" / f"run_{timestamp}"
+            merge_windows = self.merge_windows_var.get()
+            params = self._analysis_params(window, step, alpha_low, alpha_high, lags)
             
-            # Create subdirectories
-            for sub in ["all_tracks", "bins", "windows", "qc_reports", "logs"]:
-                (out_root / sub).mkdir(parents=True, exist_ok=True)
-            
-            # Initialize data storage
-            summary_rows = []
-            summary_rows_windows = []
+            # Per-file outputs are written as files finish, pooled tables at the end
+            outputs = RunOutputs(out_root, params, bin_s, merge_windows=merge_windows)
             self.warnings = []
             
-            # Process each XML file
-            for i, xml_file in enumerate(self.xml_files):
+            # Progress and scheduling are measured in (estimated) spots rather than files
+            weights = self._file_weights()
+            total_work = sum(weights)
+            done_work = 0.0
+            
+            self.analysis_queue.put(("progress", 0.0, total_work,
+                                     f"Processing {len(self.xml_files)} files with {n_workers} worker(s)"))
+            
+            # Process each XML file; results arrive in file order (until cancelled)
+            n_done = 0
+            for i, xml_file, result in run_files(self.xml_files, params, n_workers, weights,
+                                                 cancel=self.cancel_event):
+                n_done += 1
                 # Update progress
-                self.analysis_queue.put(("progress", i + 1, len(self.xml_files), f"Processing {xml_file.name}"))
+                done_work += weights[i]
+                self.analysis_queue.put(("progress", done_work, total_work,
+                                         f"Processed {xml_file.name} ({n_done}/{len(self.xml_files)})"))
                 
-                try:
-                    df, meta = parse_trackmate_xml(xml_file)
-                except Exception as e:
-                    self.warnings.append(f"Failed to parse {xml_file.name}: {e}")
+                if isinstance(result, Exception):
+                    self.warnings.append(f"Failed to analyse {xml_file.name}: {result}")
                     continue
-                
-                # Perform analysis
-                per_track = msd_per_track(df, meta["dt"])
-                per_track["file"] = xml_file.name
-                
-                per_window = rolling_window_analysis(df, window, step, meta["dt"], (alpha_low, alpha_high))
-                per_window["file"] = xml_file.name
-                
-                # Save individual files
-                per_window.to_csv(
-                    save_with_suffix(out_root / "windows" / f"{xml_file.stem}__windows.csv"),
-                    index=False)
-                
-                per_track.to_csv(
-                    save_with_suffix(out_root / "all_tracks" / f"{xml_file.stem}__tracks.csv"),
-                    index=False)
-                
-                if use_intensity and df["intensity"].notna().any():
-                    inten_stats = (df.groupby("track_id")["intensity"]
-                                     .agg(["mean", "max", "std"])
-                                     .reset_index())
-                    inten_stats.to_csv(
-                        save_with_suffix(out_root / "all_tracks" / f"{xml_file.stem}__intensity.csv"),
-                        index=False)
-                
-                # Collect for summary
-                pt = per_track.assign(pixel=meta["pixel_size"], dt=meta["dt"])
-                cols = ["file"] + [c for c in pt.columns if c != "file"]
-                summary_rows.append(pt[cols])
-                
-                if merge_windows:
-                    summary_rows_windows.append(per_window)
+                tables, meta = result
+                self.analysis_queue.put(("file_done", xml_file.name, file_summary(tables)))
+                self.warnings.extend(outputs.add_file(xml_file, tables, meta))
             
-            # Create summary files
-            if summary_rows:
-                summary_all = pd.concat(summary_rows, ignore_index=True)
-                summary_all.to_csv(save_with_suffix(out_root / "summary_all.csv"), index=False)
-                
-                if merge_windows and summary_rows_windows:
-                    windows_all = pd.concat(summary_rows_windows, ignore_index=True)
-                    windows_all.to_csv(save_with_suffix(out_root / "windows_all.csv"), index=False)
-                
-                # Generate QC report
-                qc_html = qc_report_html(summary_all, meta, self.warnings)
-                (save_with_suffix(out_root / "qc_reports" / "QC_report.html")).write_text(qc_html, encoding="utf8")
-                
-                # Save README
-                readme_path = save_with_suffix(out_root / "summary_README.txt")
-                readme_path.write_text(build_readme_text(), encoding="utf8")
+            cancelled = self.cancel_event.is_set()
+            if cancelled:
+                self.warnings.append(f"Run cancelled: {n_done} of {len(self.xml_files)} files analysed; "
+                                     f"summary tables are partial")
+            
+            # Create summary files (from the files finished so far if cancelled)
+            outputs.write_summaries(self.warnings)
             
             # Signal completion
-            self.analysis_queue.put(("complete", out_root))
+            self.analysis_queue.put(("cancelled" if cancelled else "complete", out_root))
             
         except Exception as e:
             self.analysis_queue.put(("error", str(e)))
     
+    def _watch_folder_thread(self, folder: Path, window: Union[int, List[int]],
+                             step: Union[int, List[int]], alpha_low: float, alpha_high: float,
+                             bin_s: float, n_workers: int = 1, lags: Optional[dict] = None):
+        """Watch-folder mode in a background thread; outputs are refreshed after every new file."""
+        def report(xml_file, result):
+            if isinstance(result, Exception):
+                self.analysis_queue.put(("watch_failed", xml_file.name, str(result)))
+            else:
+                self.analysis_queue.put(("file_done", xml_file.name, file_summary(result[0])))
+        
+        try:
+            self.warnings = []
+            out_root = folder / "analysis" / f"watch_{datetime.now().strftime('%Y%m%d-%H%M')}"
+            params = self._analysis_params(window, step, alpha_low, alpha_high, lags)
+            self.analysis_queue.put(("watch_started", out_root))
+            watch_folder(folder, params, out_root, bin_s, n_workers, self.recursive_var.get(),
+                         merge_windows=self.merge_windows_var.get(), stop=self.cancel_event,
+                         on_file=report)
+            self.analysis_queue.put(("watch_stopped", out_root))
+        except Exception as e:
+            self.analysis_queue.put(("error", str(e)))
+    
     def process_messages(self):
         """Process messages from the analysis thread."""
         try:
             while True:
                 msg_type, *args = self.analysis_queue.get_nowait()
                 
-                if msg_type == "progress":
+                if msg_type == "scan_file":
+                    scan_id, xml_file, n_spots = args
+                    if scan_id != self.scan_id:
+                        continue
+                    self.xml_files.append(xml_file)
+                    self.spot_estimates[xml_file] = n_spots
+                    spots = f"~{n_spots:,} spots" if n_spots is not None else "spot count unknown"
+                    self.output_text.insert(tk.END, f" • {xml_file.name} ({spots})\n")
+                    self.status_var.set(f"Scanning... found {len(self.xml_files)} XML files")
+                
+                elif msg_type == "scan_done":
+                    if args[0] != self.scan_id:
+                        continue
+                    self.run_button.config(state=tk.NORMAL)
+                    if not self.xml_files:
+                        self.output_text.insert(tk.END, "No *.xml files found in the selected folder.\n")
+                    total = sum(n for n in self.spot_estimates.values() if n)
+                    self.status_var.set(f"Found {len(self.xml_files)} XML files (~{total:,} spots)")
+                
+                elif msg_type == "progress":
                     current, total, description = args
                     self.progress_bar["maximum"] = total
                     self.progress_bar["value"] = current
                     self.progress_var.set(description)
-                    self.status_var.set(f"Processing: {current}/{total}")
+                    self.status_var.set(f"Processed ~{int(current):,}/{int(total):,} spots")
+                
+                elif msg_type == "file_done":
+                    name, s = args
+                    fractions = ", ".join(f"{state} {s['frac_' + state]:.0%}" for state in STATES)
+                    self.output_text.insert(tk.END, f" • {name}: {s['n_tracks']} tracks, "
+                                                    f"D̄ = {s['D_mean']:.4g}, ᾱ = {s['alpha_mean']:.2f} "
+                                                    f"({fractions})\n")
+                    self.output_text.see(tk.END)
                 
-                elif msg_type == "complete":
+                elif msg_type in ("complete", "cancelled"):
                     out_root = args[0]
-                    self.progress_bar["value"] = self.progress_bar["maximum"]
-                    self.progress_var.set("Analysis Complete")
-                    self.status_var.set("Analysis finished successfully")
+                    cancelled = msg_type == "cancelled"
+                    if not cancelled:
+                        self.progress_bar["value"] = self.progress_bar["maximum"]
+                    self.progress_var.set("Analysis Cancelled" if cancelled else "Analysis Complete")
+                    self.status_var.set("Analysis cancelled, partial results saved" if cancelled
+                                        else "Analysis finished successfully")
                     
                     # Re-enable controls
                     self.run_button.config(state=tk.NORMAL)
+                    self.watch_button.config(state=tk.NORMAL)
                     self.scan_button.config(state=tk.NORMAL)
                     self.browse_button.config(state=tk.NORMAL)
+                    self.cancel_button.config(state=tk.DISABLED)
                     
                     # Show completion message
-                    self.output_text.insert(tk.END, f"\nAnalysis finished. Outputs in: {out_root.resolve()}\n")
+                    self.output_text.insert(tk.END, f"\nAnalysis {'cancelled' if cancelled else 'finished'}. "
+                                                    f"Outputs in: {out_root.resolve()}\n")
                     if self.warnings:
                         self.output_text.insert(tk.END, "\nWarnings:\n")
                         for warning in self.warnings:
                             self.output_text.insert(tk.END, f" • {warning}\n")
                     
-                    messagebox.showinfo("Success", f"Analysis completed successfully!\nOutputs saved to: {out_root}")
+                    if not cancelled:
+                        messagebox.showinfo("Success", f"Analysis completed successfully!\nOutputs saved to: {out_root}")
+                
+                elif msg_type == "watch_started":
+                    self.progress_var.set("Watching folder...")
+                    self.status_var.set(f"Watching, outputs in {args[0]}")
+                
+                elif msg_type == "watch_failed":
+                    name, error_msg = args
+                    self.output_text.insert(tk.END, f" • {name}: failed ({error_msg})\n")
+                    self.output_text.see(tk.END)
+                
+                elif msg_type == "watch_stopped":
+                    out_root = args[0]
+                    self.progress_bar.stop()
+                    self.progress_bar.config(mode="determinate", value=0)
+                    self.progress_var.set("Watch stopped")
+                    self.status_var.set("Ready")
+                    self.run_button.config(state=tk.NORMAL if self.xml_files else tk.DISABLED)
+                    self.watch_button.config(state=tk.NORMAL)
+                    self.scan_button.config(state=tk.NORMAL)
+                    self.browse_button.config(state=tk.NORMAL)
+                    self.cancel_button.config(state=tk.DISABLED)
+                    self.output_text.insert(tk.END, f"\nWatch stopped. Outputs in: {out_root.resolve()}\n")
                 
                 elif msg_type == "error":
                     error_msg = args[0]
+                    self.progress_bar.stop()
+                    self.progress_bar.config(mode="determinate")
                     self.progress_var.set("Error occurred")
                     self.status_var.set("Analysis failed")
                     
                     # Re-enable controls
                     self.run_button.config(state=tk.NORMAL)
+                    self.watch_button.config(state=tk.NORMAL)
                     self.scan_button.config(state=tk.NORMAL)
                     self.browse_button.config(state=tk.NORMAL)
+                    self.cancel_button.config(state=tk.DISABLED)
                     
                     messagebox.showerror("Error", f"Analysis failed: {error_msg}")
         
@@ -4,21 +4,61 @@ from fiji.plugin.trackmate import Logger
 from fiji.plugin.trackmate import Settings
 from fiji.plugin.trackmate import SelectionModel
 import fiji.plugin.trackmate.features.FeatureFilter as FeatureFilter
-from ij.io import DirectoryChooser
+from fiji.util.gui import GenericDialogPlus
 from java.io import File
+from array import array
+import csv
 import sys
 from os import listdir
 from os.path import isfile, join, splitext
 
-# Open interactive DirectoryChooser window
-dc = DirectoryChooser("Choose a directory")
+###################################
+# Write custom spot analysis here #
+###################################
+# The 'analyse_spots()' function  #
+# is the entry point for custom   #
+# spot analysis. It is invoked    #
+# once per XML file with all of   #
+# the file's spots as arrays:     #
+#  features  - dict: feature name #
+#              -> array of values #
+#  frames    - array of frames    #
+#  track_ids - array of track IDs #
+#              (-1 = no track)    #
+# Entry i of every array belongs  #
+# to the same spot. It must return#
+# a dict: column name -> list of  #
+# values, which is saved as CSV.  #
+# A script selected in the dialog #
+# that defines 'analyse_spots()'  #
+# replaces this one.              #
+
+def analyse_spots(features, frames, track_ids):
+	# Example analysis (mean intensity per track), replace it with your own algorithm.
+	intensity = features.get("MEAN_INTENSITY_CH1", array('d'))
+	sums = {}
+	counts = {}
+	for i in range(len(intensity)):
+		track_id = track_ids[i]
+		sums[track_id] = sums.get(track_id, 0.0) + intensity[i]
+		counts[track_id] = counts.get(track_id, 0) + 1
+	ids = sorted(sums.keys())
+	return {
+		"track_id": ids,
+		"mean_intensity": [sums[track_id] / counts[track_id] for track_id in ids],
+	}
+
+###################################
+
+gui = GenericDialogPlus("Track Spotter For Directory")
+gui.addDirectoryField("Choose a directory", "")
+gui.addFileField("Custom analysis script (optional)", "")
+gui.addStringField("Add extension to result files", "_spot_analysis", 16)
+gui.showDialog()
 
 # Create logger to output things
 logger = Logger.IJ_LOGGER
 
-# read choosen directory path
-directory = dc.getDirectory()
-
 def isXMLFile(file):
 	"""
 	Checks whether a specific file is indeed a xml file
@@ -28,30 +68,78 @@ def isXMLFile(file):
 	filename, extension = splitext(file)
 	return extension == ".xml"
 
-def analyse_spots(spots):
-
-	#anzahl=spots.getNSpots(True)
-	# TODO Write algorithm to analyse spots here
-	result_string = ""
-	for spot in spots.iterable(True):
-		feature = str(spot.getFeature("MEAN_INTENSITY01"))
-		result_string = result_string + feature + ", "
-	logger.log(result_string)
-		
-
-# Creates a list of all xml files in the choosen directory
-xmls = [f for f in listdir(directory) if isXMLFile(join(directory, f))]
-
-# Expands all xml files to absolute path so that they can be opened
-xml_files = [join(directory, f) for f in xmls]
-
-# extract spots in each xml file in choosen directory and invokes 'analyse_spots' for each file
-for xml_file in xml_files:
-	logger.log("Currently analysed file: " + xml_file)
-	file = File(xml_file)
-	reader = TmXmlReader(file)
-	if not reader.isReadingOk():
-		continue
-	model = reader.getModel()
-	spots = model.getSpots()
-	analyse_spots(spots)
\ No newline at end of file
+def load_analysis(script):
+	"""
+	Returns the 'analyse_spots' function of a user script, or the one defined above
+	"""
+	if not script or not isfile(script):
+		return analyse_spots
+	namespace = {"__name__": "custom_analysis"}
+	execfile(script, namespace)
+	if "analyse_spots" not in namespace:
+		logger.log("No analyse_spots() in " + script + ", using the built-in one")
+		return analyse_spots
+	return namespace["analyse_spots"]
+
+def extract_spot_arrays(model):
+	"""
+	Extracts every visible spot of a model into one numeric array per feature,
+	plus arrays with each spot's frame and track ID.
+	"""
+	track_model = model.getTrackModel()
+	spot_track = {}
+	for track_id in track_model.trackIDs(True):
+		for spot in track_model.trackSpots(track_id):
+			spot_track[spot.ID()] = track_id
+
+	feature_names = [str(name) for name in model.getFeatureModel().getSpotFeatures()]
+	features = dict([(name, array('d')) for name in feature_names])
+	frames = array('i')
+	track_ids = array('i')
+	for spot in model.getSpots().iterable(True):
+		frames.append(int(spot.getFeature("FRAME")))
+		track_ids.append(spot_track.get(spot.ID(), -1))
+		for name in feature_names:
+			value = spot.getFeature(name)
+			features[name].append(float("nan") if value is None else float(value))
+	return features, frames, track_ids
+
+def save_results(results, output_file):
+	"""
+	Writes the dict of equally long columns returned by analyse_spots() as CSV
+	"""
+	columns = list(results.keys())
+	handle = open(output_file, "wb")
+	try:
+		writer = csv.writer(handle)
+		writer.writerow(columns)
+		for row in zip(*[results[column] for column in columns]):
+			writer.writerow(row)
+	finally:
+		handle.close()
+
+if gui.wasOKed():
+	# read choosen directory path
+	directory = gui.getNextString()
+	analysis = load_analysis(gui.getNextString())
+	output_extension = gui.getNextString()
+
+	# Creates a list of all xml files in the choosen directory
+	xmls = [f for f in listdir(directory) if isXMLFile(join(directory, f))]
+
+	# Expands all xml files to absolute path so that they can be opened
+	xml_files = [join(directory, f) for f in xmls]
+
+	# extract spots in each xml file in choosen directory and invokes the analysis for each file
+	for xml_file in xml_files:
+		logger.log("Currently analysed file: " + xml_file)
+		file = File(xml_file)
+		reader = TmXmlReader(file)
+		if not reader.isReadingOk():
+			continue
+		model = reader.getModel()
+		features, frames, track_ids = extract_spot_arrays(model)
+		results = analysis(features, frames, track_ids)
+		output_file = splitext(xml_file)[0] + output_extension + ".csv"
+		save_results(results, output_file)
+		logger.log("Saved results to " + output_file)